@@ -1,23 +1,69 @@
-from typing import Any, List
-from pydantic import BaseModel
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+from pydantic import BaseModel, ValidationError
 from dotenv import load_dotenv
-from fastapi import FastAPI, File, Request as FastAPIRequest, UploadFile
-from fastapi.responses import StreamingResponse
+from fastapi import (
+    Depends,
+    FastAPI,
+    File,
+    HTTPException,
+    Request as FastAPIRequest,
+    UploadFile,
+    WebSocket,
+    WebSocketDisconnect,
+)
+from fastapi.responses import JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
-from slowapi import Limiter, _rate_limit_exceeded_handler
+from slowapi import Limiter
 from slowapi.util import get_remote_address
-from slowapi.errors import RateLimitExceeded
 from openai import OpenAI
+from limits import parse_many
+from starlette.concurrency import run_in_threadpool
 from io import BytesIO
+import asyncio
 import base64
 import csv
+import functools
+import json
 import os
+import time
+import traceback
+import uuid
 
 from google import genai
 from google.genai import types
 
-from .utils.stream import stream_text
+from .utils.stream import resolve_tool_calls, stream_text
 from .utils.gemini import convert_openai_to_gemini, stream_gemini
+from .utils.extract import CoordinateExtractor, VerdictExtractor
+from .utils.images import image_from_data_url, last_image_size, to_openai_messages
+from .utils.singleflight import SingleFlight, request_key
+from .utils.speculation import SpeculativeSteps
+from .utils.tracing import TracingMiddleware, traced_frames
+from .utils.concurrency import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    ConcurrencyLimitExceeded,
+    AdaptiveLimiter,
+    is_overload_error,
+    provider_limiter,
+    server_workers,
+)
+from .utils.retry import RetryingStream
+from .utils.memory import MemorySamplingMiddleware, StreamedBodyClient
+from .utils.metrics import metrics
+from .utils.admin import require_admin
+from .utils.profiling import (
+    ProfilingMiddleware,
+    cpu_accounted,
+    cpu_accounted_call,
+    profiles,
+)
+from .utils.sessions import CheckSession, TTLStore
+from .utils.diff_crop import crop_changed_regions, diff_crop_enabled
+from .utils.pdf import extract_pdf_pages
+from .utils.ratelimit import RateLimitMiddleware, first_exceeded
+from .utils.transport import read_body
+from .utils.xlsx import preview_xlsx
 
 # Monkeypatch ThinkingConfig to allow extra fields like thinking_level
 types.ThinkingConfig.model_config["extra"] = "allow"
@@ -25,31 +71,95 @@ types.ThinkingConfig.model_rebuild(force=True)
 
 load_dotenv(".env.local")
 
-limiter = Limiter(key_func=get_remote_address)
+# Counters live in process memory unless RATELIMIT_STORAGE_URI points at a
+# shared store (e.g. redis://). In memory, every worker applies the full
+# limits on its own, so a node with N workers allows up to N times as much.
+limiter = Limiter(
+    key_func=get_remote_address,
+    storage_uri=os.environ.get("RATELIMIT_STORAGE_URI", "memory://"),
+)
 app = FastAPI()
-app.state.limiter = limiter
-app.add_exception_handler(RateLimitExceeded, _rate_limit_exceeded_handler)
+single_flight = SingleFlight()
+# Only one worker can reliably claim what it speculated; see SpeculativeSteps.
+speculative_steps = SpeculativeSteps(
+    ttl=int(os.environ.get("STEP_SPECULATION_TTL_SECONDS", "30")),
+    enabled=server_workers() == 1,
+)
+
+
+async def _concurrency_limit_exceeded_handler(
+    request: FastAPIRequest, exc: ConcurrencyLimitExceeded
+) -> JSONResponse:
+    return JSONResponse(
+        {"error": f"Provider is busy, retry in {exc.retry_after}s"},
+        status_code=503,
+        headers={"Retry-After": str(exc.retry_after)},
+    )
+
+
+app.add_exception_handler(ConcurrencyLimitExceeded, _concurrency_limit_exceeded_handler)
 
 is_production = (
     os.getenv("RAILWAY_ENVIRONMENT_NAME") == "production"
     or os.getenv("VERCEL_ENV") == "production"
 )
 
+allowed_origins = ["https://screen.vision", "https://www.screen.vision"]
+
+# Shared by /api/check and its socket, so switching transport gains nothing.
+CHECK_RATE_LIMIT = "30/minute;500/hour"
+# "on" or "off" on every check response; see SpeculativeSteps.
+SPECULATION_HEADER = "X-Step-Speculation"
+
+# Added first so it runs inside CORS (429s keep their CORS headers) and
+# inside the request span.
+app.add_middleware(
+    RateLimitMiddleware,
+    limiter=limiter,
+    routes={
+        "/api/file-context": "20/minute;250/hour",
+        "/api/step": "20/minute;300/hour",
+        "/api/help": "8/minute;100/hour",
+        "/api/check": CHECK_RATE_LIMIT,
+        "/api/coordinates": "15/minute;200/hour",
+    },
+)
 app.add_middleware(
     CORSMiddleware,
-    allow_origins=["https://screen.vision", "https://www.screen.vision"]
-    if is_production
-    else ["*"],
+    allow_origins=allowed_origins if is_production else ["*"],
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=[SPECULATION_HEADER],
 )
+app.add_middleware(ProfilingMiddleware)
+app.add_middleware(MemorySamplingMiddleware)
+app.add_middleware(TracingMiddleware)
 
 
 class MessagesRequest(BaseModel):
     messages: List[Any]
 
 
+class StepRequest(MessagesRequest):
+    # Claims a step speculated by /api/check for this session, if any.
+    session: Optional[str] = None
+
+
+class SpeculateRequest(BaseModel):
+    session: str
+    # The system prompt the browser will send with its next /api/step call.
+    system: str
+
+
+class CheckRequest(MessagesRequest):
+    # Opt-in: emit a data-verdict event and cut the generation short.
+    verdict: bool = False
+    verdict_grace_ms: Optional[int] = None
+    # Opt-in, needs `verdict`: start the next step as soon as the check passes.
+    speculate: Optional[SpeculateRequest] = None
+
+
 class FileContextItem(BaseModel):
     name: str
     size: int
@@ -86,12 +196,10 @@ def _analyze_csv_file(contents: bytes) -> str:
 
 
 def _analyze_pdf_file(contents: bytes) -> str:
-    from pypdf import PdfReader
-
-    reader = PdfReader(BytesIO(contents))
     pages = []
-    for index, page in enumerate(reader.pages[:25]):
-        page_text = page.extract_text() or ""
+    for index, (page_text, skipped) in enumerate(extract_pdf_pages(contents, 25)):
+        if skipped is not None:
+            page_text = f"[page skipped: {skipped}]"
         pages.append(f"Page {index + 1}:\n{page_text}")
     return _truncate_text("\n\n".join(pages))
 
@@ -104,7 +212,19 @@ def _analyze_docx_file(contents: bytes) -> str:
     return _truncate_text("\n".join(paragraphs))
 
 
-def _analyze_spreadsheet_file(contents: bytes) -> str:
+def _spreadsheet_lines(sheet_rows) -> List[str]:
+    snippets = []
+    for title, rows, truncated in sheet_rows:
+        snippets.append(f"Sheet: {title}")
+        for row in rows:
+            values = [str(cell) if cell is not None else "" for cell in row]
+            snippets.append(" | ".join(values))
+        if truncated:
+            snippets.append("...[truncated]")
+    return snippets
+
+
+def _openpyxl_spreadsheet_lines(contents: bytes) -> List[str]:
     from openpyxl import load_workbook
 
     workbook = load_workbook(BytesIO(contents), data_only=True, read_only=True)
@@ -122,18 +242,51 @@ def _analyze_spreadsheet_file(contents: bytes) -> str:
                 snippets.append(" | ".join(values))
                 row_count += 1
 
-        return _truncate_text("\n".join(snippets))
+        return snippets
     finally:
         workbook.close()
 
 
-def _analyze_image_file(contents: bytes, mime_type: str, filename: str) -> str:
+def _analyze_spreadsheet_file(contents: bytes) -> str:
+    try:
+        snippets = _spreadsheet_lines(preview_xlsx(contents))
+    except Exception:
+        traceback.print_exc()
+        snippets = _openpyxl_spreadsheet_lines(contents)
+    return _truncate_text("\n".join(snippets))
+
+
+def _downscale_image(contents: bytes, mime_type: str) -> Tuple[bytes, str]:
+    """Shrink an uploaded image before sending it for visual analysis."""
+    max_px = int(os.environ.get("FILE_CONTEXT_IMAGE_MAX_PX", "1280"))
+    try:
+        from PIL import Image
+
+        image = Image.open(BytesIO(contents))
+        if max(image.size) <= max_px:
+            return contents, mime_type
+        image.thumbnail((max_px, max_px))
+        buffer = BytesIO()
+        image.convert("RGB").save(buffer, format="JPEG", quality=85)
+        return buffer.getvalue(), "image/jpeg"
+    except Exception:
+        return contents, mime_type
+
+
+def _image_data_url(contents: bytes, mime_type: str) -> str:
+    contents, mime_type = _downscale_image(contents, mime_type)
+    return f"data:{mime_type};base64,{base64.b64encode(contents).decode('utf-8')}"
+
+
+def _analyze_image_file(
+    contents: bytes, mime_type: str, filename: str, client: Optional[OpenAI] = None
+) -> str:
     api_key = os.environ.get("OPENAI_API_KEY")
     if not api_key:
         return f"Image attached: {filename}. Set OPENAI_API_KEY for automated visual analysis."
 
-    client = OpenAI(api_key=api_key)
-    data_url = f"data:{mime_type};base64,{base64.b64encode(contents).decode('utf-8')}"
+    client = client or OpenAI(api_key=api_key)
+    data_url = _image_data_url(contents, mime_type)
 
     result = client.chat.completions.create(
         model="gpt-5-mini-2025-08-07",
@@ -156,6 +309,94 @@ def _analyze_image_file(contents: bytes, mime_type: str, filename: str) -> str:
     return _truncate_text(result.choices[0].message.content or "")
 
 
+def _analyze_image_batch(
+    client: OpenAI, images: List[Tuple[bytes, str, str]]
+) -> Dict[int, str]:
+    """Summarize several images in one call; returns summaries by batch position."""
+    content: List[Dict[str, Any]] = [
+        {"type": "text", "text": f"Analyze these {len(images)} images."}
+    ]
+    for number, (contents, mime_type, filename) in enumerate(images, start=1):
+        content.append({"type": "text", "text": f"Image {number}: {filename}"})
+        content.append(
+            {
+                "type": "image_url",
+                "image_url": {"url": _image_data_url(contents, mime_type)},
+            }
+        )
+
+    result = client.chat.completions.create(
+        model="gpt-5-mini-2025-08-07",
+        messages=[
+            {
+                "role": "system",
+                "content": (
+                    "Summarize each uploaded image for task guidance. Focus on actionable, concise details. "
+                    'Respond with JSON: {"images": [{"image": <image number>, "summary": "<summary>"}]}, '
+                    "one entry per image."
+                ),
+            },
+            {"role": "user", "content": content},
+        ],
+        response_format={"type": "json_object"},
+        reasoning_effort="minimal",
+    )
+
+    payload = json.loads(result.choices[0].message.content or "{}")
+    summaries = {}
+    for entry in payload.get("images", []):
+        number = entry.get("image")
+        summary = entry.get("summary")
+        if isinstance(number, int) and 1 <= number <= len(images) and summary:
+            summaries[number - 1] = _truncate_text(str(summary))
+    return summaries
+
+
+def _image_batch_size() -> int:
+    return max(1, int(os.environ.get("FILE_CONTEXT_IMAGE_BATCH_SIZE", "5")))
+
+
+def _analyze_image_files(
+    images: List[Tuple[bytes, str, str]], client: Optional[OpenAI] = None
+) -> List[str]:
+    """Summarize uploaded images in batched vision calls.
+
+    Images the batch response does not cover (or whose batch failed) fall back
+    to one call per image.
+    """
+    api_key = os.environ.get("OPENAI_API_KEY")
+    if not api_key:
+        return [_analyze_image_file(*image) for image in images]
+
+    client = client or OpenAI(api_key=api_key)
+    batch_size = _image_batch_size()
+    analyses: List[str] = []
+
+    for start in range(0, len(images), batch_size):
+        batch = images[start : start + batch_size]
+        try:
+            summaries = _analyze_image_batch(client, batch) if len(batch) > 1 else {}
+        except Exception:
+            traceback.print_exc()
+            summaries = {}
+
+        for position, (contents, mime_type, filename) in enumerate(batch):
+            if position in summaries:
+                analyses.append(summaries[position])
+                continue
+            try:
+                analyses.append(
+                    _analyze_image_file(contents, mime_type, filename, client)
+                )
+            except Exception as exc:
+                analyses.append(
+                    f"Attached file {filename} could not be fully analyzed. "
+                    f"Error: {str(exc)}"
+                )
+
+    return analyses
+
+
 def _analyze_uploaded_file(file: UploadFile, contents: bytes) -> str:
     mime_type = file.content_type or "application/octet-stream"
     filename = (file.filename or "uploaded-file").lower()
@@ -202,93 +443,334 @@ def _analyze_uploaded_file(file: UploadFile, contents: bytes) -> str:
     )
 
 
+def _analyze_files(uploads: List[Tuple[UploadFile, bytes]]) -> List[str]:
+    analyses = []
+    for file, contents in uploads:
+        try:
+            analyses.append(_analyze_uploaded_file(file, contents))
+        except Exception as exc:  # pragma: no cover - resilient per-file fallback
+            analyses.append(
+                f"Attached file {file.filename or 'uploaded-file'} could not be fully analyzed. "
+                f"Error: {str(exc)}"
+            )
+    return analyses
+
+
+def _file_context_jobs(
+    uploads: List[Tuple[UploadFile, bytes]],
+) -> List[Tuple[List[int], Callable[[], List[str]]]]:
+    """Split uploads into independent units of work.
+
+    Each job is `(upload indexes, fn)` where `fn()` returns one analysis per
+    index. Images are grouped into batches that share one vision call; every
+    other file is its own job.
+    """
+    jobs: List[Tuple[List[int], Callable[[], List[str]]]] = []
+    image_indexes = []
+    for index, (file, contents) in enumerate(uploads):
+        if (file.content_type or "").startswith("image/"):
+            image_indexes.append(index)
+        else:
+            jobs.append(
+                ([index], functools.partial(_analyze_files, [(file, contents)]))
+            )
+
+    api_key = os.environ.get("OPENAI_API_KEY")
+    client = OpenAI(api_key=api_key) if api_key and image_indexes else None
+    batch_size = _image_batch_size()
+    for start in range(0, len(image_indexes), batch_size):
+        indexes = image_indexes[start : start + batch_size]
+        images = [
+            (
+                uploads[index][1],
+                uploads[index][0].content_type,
+                uploads[index][0].filename or "image",
+            )
+            for index in indexes
+        ]
+        jobs.append((indexes, functools.partial(_analyze_image_files, images, client)))
+
+    return jobs
+
+
+def _file_context_item(
+    file: UploadFile, contents: bytes, analysis: str
+) -> FileContextItem:
+    return FileContextItem(
+        name=file.filename or "uploaded-file",
+        size=len(contents),
+        mime_type=file.content_type or "application/octet-stream",
+        analysis=analysis,
+    )
+
+
+def _wants_event_stream(request: FastAPIRequest, stream: bool) -> bool:
+    return stream or "text/event-stream" in request.headers.get("accept", "")
+
+
+async def _stream_file_context(
+    uploads: List[Tuple[UploadFile, bytes]],
+) -> AsyncIterator[str]:
+    """Emit one SSE event per analyzed file, in completion order.
+
+    A `progress` event is sent every FILE_CONTEXT_PROGRESS_MS while analyses
+    are still running, so clients can tell a slow extraction from a dead
+    connection.
+    """
+    interval = int(os.environ.get("FILE_CONTEXT_PROGRESS_MS", "2000")) / 1000
+    started = time.monotonic()
+    pending = {
+        asyncio.ensure_future(
+            asyncio.to_thread(cpu_accounted_call, "file-context", job)
+        ): indexes
+        for indexes, job in _file_context_jobs(uploads)
+    }
+    completed = 0
+
+    def frame(payload: Any) -> str:
+        return f"data: {json.dumps(payload)}\n\n"
+
+    try:
+        while pending:
+            done, _ = await asyncio.wait(
+                pending, timeout=interval, return_when=asyncio.FIRST_COMPLETED
+            )
+            for task in done:
+                indexes = pending.pop(task)
+                for index, analysis in zip(indexes, task.result()):
+                    file, contents = uploads[index]
+                    completed += 1
+                    yield frame(
+                        {
+                            "type": "file",
+                            "index": index,
+                            "file": _file_context_item(
+                                file, contents, analysis
+                            ).model_dump(),
+                        }
+                    )
+            if not done:
+                yield frame(
+                    {
+                        "type": "progress",
+                        "completed": completed,
+                        "total": len(uploads),
+                        "elapsedMs": int((time.monotonic() - started) * 1000),
+                    }
+                )
+        yield frame({"type": "done", "total": len(uploads)})
+    finally:
+        # The client went away; threads cannot be interrupted, but nothing
+        # waits on their results any more.
+        for task in pending:
+            task.cancel()
+    yield "data: [DONE]\n\n"
+
+
 @app.post("/api/file-context", response_model=FileContextResponse)
-@limiter.limit("20/minute;250/hour")
 async def analyze_file_context(
     request: FastAPIRequest,
     files: List[UploadFile] = File(...),
+    stream: bool = False,
 ):
-    analyzed_files: List[FileContextItem] = []
-
+    uploads = []
     for file in files:
         contents = await file.read()
         if len(contents) > 30 * 1024 * 1024:
             raise ValueError(f"File {file.filename} exceeds the 30MB limit")
+        uploads.append((file, contents))
 
-        try:
-            analysis = _analyze_uploaded_file(file, contents)
-        except Exception as exc:  # pragma: no cover - resilient per-file fallback
-            analysis = (
-                f"Attached file {file.filename or 'uploaded-file'} could not be fully analyzed. "
-                f"Error: {str(exc)}"
-            )
-
-        analyzed_files.append(
-            FileContextItem(
-                name=file.filename or "uploaded-file",
-                size=len(contents),
-                mime_type=file.content_type or "application/octet-stream",
-                analysis=analysis,
-            )
+    if _wants_event_stream(request, stream):
+        return StreamingResponse(
+            _stream_file_context(uploads), media_type="text/event-stream"
         )
 
-    return FileContextResponse(files=analyzed_files)
-
+    jobs = _file_context_jobs(uploads)
+    results = await asyncio.gather(
+        *(asyncio.to_thread(cpu_accounted_call, "file-context", job) for _, job in jobs)
+    )
+    analyses: Dict[int, str] = {}
+    for (indexes, _), result in zip(jobs, results):
+        analyses.update(zip(indexes, result))
+
+    return FileContextResponse(
+        files=[
+            _file_context_item(file, contents, analyses[index])
+            for index, (file, contents) in enumerate(uploads)
+        ]
+    )
 
-@app.post("/api/step")
-@limiter.limit("20/minute;300/hour")
-async def handle_step_chat(request: FastAPIRequest, body: MessagesRequest):
-    client = OpenAI()
 
-    stream = client.chat.completions.create(
-        messages=body.messages,
-        model="gpt-5-mini-2025-08-07",
-        stream=True,
-        reasoning_effort="low",
+async def _open_frames(
+    endpoint: str,
+    open_upstream,
+    format_stream,
+    limiter: AdaptiveLimiter,
+    priority: int,
+):
+    """Wait for a provider slot, open the upstream stream and return its SSE
+    frame iterator.
+
+    The stream is opened (with retries) up to its first chunk before
+    returning, so a provider that never answers raises here and the request
+    fails with an HTTP error the browser retries, not an empty 200 stream.
+    """
+    permit = await limiter.acquire(priority)
+    upstream = RetryingStream(open_upstream, endpoint, on_error=permit.note_error)
+    try:
+        await run_in_threadpool(upstream.open)
+    except BaseException as error:
+        permit.release(overloaded=is_overload_error(error))
+        raise
+    return resolve_tool_calls(
+        permit.wrap(traced_frames(cpu_accounted(endpoint, format_stream(upstream))))
     )
 
-    response = StreamingResponse(
-        stream_text(stream, {}),
+
+async def _coalesced_stream(
+    endpoint: str,
+    body: BaseModel,
+    open_upstream,
+    format_stream,
+    limiter: AdaptiveLimiter,
+    priority: int = PRIORITY_INTERACTIVE,
+) -> StreamingResponse:
+    """Serve a provider stream as SSE.
+
+    `open_upstream` opens the provider stream and is retried until the first
+    chunk arrives; `format_stream` turns the chunks into SSE frames.
+    Byte-identical concurrent requests share one upstream stream through the
+    single-flight layer, and only the request that opens it waits for a
+    provider slot.
+    """
+
+    async def open_limited_stream():
+        return await _open_frames(
+            endpoint, open_upstream, format_stream, limiter, priority
+        )
+
+    key = request_key(endpoint, body.model_dump())
+    frames = await single_flight.stream(key, open_limited_stream)
+
+    return StreamingResponse(
+        frames,
         media_type="text/event-stream",
     )
 
-    return response
 
+@app.get("/api/metrics", dependencies=[Depends(require_admin)])
+async def get_metrics():
+    metrics.gauge("check_session_bytes", check_sessions.bytes_held)
+    return metrics.snapshot()
 
-@app.post("/api/help")
-@limiter.limit("8/minute;100/hour")
-async def handle_help_chat(request: FastAPIRequest, body: MessagesRequest):
-    client = OpenAI()
 
-    stream = client.chat.completions.create(
-        messages=body.messages,
-        model="gpt-5-mini-2025-08-07",
-        stream=True,
-        reasoning_effort="low",
-    )
+@app.get("/api/admin/profiles", dependencies=[Depends(require_admin)])
+async def list_profiles():
+    profiles.sweep()
+    return {
+        "profiles": [
+            {"id": profile_id, "name": name, "samples": sum(profiler.samples.values())}
+            for profile_id, (_, (name, profiler)) in list(profiles.entries.items())
+        ]
+    }
 
-    response = StreamingResponse(
-        stream_text(stream, {}),
-        media_type="text/event-stream",
+
+@app.get("/api/admin/profiles/{profile_id}", dependencies=[Depends(require_admin)])
+async def get_profile(profile_id: str, format: str = "speedscope"):
+    entry = profiles.get(profile_id)
+    if entry is None:
+        raise HTTPException(status_code=404)
+    name, profiler = entry
+    if format == "collapsed":
+        return PlainTextResponse(profiler.collapsed())
+    return profiler.speedscope(name)
+
+
+def _step_upstream(messages: List[Any]):
+    def open_upstream():
+        client = OpenAI(max_retries=0, http_client=StreamedBodyClient())
+
+        return client.chat.completions.create(
+            messages=to_openai_messages(messages),
+            model="gpt-5-mini-2025-08-07",
+            stream=True,
+            reasoning_effort="low",
+        )
+
+    return open_upstream
+
+
+def _system_prompt(messages: List[Any]) -> Optional[str]:
+    for message in messages:
+        if message.get("role") == "system" and isinstance(message.get("content"), str):
+            return message["content"]
+    return None
+
+
+@app.post("/api/step")
+async def handle_step_chat(request: FastAPIRequest):
+    body = await read_body(request, StepRequest)
+
+    system_prompt = _system_prompt(body.messages)
+    if body.session and system_prompt is not None:
+        frames = speculative_steps.claim(body.session, system_prompt)
+        if frames is not None:
+            return StreamingResponse(frames, media_type="text/event-stream")
+
+    return await _coalesced_stream(
+        "step",
+        body,
+        _step_upstream(body.messages),
+        lambda stream: stream_text(stream, {}),
+        provider_limiter("openai", "gpt-5-mini"),
     )
 
-    return response
 
+@app.post("/api/help")
+async def handle_help_chat(request: FastAPIRequest):
+    body = await read_body(request, MessagesRequest)
 
-@app.post("/api/check")
-@limiter.limit("30/minute;500/hour")
-async def handle_check_chat(request: FastAPIRequest, body: MessagesRequest):
+    def open_upstream():
+        client = OpenAI(max_retries=0, http_client=StreamedBodyClient())
+
+        return client.chat.completions.create(
+            messages=to_openai_messages(body.messages),
+            model="gpt-5-mini-2025-08-07",
+            stream=True,
+            reasoning_effort="low",
+        )
+
+    return await _coalesced_stream(
+        "help",
+        body,
+        open_upstream,
+        lambda stream: stream_text(stream, {}),
+        provider_limiter("openai", "gpt-5-mini"),
+    )
+
+
+def _check_upstream(messages: List[Any], extractor: Optional[VerdictExtractor]):
+    """Return (open_upstream, format_stream, limiter) for a check call."""
     gemini_api_key = os.environ.get("GEMINI_API_KEY")
 
-    if gemini_api_key:
+    @functools.cache
+    def prepared_messages():
+        # Runs in the threadpool on first use and is reused by retries.
+        if diff_crop_enabled():
+            return crop_changed_regions(messages)
+        return messages
+
+    def open_gemini_upstream():
         client = genai.Client(
             vertexai=True,
             api_key=gemini_api_key,
         )
         model = "gemini-3-flash-preview"
 
+        messages = prepared_messages()
+
         system_instruction_parts = []
-        for msg in body.messages:
+        for msg in messages:
             if msg.get("role") == "system":
                 content = msg.get("content")
                 if isinstance(content, str):
@@ -306,7 +788,7 @@ async def handle_check_chat(request: FastAPIRequest, body: MessagesRequest):
             else None
         )
 
-        contents = convert_openai_to_gemini(body.messages)
+        contents = convert_openai_to_gemini(messages)
 
         generate_content_config = types.GenerateContentConfig(
             system_instruction=system_instruction,
@@ -315,24 +797,21 @@ async def handle_check_chat(request: FastAPIRequest, body: MessagesRequest):
             ),
         )
 
-        stream = client.models.generate_content_stream(
+        return client.models.generate_content_stream(
             model=model,
             contents=contents,
             config=generate_content_config,
         )
 
-        response = StreamingResponse(
-            stream_gemini(stream),
-            media_type="text/event-stream",
-        )
-        return response
-    else:
+    def open_openrouter_upstream():
         client = OpenAI(
             base_url="https://openrouter.ai/api/v1",
             api_key=os.environ.get("OPENROUTER_API_KEY"),
+            max_retries=0,
+            http_client=StreamedBodyClient(),
         )
         kwargs = {
-            "messages": body.messages,
+            "messages": to_openai_messages(prepared_messages()),
             "model": "google/gemini-3-flash-preview",
             "extra_body": {
                 "provider": {
@@ -344,34 +823,312 @@ async def handle_check_chat(request: FastAPIRequest, body: MessagesRequest):
             "stream": True,
         }
 
-    stream = client.chat.completions.create(**kwargs)
+        return client.chat.completions.create(**kwargs)
 
-    response = StreamingResponse(
-        stream_text(stream, {}),
-        media_type="text/event-stream",
+    if gemini_api_key:
+        return (
+            open_gemini_upstream,
+            lambda stream: stream_gemini(stream, extractor=extractor),
+            provider_limiter("vertex", "gemini-3-flash-preview"),
+        )
+
+    return (
+        open_openrouter_upstream,
+        lambda stream: stream_text(stream, {}, extractor=extractor),
+        provider_limiter("openrouter", "google/gemini-3-flash-preview"),
     )
 
-    return response
 
+def _speculation_hook(
+    speculate: Optional[SpeculateRequest], messages: List[Any]
+) -> Optional[Callable[[bool], None]]:
+    """Return an `on_verdict` callback that speculates the next step on success.
 
-@app.post("/api/coordinates")
-@limiter.limit("15/minute;200/hour")
-async def handle_coordinate_chat(request: FastAPIRequest, body: MessagesRequest):
-    client = OpenAI(
-        base_url="https://openrouter.ai/api/v1",
-        api_key=os.environ.get("OPENROUTER_API_KEY"),
-    )
+    The step is generated from the check's after-frame (its last image) with
+    the system prompt the browser said it will use.
+    """
+    if speculate is None or not speculative_steps.enabled:
+        return None
 
-    stream = client.chat.completions.create(
-        messages=body.messages,
-        model="qwen/qwen3-vl-30b-a3b-instruct",
-        extra_body={"provider": {"order": ["Fireworks"], "allow_fallbacks": True}},
-        stream=True,
+    after_frame = next(
+        (
+            part
+            for message in reversed(messages)
+            if isinstance(message.get("content"), list)
+            for part in reversed(message["content"])
+            if part.get("type") in ("image", "image_url")
+        ),
+        None,
     )
+    if after_frame is None:
+        return None
+
+    loop = asyncio.get_running_loop()
+
+    def start() -> None:
+        step_messages = [
+            {"role": "system", "content": speculate.system},
+            {"role": "user", "content": [after_frame]},
+        ]
+        speculative_steps.start(
+            speculate.session,
+            speculate.system,
+            lambda: _open_frames(
+                "step",
+                _step_upstream(step_messages),
+                lambda stream: stream_text(stream, {}),
+                provider_limiter("openai", "gpt-5-mini"),
+                PRIORITY_BACKGROUND,
+            ),
+        )
 
-    response = StreamingResponse(
-        stream_text(stream, {}),
-        media_type="text/event-stream",
+    def on_verdict(completed: bool) -> None:
+        # Called from the threadpool worker running the check stream.
+        if completed:
+            loop.call_soon_threadsafe(start)
+
+    return on_verdict
+
+
+def _speculation_state() -> str:
+    return "on" if speculative_steps.enabled else "off"
+
+
+def _verdict_extractor(
+    enabled: bool,
+    grace_ms: Optional[int],
+    on_verdict: Optional[Callable[[bool], None]] = None,
+) -> Optional[VerdictExtractor]:
+    if not enabled:
+        return None
+    if grace_ms is None:
+        grace_ms = int(os.environ.get("CHECK_VERDICT_GRACE_MS", "0"))
+    return VerdictExtractor(
+        grace_seconds=max(grace_ms, 0) / 1000, on_verdict=on_verdict
     )
 
+
+@app.post("/api/check")
+async def handle_check_chat(request: FastAPIRequest):
+    body = await read_body(request, CheckRequest)
+
+    extractor = _verdict_extractor(
+        body.verdict,
+        body.verdict_grace_ms,
+        _speculation_hook(body.speculate, body.messages),
+    )
+    open_upstream, format_stream, provider = _check_upstream(body.messages, extractor)
+
+    response = await _coalesced_stream(
+        "check",
+        body,
+        open_upstream,
+        format_stream,
+        provider,
+        priority=PRIORITY_BACKGROUND,
+    )
+    # Tells the browser whether sending `speculate` can pay off here.
+    response.headers[SPECULATION_HEADER] = _speculation_state()
     return response
+
+
+check_sessions: TTLStore[CheckSession] = TTLStore(
+    ttl=int(os.environ.get("CHECK_SESSION_TTL_SECONDS", "120")),
+    max_entries=int(os.environ.get("CHECK_SESSION_MAX_ENTRIES", "500")),
+    # Evicted sessions drop their frame even while a socket still holds them;
+    # the client re-sends its step.
+    on_expire=lambda _, session: session.clear(),
+    sizeof=CheckSession.size,
+    max_bytes=int(os.environ.get("CHECK_SESSION_MAX_MB", "256")) << 20,
+)
+check_rate_limits = parse_many(CHECK_RATE_LIMIT)
+
+
+class CheckSocketMessage(BaseModel):
+    type: str
+    system: Optional[str] = None
+    frame: Optional[str] = None
+    verdict: bool = True
+    verdict_grace_ms: Optional[int] = None
+    speculate: Optional[SpeculateRequest] = None
+
+
+async def _receive_socket_message(websocket: WebSocket) -> CheckSocketMessage:
+    """Wait for the next valid message, answering invalid ones with an error."""
+    while True:
+        message = await websocket.receive()
+        if message["type"] == "websocket.disconnect":
+            raise WebSocketDisconnect(message.get("code", 1000))
+        try:
+            return CheckSocketMessage.model_validate_json(
+                message.get("text") or message.get("bytes") or ""
+            )
+        except ValidationError as exc:
+            await websocket.send_json(
+                {
+                    "type": "error",
+                    "errorText": f"Invalid message: {exc.errors()[0]['msg']}",
+                }
+            )
+
+
+@app.websocket("/api/check/ws")
+async def handle_check_socket(websocket: WebSocket):
+    """Persistent channel for the screen-check loop.
+
+    The client sends `{"type": "step", "system": ..., "frame": ...}` when a new
+    instruction starts and `{"type": "check", "frame": ...}` for every poll;
+    only the new "after" frame travels per check, with the same optional
+    `verdict`, `verdict_grace_ms` and `speculate` fields as /api/check. Each
+    check is answered with the event payloads /api/check streams over SSE,
+    then `{"type": "done"}`.
+    """
+    origin = websocket.headers.get("origin")
+    if is_production and origin not in allowed_origins:
+        await websocket.close(code=1008)
+        return
+
+    await websocket.accept()
+
+    session_id = websocket.query_params.get("session") or uuid.uuid4().hex
+    session = check_sessions.get(session_id)
+    if session is None:
+        session = CheckSession()
+        check_sessions.set(session_id, session)
+    await websocket.send_json(
+        {"type": "session", "id": session_id, "speculation": _speculation_state()}
+    )
+
+    client_key = websocket.client.host if websocket.client else "unknown"
+
+    try:
+        while True:
+            message = await _receive_socket_message(websocket)
+            # Decoding a full screenshot takes milliseconds; keep it off the loop.
+            frame = await run_in_threadpool(image_from_data_url, message.frame or "")
+
+            if message.type == "step":
+                if message.system is None or frame is None:
+                    await websocket.send_json(
+                        {
+                            "type": "error",
+                            "errorText": "A step needs 'system' and an image 'frame'",
+                        }
+                    )
+                    continue
+                session.system_prompt = message.system
+                session.before_frame = frame
+                # Re-weigh the session against the store's byte budget.
+                check_sessions.set(session_id, session)
+                continue
+
+            if message.type != "check":
+                await websocket.send_json(
+                    {
+                        "type": "error",
+                        "errorText": f"Unknown message type '{message.type}'",
+                    }
+                )
+                continue
+
+            # Refreshes the session's TTL; an evicted session has been cleared.
+            check_sessions.get(session_id)
+            if session.system_prompt is None or session.before_frame is None:
+                await websocket.send_json(
+                    {"type": "error", "errorText": "Send a 'step' message first"}
+                )
+                continue
+
+            if frame is None:
+                await websocket.send_json(
+                    {"type": "error", "errorText": "A check needs an image 'frame'"}
+                )
+                continue
+
+            if (
+                first_exceeded(limiter, check_rate_limits, "check-ws", client_key)
+                is not None
+            ):
+                await websocket.send_json(
+                    {"type": "error", "errorText": "Rate limit exceeded"}
+                )
+                continue
+
+            messages = session.messages(frame)
+            extractor = _verdict_extractor(
+                message.verdict,
+                message.verdict_grace_ms,
+                _speculation_hook(message.speculate, messages),
+            )
+            open_upstream, format_stream, provider = _check_upstream(
+                messages, extractor
+            )
+
+            try:
+                frames = await _open_frames(
+                    "check-ws",
+                    open_upstream,
+                    format_stream,
+                    provider,
+                    PRIORITY_BACKGROUND,
+                )
+            except ConcurrencyLimitExceeded as exc:
+                await websocket.send_json(
+                    {
+                        "type": "error",
+                        "errorText": "Provider is busy",
+                        "retryAfter": exc.retry_after,
+                    }
+                )
+                continue
+            except Exception:
+                traceback.print_exc()
+                await websocket.send_json(
+                    {"type": "error", "errorText": "The check request failed"}
+                )
+                continue
+
+            try:
+                async for sse_frame in frames:
+                    payload = sse_frame[len("data: ") :].strip()
+                    if payload == "[DONE]":
+                        break
+                    await websocket.send_text(payload)
+            finally:
+                # Releases the provider permit now rather than at the next
+                # check or disconnect.
+                await frames.aclose()
+            await websocket.send_json({"type": "done"})
+    except WebSocketDisconnect:
+        pass
+
+
+@app.post("/api/coordinates")
+async def handle_coordinate_chat(request: FastAPIRequest):
+    body = await read_body(request, MessagesRequest)
+
+    def open_upstream():
+        client = OpenAI(
+            base_url="https://openrouter.ai/api/v1",
+            api_key=os.environ.get("OPENROUTER_API_KEY"),
+            max_retries=0,
+            http_client=StreamedBodyClient(),
+        )
+
+        return client.chat.completions.create(
+            messages=to_openai_messages(body.messages),
+            model="qwen/qwen3-vl-30b-a3b-instruct",
+            extra_body={"provider": {"order": ["Fireworks"], "allow_fallbacks": True}},
+            stream=True,
+        )
+
+    # Emit the point as soon as it is parsed and stop paying for trailing tokens.
+    extractor = CoordinateExtractor(last_image_size(body.messages))
+
+    return await _coalesced_stream(
+        "coordinates",
+        body,
+        open_upstream,
+        lambda stream: stream_text(stream, {}, extractor=extractor),
+        provider_limiter("openrouter", "qwen/qwen3-vl-30b-a3b-instruct"),
+    )
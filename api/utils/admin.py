@@ -0,0 +1,20 @@
+import hmac
+import os
+
+from fastapi import HTTPException, Request
+
+
+def require_admin(request: Request) -> None:
+    """FastAPI dependency guarding operational endpoints behind ADMIN_TOKEN.
+
+    The endpoints are hidden entirely (404) when no token is configured.
+    """
+    token = os.environ.get("ADMIN_TOKEN")
+    if not token:
+        raise HTTPException(status_code=404)
+
+    provided = request.headers.get("authorization", "")
+    if provided.lower().startswith("bearer "):
+        provided = provided[7:]
+    if not hmac.compare_digest(provided.encode("utf-8"), token.encode("utf-8")):
+        raise HTTPException(status_code=401)
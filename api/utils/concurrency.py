@@ -0,0 +1,196 @@
+import asyncio
+import heapq
+import itertools
+import math
+import os
+import time
+from typing import Dict, Iterator, List, Optional, Tuple
+
+# Lower values are served first.
+PRIORITY_INTERACTIVE = 0
+PRIORITY_BACKGROUND = 1
+
+OVERLOAD_STATUS_CODES = (429, 503, 529)
+
+
+class ConcurrencyLimitExceeded(Exception):
+    """Raised when a request waited too long for a provider slot."""
+
+    def __init__(self, name: str, retry_after: int) -> None:
+        super().__init__(f"Too many concurrent requests to {name}")
+        self.name = name
+        self.retry_after = retry_after
+
+
+def is_overload_error(error: BaseException) -> bool:
+    """Whether an upstream error signals that the provider is over capacity."""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    return status in OVERLOAD_STATUS_CODES
+
+
+class Permit:
+    """A held provider slot. Release it exactly once when the upstream call ends."""
+
+    def __init__(self, limiter: "AdaptiveLimiter") -> None:
+        self.limiter = limiter
+        self.acquired_at = time.monotonic()
+        self.released = False
+        self.overloaded = False
+
+    def note_error(self, error: BaseException) -> None:
+        """Record an upstream error so the limit backs off on release."""
+        if is_overload_error(error):
+            self.overloaded = True
+
+    def release(self, overloaded: bool = False) -> None:
+        if self.released:
+            return
+        self.released = True
+        overloaded = overloaded or self.overloaded
+        held = time.monotonic() - self.acquired_at
+        # Streams finish in threadpool workers; hand the bookkeeping to the loop.
+        self.limiter.loop.call_soon_threadsafe(
+            self.limiter._on_release, overloaded, held
+        )
+
+    def wrap(self, frames: Iterator[str]) -> Iterator[str]:
+        """Yield from `frames`, releasing the permit when the stream ends."""
+        try:
+            yield from frames
+        except Exception as error:
+            self.release(overloaded=is_overload_error(error))
+            raise
+        finally:
+            self.release()
+
+
+class AdaptiveLimiter:
+    """AIMD concurrency limit with a priority queue in front of it.
+
+    Every successful call that finishes while the limit is in use grows it
+    by roughly one slot per window of `limit` calls, so a limit that traffic
+    never reaches does not creep up; an overload response from the provider
+    cuts it by `backoff`. Waiters are served by priority, then arrival order,
+    and give up after `queue_timeout` seconds.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        initial_limit: float = 8,
+        min_limit: float = 1,
+        max_limit: float = 64,
+        backoff: float = 0.5,
+        queue_timeout: float = 5.0,
+        max_queue: int = 200,
+    ) -> None:
+        self.name = name
+        self.limit = initial_limit
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.backoff = backoff
+        self.queue_timeout = queue_timeout
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.avg_hold = 1.0
+        self.waiters: List[Tuple[int, int, asyncio.Future]] = []
+        self.counter = itertools.count()
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+
+    def retry_after(self) -> int:
+        queued = len(self.waiters) + 1
+        return max(1, math.ceil(self.avg_hold * queued / max(self.limit, 1)))
+
+    async def acquire(self, priority: int = PRIORITY_INTERACTIVE) -> Permit:
+        self.loop = asyncio.get_running_loop()
+
+        if self.in_flight < int(self.limit) and not self.waiters:
+            self.in_flight += 1
+            return Permit(self)
+
+        if len(self.waiters) >= self.max_queue:
+            raise ConcurrencyLimitExceeded(self.name, self.retry_after())
+
+        future = self.loop.create_future()
+        entry = (priority, next(self.counter), future)
+        heapq.heappush(self.waiters, entry)
+        try:
+            await asyncio.wait_for(asyncio.shield(future), self.queue_timeout)
+        except asyncio.TimeoutError:
+            if future.done() and not future.cancelled():
+                # Granted just as the wait timed out; give the slot back.
+                self._on_release(False, 0.0, counted=False)
+            else:
+                future.cancel()
+                self._discard(entry)
+            raise ConcurrencyLimitExceeded(self.name, self.retry_after())
+        except asyncio.CancelledError:
+            if future.done() and not future.cancelled():
+                self._on_release(False, 0.0, counted=False)
+            else:
+                future.cancel()
+                self._discard(entry)
+            raise
+        return Permit(self)
+
+    def _discard(self, entry: Tuple[int, int, asyncio.Future]) -> None:
+        try:
+            self.waiters.remove(entry)
+            heapq.heapify(self.waiters)
+        except ValueError:
+            pass
+
+    def _on_release(self, overloaded: bool, held: float, counted: bool = True) -> None:
+        saturated = self.in_flight >= int(self.limit) or bool(self.waiters)
+        self.in_flight -= 1
+        if counted:
+            if overloaded:
+                self.limit = max(self.min_limit, self.limit * self.backoff)
+            elif saturated:
+                self.limit = min(self.max_limit, self.limit + 1 / self.limit)
+            self.avg_hold = 0.9 * self.avg_hold + 0.1 * held
+        self._grant()
+
+    def _grant(self) -> None:
+        while self.waiters and self.in_flight < int(self.limit):
+            _, _, future = heapq.heappop(self.waiters)
+            if future.cancelled():
+                continue
+            self.in_flight += 1
+            future.set_result(None)
+
+
+def server_workers() -> int:
+    """Number of server processes sharing this node (1 outside gunicorn)."""
+    return max(1, int(os.environ.get("SERVER_WORKERS", "1")))
+
+
+_limiters: Dict[Tuple[str, str], AdaptiveLimiter] = {}
+
+
+def provider_limiter(provider: str, model: str) -> AdaptiveLimiter:
+    """Return the shared limiter for a provider and model pair.
+
+    The configured limits are per node; each server process gets an equal share.
+    Priority only orders the waiters of one limiter: background speculative
+    /api/step calls queue behind interactive /api/step and /api/help calls to
+    the same model, while /api/check polls run on their own models and only
+    compete with each other.
+    """
+    key = (provider, model)
+    limiter = _limiters.get(key)
+    if limiter is None:
+        workers = server_workers()
+        limiter = AdaptiveLimiter(
+            f"{provider}:{model}",
+            initial_limit=max(
+                1, float(os.environ.get("PROVIDER_CONCURRENCY_INITIAL", "8")) / workers
+            ),
+            max_limit=max(
+                1, float(os.environ.get("PROVIDER_CONCURRENCY_MAX", "64")) / workers
+            ),
+            queue_timeout=int(os.environ.get("PROVIDER_QUEUE_TIMEOUT_MS", "5000"))
+            / 1000,
+        )
+        _limiters[key] = limiter
+    return limiter
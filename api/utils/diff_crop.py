@@ -0,0 +1,243 @@
+import os
+from io import BytesIO
+from typing import Any, List, Optional, Tuple
+
+from .images import ImageBlob, part_image_bytes
+from .tracing import traced
+
+Box = Tuple[int, int, int, int]  # x0, y0, x1, y1 (exclusive)
+
+
+def diff_crop_enabled() -> bool:
+    return os.environ.get("CHECK_DIFF_CROP", "").lower() in ("1", "true", "yes")
+
+
+def _setting(name: str, default: float) -> float:
+    return float(os.environ.get(name, default))
+
+
+def _decode_image(part: Any):
+    from PIL import Image
+
+    try:
+        image = part_image_bytes(part)
+        if image is None:
+            return None
+        return Image.open(BytesIO(image[0])).convert("RGB")
+    except (OSError, ValueError):
+        return None
+
+
+def _image_part(image, quality: int = 85) -> Any:
+    buffer = BytesIO()
+    image.save(buffer, format="JPEG", quality=quality)
+    return {"type": "image", "image": ImageBlob(buffer.getvalue(), "image/jpeg")}
+
+
+def changed_tiles(before, after, tile: int, threshold: int):
+    """Boolean tile grid marking tiles where any pixel channel moved past `threshold`."""
+    import numpy as np
+
+    a = np.asarray(before, dtype=np.int16)
+    b = np.asarray(after, dtype=np.int16)
+    mask = np.abs(a - b).max(axis=2) > threshold
+
+    height, width = mask.shape
+    rows, cols = -(-height // tile), -(-width // tile)
+    padded = np.zeros((rows * tile, cols * tile), dtype=bool)
+    padded[:height, :width] = mask
+    return padded.reshape(rows, tile, cols, tile).any(axis=(1, 3))
+
+
+def tile_boxes(tiles) -> List[Box]:
+    """Bounding boxes (in tile units) of 8-connected groups of changed tiles.
+
+    Labels every changed tile with its flat index, then repeatedly lets each
+    take the smallest label in its 3x3 neighbourhood, with pointer jumping
+    so the number of passes grows with the log of a group's span. Boxes are
+    returned in row-major order of each group's first tile.
+    """
+    import numpy as np
+
+    rows, cols = tiles.shape
+    none = rows * cols
+    labels = np.where(tiles, np.arange(none).reshape(rows, cols), none)
+    while True:
+        padded = np.pad(labels, 1, constant_values=none)
+        smallest = labels.copy()
+        for dr in range(3):
+            for dc in range(3):
+                np.minimum(
+                    smallest, padded[dr : dr + rows, dc : dc + cols], out=smallest
+                )
+        smallest = np.where(tiles, smallest, none).ravel()
+        changed = smallest < none
+        smallest[changed] = smallest[smallest[changed]]
+        smallest = smallest.reshape(rows, cols)
+        if np.array_equal(smallest, labels):
+            break
+        labels = smallest
+
+    ys, xs = tiles.nonzero()
+    groups, group = np.unique(labels[ys, xs], return_inverse=True)
+    x0 = np.full(len(groups), cols)
+    y0 = np.full(len(groups), rows)
+    x1 = np.zeros(len(groups), dtype=int)
+    y1 = np.zeros(len(groups), dtype=int)
+    np.minimum.at(x0, group, xs)
+    np.minimum.at(y0, group, ys)
+    np.maximum.at(x1, group, xs + 1)
+    np.maximum.at(y1, group, ys + 1)
+    return [tuple(int(v) for v in box) for box in zip(x0, y0, x1, y1)]
+
+
+def _overlaps(a: Box, b: Box) -> bool:
+    return a[0] < b[2] and b[0] < a[2] and a[1] < b[3] and b[1] < a[3]
+
+
+def _union(a: Box, b: Box) -> Box:
+    return min(a[0], b[0]), min(a[1], b[1]), max(a[2], b[2]), max(a[3], b[3])
+
+
+def _area(box: Box) -> int:
+    return (box[2] - box[0]) * (box[3] - box[1])
+
+
+def merge_boxes(
+    boxes: List[Box], margin: int, max_regions: int, size: Tuple[int, int]
+) -> List[Box]:
+    """Pad boxes by `margin`, merge overlaps and cap the count at `max_regions`."""
+    width, height = size
+    boxes = [
+        (
+            max(x0 - margin, 0),
+            max(y0 - margin, 0),
+            min(x1 + margin, width),
+            min(y1 + margin, height),
+        )
+        for x0, y0, x1, y1 in boxes
+    ]
+
+    merged = True
+    while merged:
+        merged = False
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                if _overlaps(boxes[i], boxes[j]):
+                    boxes[i] = _union(boxes[i], boxes.pop(j))
+                    merged = True
+                    break
+            if merged:
+                break
+
+    # Fold the pair whose union grows the least until few enough remain.
+    while len(boxes) > max_regions:
+        best = None
+        for i in range(len(boxes)):
+            for j in range(i + 1, len(boxes)):
+                growth = (
+                    _area(_union(boxes[i], boxes[j]))
+                    - _area(boxes[i])
+                    - _area(boxes[j])
+                )
+                if best is None or growth < best[0]:
+                    best = (growth, i, j)
+        _, i, j = best
+        boxes[i] = _union(boxes[i], boxes.pop(j))
+
+    return sorted(boxes, key=lambda box: (box[1], box[0]))
+
+
+def _image_parts(message: Any) -> List[int]:
+    content = message.get("content")
+    if not isinstance(content, list):
+        return []
+    return [
+        i
+        for i, part in enumerate(content)
+        if part.get("type") in ("image", "image_url")
+    ]
+
+
+@traced("check.diff_crop")
+def crop_changed_regions(messages: List[Any]) -> List[Any]:
+    """Replace the before/after frames of a check request with thumbnails plus
+    full-resolution crops of the regions that changed.
+
+    Returns `messages` unchanged when there is no before/after pair, the frames
+    cannot be compared, or so much changed that cropping would not help.
+    """
+    target: Optional[int] = None
+    for index in range(len(messages) - 1, -1, -1):
+        if (
+            messages[index].get("role") == "user"
+            and len(_image_parts(messages[index])) == 2
+        ):
+            target = index
+            break
+    if target is None:
+        return messages
+
+    content = messages[target]["content"]
+    before_index, after_index = _image_parts(messages[target])
+    before = _decode_image(content[before_index])
+    after = _decode_image(content[after_index])
+    if before is None or after is None or before.size != after.size:
+        return messages
+
+    tile = int(_setting("CHECK_DIFF_TILE_PX", 32))
+    tiles = changed_tiles(
+        before, after, tile, int(_setting("CHECK_DIFF_THRESHOLD", 24))
+    )
+    if tiles.mean() > _setting("CHECK_DIFF_MAX_AREA", 0.5):
+        return messages
+
+    width, height = after.size
+    boxes = merge_boxes(
+        [
+            (x0 * tile, y0 * tile, x1 * tile, y1 * tile)
+            for x0, y0, x1, y1 in tile_boxes(tiles)
+        ],
+        margin=tile,
+        max_regions=int(_setting("CHECK_DIFF_MAX_REGIONS", 4)),
+        size=(width, height),
+    )
+
+    thumbnail_px = int(_setting("CHECK_DIFF_THUMBNAIL_PX", 768))
+    before_thumb, after_thumb = before.copy(), after.copy()
+    before_thumb.thumbnail((thumbnail_px, thumbnail_px))
+    after_thumb.thumbnail((thumbnail_px, thumbnail_px))
+
+    parts: List[Any] = [
+        {"type": "text", "text": f"Before (downscaled from {width}x{height}):"},
+        _image_part(before_thumb),
+        {"type": "text", "text": f"After (downscaled from {width}x{height}):"},
+        _image_part(after_thumb),
+    ]
+    if not boxes:
+        parts.append(
+            {"type": "text", "text": "No pixels changed between the two screenshots."}
+        )
+    for number, (x0, y0, x1, y1) in enumerate(boxes, start=1):
+        parts.extend(
+            [
+                {
+                    "type": "text",
+                    "text": f"Changed region {number} at x={x0}, y={y0}, {x1 - x0}x{y1 - y0}px, before:",
+                },
+                _image_part(before.crop((x0, y0, x1, y1))),
+                {"type": "text", "text": f"Changed region {number}, after:"},
+                _image_part(after.crop((x0, y0, x1, y1))),
+            ]
+        )
+
+    # Keep any text that is not one of the frame labels the client adds.
+    leading = [
+        part
+        for part in content
+        if part.get("type") == "text" and part.get("text") not in ("Before:", "After:")
+    ]
+
+    cropped = list(messages)
+    cropped[target] = {**messages[target], "content": leading + parts}
+    return cropped
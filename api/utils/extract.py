@@ -0,0 +1,209 @@
+import json
+import re
+from abc import ABC, abstractmethod
+from typing import Any, Callable, Dict, Optional, Tuple
+
+# Qwen3-VL answers in a 0-999 relative grid; lib/ai.ts uses the same scale.
+COORDINATE_SCALE = 999
+
+# A sentence-ending period after the pair ("512,384.") is not a decimal point.
+_TUPLE_PATTERN = re.compile(
+    r"(-?\d+(?:\.\d+)?)\s*,\s*(-?\d+(?:\.\d+)?)(?=\.(?!\d)|[^\d.]|$)"
+)
+
+
+class StreamExtractor(ABC):
+    """Incrementally scans streamed text for a structured result.
+
+    `stream_text` and `stream_gemini` feed every text delta to `feed`. Once a
+    result is returned it is emitted as an `event_type` SSE event and the
+    upstream generation is cancelled after `grace_seconds`.
+    """
+
+    event_type = "data"
+    grace_seconds = 0.0
+
+    def __init__(self) -> None:
+        self.buffer = ""
+
+    def feed(self, delta: str) -> Optional[Dict[str, Any]]:
+        self.buffer += delta
+        return self.scan(final=False)
+
+    def finish(self) -> Optional[Dict[str, Any]]:
+        return self.scan(final=True)
+
+    @abstractmethod
+    def scan(self, final: bool) -> Optional[Dict[str, Any]]:
+        """Return the result found in `self.buffer`, or None to keep reading."""
+
+
+def _json_objects(text: str):
+    """Yield every balanced top-level JSON object found in `text`."""
+    start = text.find("{")
+    while start != -1:
+        depth = 0
+        in_string = False
+        escaped = False
+        for index in range(start, len(text)):
+            char = text[index]
+            if in_string:
+                if escaped:
+                    escaped = False
+                elif char == "\\":
+                    escaped = True
+                elif char == '"':
+                    in_string = False
+                continue
+            if char == '"':
+                in_string = True
+            elif char == "{":
+                depth += 1
+            elif char == "}":
+                depth -= 1
+                if depth == 0:
+                    try:
+                        yield json.loads(text[start : index + 1])
+                    except ValueError:
+                        pass
+                    break
+        else:
+            return
+        start = text.find("{", index + 1)
+
+
+def _point_from_object(obj: Any) -> Optional[Tuple[float, float]]:
+    if isinstance(obj, list) and obj:
+        return _point_from_object(obj[0])
+    if not isinstance(obj, dict):
+        return None
+    if "x" in obj and "y" in obj:
+        return float(obj["x"]), float(obj["y"])
+    point = obj.get("point_2d") or obj.get("point")
+    if isinstance(point, list) and len(point) >= 2:
+        return float(point[0]), float(point[1])
+    bbox = obj.get("bbox_2d") or obj.get("bbox")
+    if isinstance(bbox, list) and len(bbox) >= 4:
+        return (float(bbox[0]) + float(bbox[2])) / 2, (
+            float(bbox[1]) + float(bbox[3])
+        ) / 2
+    return None
+
+
+class CoordinateExtractor(StreamExtractor):
+    """Finds the first "x,y" tuple or JSON point in the coordinate model output."""
+
+    event_type = "data-coordinates"
+
+    def __init__(self, image_size: Optional[Tuple[int, int]] = None) -> None:
+        super().__init__()
+        self.image_size = image_size
+
+    def scan(self, final: bool) -> Optional[Dict[str, Any]]:
+        text = self.buffer
+        point = None
+
+        if "{" in text:
+            for obj in _json_objects(text):
+                point = _point_from_object(obj)
+                if point is not None:
+                    break
+            if point is None and not final:
+                return None
+
+        if point is None:
+            for match in _TUPLE_PATTERN.finditer(text):
+                # A trailing number may still be growing ("12,3" -> "12,345",
+                # "12,3." -> "12,3.5").
+                if not final and text[match.end() :] in ("", "."):
+                    continue
+                point = float(match.group(1)), float(match.group(2))
+                break
+
+        if point is None:
+            return None
+        return self.normalize(point)
+
+    def normalize(self, point: Tuple[float, float]) -> Dict[str, Any]:
+        x, y = point
+        result: Dict[str, Any] = {"normalized": {"x": round(x), "y": round(y)}}
+        if self.image_size is not None:
+            width, height = self.image_size
+            result["x"] = round(x / COORDINATE_SCALE * width)
+            result["y"] = round(y / COORDINATE_SCALE * height)
+            result["width"] = width
+            result["height"] = height
+        return result
+
+
+_VERDICT_FIELD_PATTERN = re.compile(
+    r'"(?:verdict|completed|complete|done|answer|result)"\s*:\s*'
+    r'(true|false|"(?:yes|no|true|false)")',
+    re.IGNORECASE,
+)
+_VERDICT_TOKENS = {"yes": True, "no": False, "true": True, "false": False}
+# An unfinished last line only counts once punctuation closes the token:
+# "No" may still become "No error shown", but "No." or "**No**" may not.
+_CLOSED_VERDICT_PATTERN = re.compile(
+    r"\s*[*#`\"']*(yes|no)[*`\"'.!:]+\s*$", re.IGNORECASE
+)
+
+
+def _line_verdict(line: str) -> Optional[bool]:
+    token = line.strip().strip("*#`\"'.!: ").lower()
+    for prefix in ("answer", "verdict", "final answer", "result"):
+        if token.startswith(prefix):
+            token = token[len(prefix) :].strip("*`\"'.!: ")
+            break
+    return _VERDICT_TOKENS.get(token)
+
+
+class VerdictExtractor(StreamExtractor):
+    """Finds the Yes/No completion decision in /api/check output.
+
+    Matches either a JSON field such as `"completed": true` or a line that
+    consists only of the decision token, as requested by the check prompt.
+    The prompt puts the token on the last line, after the reasoning. A line is
+    only trusted once it is complete: a newline follows it, punctuation closes
+    the token ("No.", "**Yes**"), or the stream has ended. A bare "No" may
+    still be the start of "No error shown".
+    """
+
+    event_type = "data-verdict"
+
+    def __init__(
+        self,
+        grace_seconds: float = 0.0,
+        on_verdict: Optional[Callable[[bool], None]] = None,
+    ) -> None:
+        super().__init__()
+        self.grace_seconds = grace_seconds
+        self.on_verdict = on_verdict
+
+    def scan(self, final: bool) -> Optional[Dict[str, Any]]:
+        text = self.buffer
+
+        match = _VERDICT_FIELD_PATTERN.search(text)
+        if match is not None:
+            value = match.group(1).strip('"').lower()
+            return self.result(_VERDICT_TOKENS[value], "")
+
+        lines = text.split("\n")
+        # The last line is only complete once a newline or the end of stream arrives.
+        complete_lines = lines if final else lines[:-1]
+        for index, line in enumerate(complete_lines):
+            verdict = _line_verdict(line)
+            if verdict is not None:
+                return self.result(verdict, "\n".join(lines[:index]))
+
+        if not final and len(lines) > 1:
+            match = _CLOSED_VERDICT_PATTERN.match(lines[-1])
+            if match is not None:
+                token = match.group(1).lower()
+                return self.result(_VERDICT_TOKENS[token], "\n".join(lines[:-1]))
+        return None
+
+    def result(self, completed: bool, reasoning: str) -> Dict[str, Any]:
+        if self.on_verdict is not None:
+            self.on_verdict(completed)
+        return {"completed": completed, "reasoning": reasoning.strip()}
@@ -6,7 +6,12 @@ import base64
 from typing import Any, List, Optional
 from google.genai import types
 
+from .extract import StreamExtractor
+from .stream import STREAM_ERROR_FRAME
+from .tracing import traced
 
+
+@traced("convert.openai_to_gemini")
 def convert_openai_to_gemini(messages: List[Any]) -> List[types.Content]:
     gemini_messages = []
     for msg in messages:
@@ -28,6 +33,14 @@ def convert_openai_to_gemini(messages: List[Any]) -> List[types.Content]:
             for part in content:
                 if part.get("type") == "text":
                     parts.append(types.Part.from_text(text=part.get("text")))
+                elif part.get("type") == "image":
+                    # Binary upload from the multipart transport, no decode needed.
+                    image = part["image"]
+                    parts.append(
+                        types.Part.from_bytes(
+                            data=image.to_bytes(), mime_type=image.mime_type
+                        )
+                    )
                 elif part.get("type") == "image_url":
                     image_url = part.get("image_url", {}).get("url", "")
                     if image_url.startswith("data:image/"):
@@ -66,6 +79,7 @@ def stream_gemini(
     stream,
     endpoint_name: Optional[str] = None,
     start_time: Optional[float] = None,
+    extractor: Optional[StreamExtractor] = None,
 ):
     try:
         if start_time is None:
@@ -79,6 +93,8 @@ def stream_gemini(
         text_stream_id = "text-1"
         text_started = False
         text_finished = False
+        extracted = None
+        cutoff_at = None
 
         yield format_sse({"type": "start", "messageId": message_id})
 
@@ -101,6 +117,25 @@ def stream_gemini(
                     }
                 )
 
+                if extractor is not None and extracted is None:
+                    extracted = extractor.feed(chunk.text)
+                    if extracted is not None:
+                        yield format_sse(
+                            {"type": extractor.event_type, "data": extracted}
+                        )
+                        cutoff_at = time.time() + extractor.grace_seconds
+
+            if cutoff_at is not None and time.time() >= cutoff_at:
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+                break
+
+        if extractor is not None and extracted is None:
+            extracted = extractor.finish()
+            if extracted is not None:
+                yield format_sse({"type": extractor.event_type, "data": extracted})
+
         if text_started and not text_finished:
             yield format_sse({"type": "text-end", "id": text_stream_id})
             text_finished = True
@@ -123,4 +158,7 @@ def stream_gemini(
         yield "data: [DONE]\n\n"
     except Exception:
         traceback.print_exc()
-        raise
+        # Headers are already sent, so report the failure in-band. Provider
+        # messages stay in the server log.
+        yield STREAM_ERROR_FRAME
+        yield "data: [DONE]\n\n"
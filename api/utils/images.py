@@ -0,0 +1,234 @@
+import base64
+import binascii
+import hashlib
+import struct
+from typing import Any, List, Optional, Tuple
+
+import msgspec
+
+from .tracing import traced
+
+
+# Header bytes read to find an image's size; a JPEG whose frame header lies
+# beyond these (e.g. after a large EXIF block) is decoded in full.
+_HEADER_SIZES = (4096, 65536)
+
+
+def _base64_chars(size: int) -> int:
+    """Length of the base64 text that encodes the first `size` bytes."""
+    return -(-size // 3) * 4
+
+
+def _decode_head(text: str, size: int) -> bytes:
+    return base64.b64decode(text[: _base64_chars(size)])[:size]
+
+
+class ImageBlob:
+    """Raw image bytes carried through the pipeline without base64 encoding.
+
+    Message parts of the form `{"type": "image", "image": ImageBlob}` stand in
+    for `image_url` data URLs; they are only encoded when a provider needs an
+    OpenAI-format request.
+    """
+
+    __slots__ = ("data", "mime_type")
+
+    def __init__(self, data: bytes, mime_type: str = "image/jpeg") -> None:
+        self.data = data
+        self.mime_type = mime_type
+
+    def to_bytes(self) -> bytes:
+        return self.data
+
+    def head(self, size: int) -> bytes:
+        """The first `size` bytes of the image, or all of it if shorter."""
+        return self.data[:size]
+
+    def to_data_url(self) -> str:
+        encoded = base64.b64encode(self.data).decode("ascii")
+        return f"data:{self.mime_type};base64,{encoded}"
+
+    def fingerprint(self) -> str:
+        return hashlib.sha256(self.data).hexdigest()
+
+
+class Base64Image(ImageBlob):
+    """A data URL image left as a view into the raw request body.
+
+    `payload` is the base64 text after the comma. It is only decoded when a
+    provider needs bytes and only turned into a `str` for OpenAI-format calls.
+    """
+
+    __slots__ = ("payload",)
+
+    def __init__(self, payload: memoryview, mime_type: str) -> None:
+        self.payload = payload
+        self.mime_type = mime_type
+
+    def text(self) -> str:
+        """The base64 text, with any JSON string escapes decoded."""
+        text = str(self.payload, "ascii")
+        if "\\" in text:
+            text = msgspec.json.decode(f'"{text}"'.encode("ascii"), type=str)
+        return text
+
+    @property
+    def data(self) -> bytes:
+        return base64.b64decode(self.text())
+
+    def to_bytes(self) -> bytes:
+        return self.data
+
+    def head(self, size: int) -> bytes:
+        text = str(self.payload[: _base64_chars(size)], "ascii")
+        if "\\" in text:
+            text = self.text()
+        return _decode_head(text, size)
+
+    def to_data_url(self) -> str:
+        return f"data:{self.mime_type};base64,{self.text()}"
+
+    def fingerprint(self) -> str:
+        return hashlib.sha256(self.payload).hexdigest()
+
+
+@traced("convert.to_openai_messages")
+def to_openai_messages(messages: List[Any]) -> List[Any]:
+    """Encode binary image parts as data URLs for OpenAI-format providers."""
+    converted = []
+    for msg in messages:
+        content = msg.get("content")
+        if isinstance(content, list) and any(
+            part.get("type") == "image" for part in content
+        ):
+            content = [
+                (
+                    {
+                        "type": "image_url",
+                        "image_url": {"url": part["image"].to_data_url()},
+                    }
+                    if part.get("type") == "image"
+                    else part
+                )
+                for part in content
+            ]
+            msg = {**msg, "content": content}
+        converted.append(msg)
+    return converted
+
+
+def part_image_bytes(part: Any) -> Optional[Tuple[bytes, str]]:
+    """Return (bytes, mime type) for an `image` or base64 `image_url` part."""
+    if part.get("type") == "image":
+        image = part["image"]
+        return image.to_bytes(), image.mime_type
+    if part.get("type") == "image_url":
+        parsed = parse_data_url(part.get("image_url", {}).get("url", ""))
+        if parsed is not None:
+            return base64.b64decode(parsed[1]), parsed[0]
+    return None
+
+
+def part_image_head(part: Any, size: int) -> Optional[bytes]:
+    """Like part_image_bytes, but decode only the first `size` bytes."""
+    if part.get("type") == "image":
+        return part["image"].head(size)
+    if part.get("type") == "image_url":
+        url = part.get("image_url", {}).get("url", "")
+        comma = url.find(",")
+        if url.startswith("data:") and comma != -1:
+            return _decode_head(url[comma + 1 : comma + 1 + _base64_chars(size)], size)
+    return None
+
+
+def parse_data_url(url: str) -> Optional[Tuple[str, str]]:
+    """Split a base64 data URL into its mime type and payload."""
+    if not url.startswith("data:") or "," not in url:
+        return None
+    header, data = url.split(",", 1)
+    mime_type = header[5:].split(";")[0] or "application/octet-stream"
+    return mime_type, data
+
+
+def image_from_data_url(url: str) -> Optional[ImageBlob]:
+    """Decode a base64 image data URL, or return None if it is not one."""
+    parsed = parse_data_url(url)
+    if parsed is None or not parsed[0].startswith("image/"):
+        return None
+    try:
+        return ImageBlob(base64.b64decode(parsed[1], validate=True), parsed[0])
+    except binascii.Error:
+        return None
+
+
+def image_size(data: bytes) -> Optional[Tuple[int, int]]:
+    """Read (width, height) from a PNG, JPEG, GIF or WebP header."""
+    if data.startswith(b"\x89PNG\r\n\x1a\n") and len(data) >= 24:
+        width, height = struct.unpack(">II", data[16:24])
+        return width, height
+
+    if data[:6] in (b"GIF87a", b"GIF89a") and len(data) >= 10:
+        width, height = struct.unpack("<HH", data[6:10])
+        return width, height
+
+    if data[:4] == b"RIFF" and data[8:12] == b"WEBP" and len(data) >= 30:
+        chunk = data[12:16]
+        if chunk == b"VP8X":
+            width = int.from_bytes(data[24:27], "little") + 1
+            height = int.from_bytes(data[27:30], "little") + 1
+            return width, height
+        if chunk == b"VP8L":
+            bits = int.from_bytes(data[21:25], "little")
+            return (bits & 0x3FFF) + 1, ((bits >> 14) & 0x3FFF) + 1
+        if chunk == b"VP8 ":
+            width, height = struct.unpack("<HH", data[26:30])
+            return width & 0x3FFF, height & 0x3FFF
+        return None
+
+    if data[:2] == b"\xff\xd8":
+        offset = 2
+        while offset + 9 < len(data):
+            if data[offset] != 0xFF:
+                offset += 1
+                continue
+            marker = data[offset + 1]
+            if marker in (0xD8, 0x01) or 0xD0 <= marker <= 0xD7:
+                offset += 2
+                continue
+            (segment_length,) = struct.unpack(">H", data[offset + 2 : offset + 4])
+            # SOF0..SOF15, excluding DHT (C4), JPG (C8) and DAC (CC)
+            if 0xC0 <= marker <= 0xCF and marker not in (0xC4, 0xC8, 0xCC):
+                height, width = struct.unpack(">HH", data[offset + 5 : offset + 9])
+                return width, height
+            offset += 2 + segment_length
+        return None
+
+    return None
+
+
+def last_image_size(messages: List[Any]) -> Optional[Tuple[int, int]]:
+    """Return the size of the most recent image in an OpenAI-format message list.
+
+    Only the image's header is decoded, so this is cheap enough for the
+    event loop even for full-resolution screenshots.
+    """
+    for msg in reversed(messages):
+        content = msg.get("content")
+        if not isinstance(content, list):
+            continue
+        for part in reversed(content):
+            if part.get("type") not in ("image", "image_url"):
+                continue
+            try:
+                for size in _HEADER_SIZES:
+                    head = part_image_head(part, size)
+                    if head is None:
+                        return None
+                    found = image_size(head)
+                    if found is not None or len(head) < size:
+                        return found
+                image = part_image_bytes(part)
+                return image_size(image[0]) if image is not None else None
+            except Exception:
+                return None
+    return None
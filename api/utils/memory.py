@@ -0,0 +1,95 @@
+import json as json_module
+import os
+import random
+import threading
+import tracemalloc
+from typing import Iterator
+
+import httpx
+from openai import DefaultHttpxClient
+
+from .metrics import metrics
+
+MEMORY_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000)
+
+
+def _send_once(body: bytes) -> Iterator[bytes]:
+    yield body
+
+
+class StreamedBodyClient(DefaultHttpxClient):
+    """httpx client for provider SDKs that does not keep request bodies.
+
+    httpx stores the encoded JSON of every request (each screenshot as
+    base64) on the request object, which the SDK's stream keeps until it is
+    closed. Here JSON bodies are sent from a one-shot iterator instead, so
+    the encoded body is freed as soon as it has been written to the socket.
+    """
+
+    def build_request(
+        self, method, url, *, content=None, json=None, headers=None, **kwargs
+    ):
+        if json is not None and content is None:
+            body = json_module.dumps(
+                json, ensure_ascii=False, separators=(",", ":"), allow_nan=False
+            ).encode("utf-8")
+            headers = httpx.Headers(headers)
+            headers["Content-Type"] = "application/json"
+            # An explicit length keeps httpx from switching to chunked encoding.
+            headers["Content-Length"] = str(len(body))
+            content, json = _send_once(body), None
+        return super().build_request(
+            method, url, content=content, json=json, headers=headers, **kwargs
+        )
+
+    def __del__(self) -> None:
+        # Like the SDK's own default client, close the pool when collected.
+        try:
+            self.close()
+        except Exception:
+            pass
+
+
+class MemorySamplingMiddleware:
+    """Records the peak traced allocation of a sample of requests.
+
+    A fraction MEMORY_SAMPLE_RATE of requests run with tracemalloc on, one at
+    a time; the peak of what was allocated while they ran (including any
+    concurrent requests) is observed as `request_peak_memory_mb`. Tracing
+    slows every allocation in the process, so keep the rate low. Off by
+    default.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self.rate = float(os.environ.get("MEMORY_SAMPLE_RATE", "0"))
+        self.lock = threading.Lock()
+
+    async def __call__(self, scope, receive, send) -> None:
+        if (
+            scope["type"] != "http"
+            or self.rate <= 0
+            or random.random() >= self.rate
+            or not self.lock.acquire(blocking=False)
+        ):
+            return await self.app(scope, receive, send)
+
+        try:
+            if tracemalloc.is_tracing():
+                # Someone else is tracing; their numbers would be ours too.
+                return await self.app(scope, receive, send)
+            tracemalloc.start()
+            try:
+                await self.app(scope, receive, send)
+            finally:
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                route = getattr(scope.get("route"), "path", "unmatched")
+                metrics.observe(
+                    "request_peak_memory_mb",
+                    peak / (1 << 20),
+                    {"route": route},
+                    buckets=MEMORY_BUCKETS,
+                )
+        finally:
+            self.lock.release()
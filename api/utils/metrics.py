@@ -0,0 +1,96 @@
+import bisect
+import threading
+from typing import Any, Dict, Optional, Tuple
+
+DEFAULT_BUCKETS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000)
+
+Labels = Tuple[Tuple[str, str], ...]
+
+
+def _series(name: str, labels: Labels) -> str:
+    if not labels:
+        return name
+    rendered = ",".join(f'{key}="{value}"' for key, value in labels)
+    return f"{name}{{{rendered}}}"
+
+
+class Histogram:
+    def __init__(self, buckets: Tuple[float, ...]) -> None:
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)
+        self.count = 0
+        self.total = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.total += value
+
+    def snapshot(self) -> Dict[str, Any]:
+        cumulative = 0
+        buckets = {}
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            buckets[str(bound)] = cumulative
+        buckets["+Inf"] = self.count
+        return {"count": self.count, "sum": self.total, "buckets": buckets}
+
+
+class Metrics:
+    """In-process counters, gauges and histograms, safe to update from worker threads."""
+
+    def __init__(self) -> None:
+        self.lock = threading.Lock()
+        self.counters: Dict[Tuple[str, Labels], float] = {}
+        self.gauges: Dict[Tuple[str, Labels], float] = {}
+        self.histograms: Dict[Tuple[str, Labels], Histogram] = {}
+
+    def inc(
+        self, name: str, labels: Optional[Dict[str, str]] = None, value: float = 1
+    ) -> None:
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            self.counters[key] = self.counters.get(key, 0) + value
+
+    def gauge(
+        self, name: str, value: float, labels: Optional[Dict[str, str]] = None
+    ) -> None:
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            self.gauges[key] = value
+
+    def observe(
+        self,
+        name: str,
+        value: float,
+        labels: Optional[Dict[str, str]] = None,
+        buckets: Tuple[float, ...] = DEFAULT_BUCKETS,
+    ) -> None:
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self.lock:
+            histogram = self.histograms.get(key)
+            if histogram is None:
+                histogram = self.histograms[key] = Histogram(buckets)
+            histogram.observe(value)
+
+    def snapshot(self) -> Dict[str, Any]:
+        with self.lock:
+            return {
+                "counters": {
+                    _series(name, labels): value
+                    for (name, labels), value in sorted(self.counters.items())
+                },
+                "gauges": {
+                    _series(name, labels): value
+                    for (name, labels), value in sorted(self.gauges.items())
+                },
+                "histograms": {
+                    _series(name, labels): histogram.snapshot()
+                    for (name, labels), histogram in sorted(
+                        self.histograms.items(), key=lambda item: item[0]
+                    )
+                },
+            }
+
+
+metrics = Metrics()
@@ -0,0 +1,245 @@
+import multiprocessing
+import os
+import signal
+import tempfile
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from io import BytesIO
+from multiprocessing.pool import Pool
+from typing import List, Optional, Tuple
+
+from .concurrency import server_workers
+
+PageResult = Tuple[Optional[str], Optional[str]]  # text, or why it was skipped
+
+# In each pool process: the documents parsed most recently, by document id.
+_readers: "OrderedDict[str, object]" = OrderedDict()
+_MAX_READERS = 2
+
+# In the server process: one pool for the life of the process, and a cap on
+# how many documents may use it at once.
+_pool: Optional[Pool] = None
+_pool_pid: Optional[int] = None
+_pool_lock = threading.Lock()
+_documents: Optional[threading.BoundedSemaphore] = None
+# Set when this process could not create its pool (e.g. no working semaphores
+# on serverless runtimes), so extraction stays in-thread instead of retrying.
+_pool_failed = False
+
+
+class _PageTimeout(BaseException):
+    # Not an Exception: pypdf catches Exception around much of its parsing
+    # and would swallow the alarm.
+    pass
+
+
+def _on_alarm(signum, frame) -> None:
+    raise _PageTimeout()
+
+
+def _init_worker() -> None:
+    # Pool workers must die on terminate() instead of starting a graceful
+    # shutdown, and need SIGALRM for the per-page limit.
+    signal.signal(signal.SIGTERM, signal.SIG_DFL)
+    signal.signal(signal.SIGINT, signal.SIG_DFL)
+    signal.signal(signal.SIGALRM, _on_alarm)
+
+
+def _reader(document: str, path: str):
+    reader = _readers.get(document)
+    if reader is None:
+        from pypdf import PdfReader
+
+        reader = PdfReader(path)
+        _readers[document] = reader
+        while len(_readers) > _MAX_READERS:
+            _readers.popitem(last=False)
+    return reader
+
+
+def _limited(page_timeout: float, work):
+    """Run `work()` under the per-page alarm. Returns (result, timed_out)."""
+    try:
+        signal.setitimer(signal.ITIMER_REAL, page_timeout)
+        try:
+            return work(), False
+        finally:
+            # An alarm firing in here is still caught below.
+            signal.setitimer(signal.ITIMER_REAL, 0)
+    except _PageTimeout:
+        return None, True
+
+
+def _count_pages(document: str, path: str, page_timeout: float) -> Optional[int]:
+    # Parses the document in this worker (and caches it for its pages), so
+    # the server process never parses it. None when parsing overran.
+    count, timed_out = _limited(
+        page_timeout, lambda: len(_reader(document, path).pages)
+    )
+    return None if timed_out else count
+
+
+def _extract_page(
+    document: str, path: str, index: int, page_timeout: float, deadline: float
+) -> PageResult:
+    # Pages of a document the server has already given up on are skipped
+    # rather than extracted for nobody. CLOCK_MONOTONIC is system-wide, so
+    # the server's deadline holds here.
+    if time.monotonic() >= deadline:
+        return None, "document time budget exceeded"
+    try:
+        text, timed_out = _limited(
+            page_timeout,
+            lambda: _reader(document, path).pages[index].extract_text() or "",
+        )
+    except Exception as exc:
+        return None, f"extraction failed ({type(exc).__name__})"
+    if timed_out:
+        return None, f"extraction exceeded {page_timeout:g}s"
+    return text, None
+
+
+def _settings() -> Tuple[int, float, float]:
+    configured = os.environ.get("PDF_EXTRACT_WORKERS")
+    if configured:
+        workers = int(configured)
+    else:
+        # The node's CPUs are shared by every server process's pool.
+        workers = max(1, min((os.cpu_count() or 1) // server_workers(), 4))
+    page_timeout = float(os.environ.get("PDF_PAGE_TIMEOUT_SECONDS", "5"))
+    document_timeout = float(os.environ.get("PDF_DOCUMENT_TIMEOUT_SECONDS", "20"))
+    return workers, page_timeout, document_timeout
+
+
+def _can_start_pool() -> bool:
+    return "forkserver" in multiprocessing.get_all_start_methods()
+
+
+def start_pdf_pool() -> Optional[Pool]:
+    """Return this process's extraction pool, creating it on first use.
+
+    Workers come from a forkserver, so creating them is safe while other
+    threads run. gunicorn calls this once per worker at startup; elsewhere
+    the first PDF creates it. Returns None when extraction runs in-thread,
+    including after the pool could not be created in this process.
+    """
+    global _pool, _pool_pid, _documents, _pool_failed
+    workers = _settings()[0]
+    if workers <= 0 or _pool_failed or not _can_start_pool():
+        return None
+    with _pool_lock:
+        if _pool_failed:
+            return None
+        if _pool is None or _pool_pid != os.getpid():
+            try:
+                _pool = Pool(
+                    workers,
+                    initializer=_init_worker,
+                    context=multiprocessing.get_context("forkserver"),
+                )
+            except (OSError, ImportError) as exc:
+                print(f"PDF extraction pool unavailable, extracting in-thread: {exc}")
+                _pool = None
+                _pool_failed = True
+                return None
+            _pool_pid = os.getpid()
+            _documents = threading.BoundedSemaphore(
+                int(os.environ.get("PDF_EXTRACT_DOCUMENTS", "2"))
+            )
+        return _pool
+
+
+def _remaining(deadline: float) -> float:
+    return max(0.0, deadline - time.monotonic())
+
+
+def _extract_parallel(
+    pool: Pool,
+    contents: bytes,
+    max_pages: int,
+    page_timeout: float,
+    deadline: float,
+) -> List[PageResult]:
+    if not _documents.acquire(timeout=_remaining(deadline)):
+        return [(None, "document time budget exceeded")]
+    try:
+        # Only the workers parse the document: one of them counts the pages,
+        # then each worker that gets a page parses it once from the file and
+        # keeps the reader for later pages. Temporary names can be reused, so
+        # that cache is keyed by a fresh id.
+        document = uuid.uuid4().hex
+        with tempfile.NamedTemporaryFile(suffix=".pdf") as file:
+            file.write(contents)
+            file.flush()
+            try:
+                count = pool.apply_async(
+                    _count_pages, (document, file.name, page_timeout)
+                ).get(_remaining(deadline))
+            except multiprocessing.TimeoutError:
+                return [(None, "document time budget exceeded")]
+            if count is None:
+                return [(None, f"parsing exceeded {page_timeout:g}s")]
+            pending = [
+                pool.apply_async(
+                    _extract_page,
+                    (document, file.name, index, page_timeout, deadline),
+                )
+                for index in range(min(count, max_pages))
+            ]
+            results: List[PageResult] = []
+            for result in pending:
+                try:
+                    results.append(result.get(_remaining(deadline)))
+                except multiprocessing.TimeoutError:
+                    results.append((None, "document time budget exceeded"))
+            return results
+    finally:
+        _documents.release()
+
+
+def _extract_sequential(
+    reader, indexes: List[int], deadline: float
+) -> List[PageResult]:
+    # Without a worker process a running page cannot be interrupted (the
+    # alarm signal only reaches the main thread), so only the document
+    # budget is enforced, between pages.
+    results: List[PageResult] = []
+    for index in indexes:
+        if time.monotonic() >= deadline:
+            results.append((None, "document time budget exceeded"))
+            continue
+        try:
+            results.append((reader.pages[index].extract_text() or "", None))
+        except Exception as exc:
+            results.append((None, f"extraction failed ({type(exc).__name__})"))
+    return results
+
+
+def extract_pdf_pages(contents: bytes, max_pages: int = 25) -> List[PageResult]:
+    """Extract the text of the first `max_pages` pages, in page order.
+
+    Pages are parsed and extracted by this process's long-lived pool (see
+    start_pdf_pool; PDF_EXTRACT_WORKERS processes, by default the node's CPUs
+    split across server workers, at most 4), which at most
+    PDF_EXTRACT_DOCUMENTS documents use at a time. A page (or the parse that
+    counts the pages) taking longer than PDF_PAGE_TIMEOUT_SECONDS is
+    interrupted, and pages not finished within
+    PDF_DOCUMENT_TIMEOUT_SECONDS (waiting for the pool included) are
+    abandoned; both come back as (None, reason). Extraction runs in this
+    thread instead where forkserver is unavailable, the pool cannot be
+    created, or PDF_EXTRACT_WORKERS=0.
+    """
+    _, page_timeout, document_timeout = _settings()
+    deadline = time.monotonic() + document_timeout
+
+    pool = start_pdf_pool() if max_pages > 0 else None
+    if pool is not None:
+        return _extract_parallel(pool, contents, max_pages, page_timeout, deadline)
+
+    from pypdf import PdfReader
+
+    reader = PdfReader(BytesIO(contents))
+    indexes = list(range(min(len(reader.pages), max_pages)))
+    return _extract_sequential(reader, indexes, deadline)
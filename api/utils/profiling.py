@@ -0,0 +1,254 @@
+import asyncio
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Any, Callable, Dict, Iterator, List, Optional, Tuple, TypeVar
+
+from fastapi import HTTPException
+from starlette.requests import Request
+
+from .admin import require_admin
+from .metrics import metrics
+from .sessions import TTLStore
+
+T = TypeVar("T")
+
+LAG_BUCKETS = (1, 2, 5, 10, 25, 50, 100, 250, 500, 1000, 2500)
+
+Frame = Tuple[str, str, int]  # function, file, first line
+Stack = Tuple[Frame, ...]  # root first
+
+# Leaf frames in these modules mean the thread is parked, not working.
+_IDLE_MODULES = ("threading.py", "selectors.py", "queue.py")
+
+
+class LoopLagMonitor:
+    """Measures how late the event loop wakes up from a fixed-interval sleep.
+
+    Any lag beyond a few milliseconds means something ran on the loop thread
+    without yielding. Started lazily on the first request when
+    LOOP_LAG_INTERVAL_MS is set; off by default.
+    """
+
+    def __init__(self, interval: float) -> None:
+        self.interval = interval
+        self.task: Optional[asyncio.Task] = None
+
+    def ensure_started(self) -> None:
+        if self.task is not None and not self.task.done():
+            return
+        self.task = asyncio.get_running_loop().create_task(self._run())
+
+    async def _run(self) -> None:
+        loop = asyncio.get_running_loop()
+        while True:
+            started = loop.time()
+            await asyncio.sleep(self.interval)
+            lag = loop.time() - started - self.interval
+            metrics.observe(
+                "event_loop_lag_ms", max(lag, 0) * 1000, buckets=LAG_BUCKETS
+            )
+
+
+class SamplingProfiler:
+    """Samples the Python stacks of every working thread from a side thread.
+
+    Handlers run on the event loop thread while provider streams and file
+    analysis run in threadpool workers, so all threads are sampled; parked
+    threads are skipped. Concurrent requests show up in the same profile.
+    """
+
+    def __init__(self, interval: float, max_duration: float) -> None:
+        self.interval = interval
+        self.max_duration = max_duration
+        self.samples: "Counter[Tuple[str, Stack]]" = Counter()
+        self.started_at = 0.0
+        self.duration = 0.0
+        self.stopped = threading.Event()
+        self.thread: Optional[threading.Thread] = None
+
+    def start(self) -> None:
+        self.started_at = time.monotonic()
+        self.thread = threading.Thread(
+            target=self._run, name="sampling-profiler", daemon=True
+        )
+        self.thread.start()
+
+    def stop(self) -> None:
+        self.stopped.set()
+        if self.thread is not None:
+            self.thread.join()
+        self.duration = time.monotonic() - self.started_at
+
+    def _run(self) -> None:
+        own_id = threading.get_ident()
+        deadline = self.started_at + self.max_duration
+        while not self.stopped.wait(self.interval) and time.monotonic() < deadline:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own_id or frame.f_code.co_filename.endswith(
+                    _IDLE_MODULES
+                ):
+                    continue
+                stack: List[Frame] = []
+                while frame is not None:
+                    code = frame.f_code
+                    stack.append(
+                        (
+                            getattr(code, "co_qualname", code.co_name),
+                            code.co_filename,
+                            code.co_firstlineno,
+                        )
+                    )
+                    frame = frame.f_back
+                stack.reverse()
+                self.samples[(names.get(thread_id, str(thread_id)), tuple(stack))] += 1
+
+    def collapsed(self) -> str:
+        """Brendan Gregg's collapsed-stack format, one `a;b;c count` per line."""
+        lines = []
+        for (thread, stack), count in self.samples.most_common():
+            frames = ";".join(f"{name} ({path}:{line})" for name, path, line in stack)
+            lines.append(f"{thread};{frames} {count}")
+        return "\n".join(lines) + "\n"
+
+    def speedscope(self, name: str) -> Dict[str, Any]:
+        """A speedscope.app file with one sampled profile per thread."""
+        frame_index: Dict[Frame, int] = {}
+        frames: List[Dict[str, Any]] = []
+        profiles: Dict[str, Dict[str, Any]] = {}
+        weight = self.interval * 1000
+
+        for (thread, stack), count in self.samples.items():
+            indexes = []
+            for frame in stack:
+                if frame not in frame_index:
+                    frame_index[frame] = len(frames)
+                    frames.append(
+                        {"name": frame[0], "file": frame[1], "line": frame[2]}
+                    )
+                indexes.append(frame_index[frame])
+            profile = profiles.setdefault(
+                thread,
+                {
+                    "type": "sampled",
+                    "name": thread,
+                    "unit": "milliseconds",
+                    "startValue": 0,
+                    "endValue": 0,
+                    "samples": [],
+                    "weights": [],
+                },
+            )
+            profile["samples"].append(indexes)
+            profile["weights"].append(count * weight)
+            profile["endValue"] += count * weight
+
+        return {
+            "$schema": "https://www.speedscope.app/file-format-schema.json",
+            "name": name,
+            "exporter": "screen.vision",
+            "shared": {"frames": frames},
+            "profiles": list(profiles.values()),
+        }
+
+
+profiles: TTLStore[Tuple[str, SamplingProfiler]] = TTLStore(
+    ttl=int(os.environ.get("PROFILE_TTL_SECONDS", "600")),
+    max_entries=50,
+    sliding=False,
+)
+
+
+def _loop_lag_monitor() -> Optional[LoopLagMonitor]:
+    interval_ms = int(os.environ.get("LOOP_LAG_INTERVAL_MS", "0"))
+    return LoopLagMonitor(interval_ms / 1000) if interval_ms > 0 else None
+
+
+class ProfilingMiddleware:
+    """ASGI middleware behind the opt-in profiling surface.
+
+    Requests carrying `X-Profile: 1` and the admin bearer token are sampled
+    for as long as they run (streams included); the response carries an
+    `X-Profile-Id` to fetch from `/api/admin/profiles/{id}`. Without the
+    header the only cost is one scan of the request headers.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+        self.loop_lag = _loop_lag_monitor()
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        if self.loop_lag is not None:
+            self.loop_lag.ensure_started()
+
+        if not any(name == b"x-profile" for name, _ in scope["headers"]):
+            return await self.app(scope, receive, send)
+
+        try:
+            require_admin(Request(scope))
+        except HTTPException:
+            return await self.app(scope, receive, send)
+
+        profile_id = uuid.uuid4().hex
+        profiler = SamplingProfiler(
+            interval=int(os.environ.get("PROFILE_SAMPLE_MS", "5")) / 1000,
+            max_duration=int(os.environ.get("PROFILE_MAX_SECONDS", "60")),
+        )
+
+        async def send_with_id(message) -> None:
+            if message["type"] == "http.response.start":
+                headers = list(message.get("headers", []))
+                headers.append((b"x-profile-id", profile_id.encode("ascii")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        profiler.start()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            # Joining the sampler thread can take a whole sampling pass.
+            await asyncio.to_thread(profiler.stop)
+            profiles.set(profile_id, (f"{scope['method']} {scope['path']}", profiler))
+
+
+def cpu_accounted(route: str, frames: Iterator[T]) -> Iterator[T]:
+    """Yield from `frames`, charging the CPU time spent producing them to `route`.
+
+    `time.thread_time` is read around each step, so only the producing
+    thread's own work is counted even though steps may run on different
+    threadpool workers.
+    """
+    used = 0.0
+    try:
+        while True:
+            started = time.thread_time()
+            try:
+                frame = next(frames)
+            except StopIteration:
+                return
+            finally:
+                used += time.thread_time() - started
+            yield frame
+    finally:
+        close = getattr(frames, "close", None)
+        if close is not None:
+            close()
+        metrics.inc("route_cpu_seconds_total", {"route": route}, used)
+        metrics.observe("request_cpu_ms", used * 1000, {"route": route})
+
+
+def cpu_accounted_call(route: str, fn: Callable[[], T]) -> T:
+    """Run `fn` on the current thread and charge its CPU time to `route`."""
+    started = time.thread_time()
+    try:
+        return fn()
+    finally:
+        used = time.thread_time() - started
+        metrics.inc("route_cpu_seconds_total", {"route": route}, used)
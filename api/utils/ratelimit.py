@@ -0,0 +1,54 @@
+from typing import Dict, List, Optional
+
+from limits import RateLimitItem, parse_many
+from slowapi import Limiter
+from starlette.responses import JSONResponse
+
+from .tracing import child_span
+
+
+def first_exceeded(
+    limiter: Limiter, limits: List[RateLimitItem], *identifiers: str
+) -> Optional[RateLimitItem]:
+    """Count one hit against each limit; return the first one that is full."""
+    for item in limits:
+        if not limiter.limiter.hit(item, *identifiers):
+            return item
+    return None
+
+
+class RateLimitMiddleware:
+    """ASGI middleware applying per-client limits to the listed HTTP paths.
+
+    `routes` maps a path to a limit string such as "20/minute;300/hour".
+    Counters are kept in `limiter`'s storage and keyed by client address and
+    path; each check is recorded as a `rate_limit` span. Requests over a
+    limit get the same 429 body slowapi's handler sends.
+
+    With in-memory storage each server process keeps its own counters and
+    applies the full limit, so a client spread over N workers may get up to
+    N times the limit; a shared store (redis://) counts across workers.
+    """
+
+    def __init__(self, app, limiter: Limiter, routes: Dict[str, str]) -> None:
+        self.app = app
+        self.limiter = limiter
+        self.routes = {path: parse_many(value) for path, value in routes.items()}
+
+    async def __call__(self, scope, receive, send) -> None:
+        limits = self.routes.get(scope["path"]) if scope["type"] == "http" else None
+        if not limits or scope["method"] == "OPTIONS" or not self.limiter.enabled:
+            return await self.app(scope, receive, send)
+
+        client = scope.get("client")
+        key = client[0] if client else "127.0.0.1"
+        with child_span("rate_limit") as span:
+            exceeded = first_exceeded(self.limiter, limits, scope["path"], key)
+            span.set_attribute("rate_limit.exceeded", exceeded is not None)
+        if exceeded is None:
+            return await self.app(scope, receive, send)
+
+        response = JSONResponse(
+            {"error": f"Rate limit exceeded: {exceeded}"}, status_code=429
+        )
+        await response(scope, receive, send)
@@ -0,0 +1,179 @@
+import os
+import random
+import threading
+import time
+from typing import Any, Callable, Iterator, Optional
+
+from .metrics import metrics
+from .tracing import child_span
+
+RETRYABLE_STATUS_CODES = (408, 409, 429)
+
+
+def is_retryable_error(error: BaseException) -> bool:
+    """Connection failures, timeouts, 429s and 5xx responses are worth retrying."""
+    status = getattr(error, "status_code", None) or getattr(error, "code", None)
+    if isinstance(status, int):
+        return status in RETRYABLE_STATUS_CODES or status >= 500
+    # openai.APIConnectionError / APITimeoutError, httpx.TransportError, etc.
+    name = type(error).__name__
+    return isinstance(error, (ConnectionError, TimeoutError)) or name in (
+        "APIConnectionError",
+        "APITimeoutError",
+        "ConnectError",
+        "ConnectTimeout",
+        "ReadTimeout",
+        "RemoteProtocolError",
+    )
+
+
+class RetryBudget:
+    """Caps retries to a fraction of traffic.
+
+    Every request deposits `ratio` tokens (up to `max_tokens`) and every retry
+    spends one, so at steady state at most `ratio` of requests are retried.
+    """
+
+    def __init__(self, ratio: float = 0.1, max_tokens: float = 10.0) -> None:
+        self.ratio = ratio
+        self.max_tokens = max_tokens
+        self.tokens = max_tokens
+        self.lock = threading.Lock()
+
+    def deposit(self) -> None:
+        with self.lock:
+            self.tokens = min(self.max_tokens, self.tokens + self.ratio)
+
+    def withdraw(self) -> bool:
+        with self.lock:
+            if self.tokens < 1:
+                return False
+            self.tokens -= 1
+            return True
+
+
+retry_budget = RetryBudget(
+    ratio=float(os.environ.get("UPSTREAM_RETRY_BUDGET_RATIO", "0.1")),
+)
+
+
+class RetryingStream:
+    """Iterates a provider stream, reopening it on failures before the first chunk.
+
+    `open_stream` must return a fresh iterable of provider chunks each time it
+    is called. `open` runs the attempts up to the first chunk and raises the
+    last error if they all fail, so callers can still answer with an HTTP
+    error before any SSE output. Once a chunk has been yielded, errors
+    propagate unchanged so the SSE layer can report them.
+    """
+
+    def __init__(
+        self,
+        open_stream: Callable[[], Any],
+        endpoint: str,
+        max_attempts: int = 3,
+        base_delay: float = 0.25,
+        max_delay: float = 2.0,
+        deadline: Optional[float] = None,
+        budget: RetryBudget = retry_budget,
+        on_error: Optional[Callable[[BaseException], None]] = None,
+    ) -> None:
+        self.open_stream = open_stream
+        self.endpoint = endpoint
+        self.max_attempts = max_attempts
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        if deadline is None:
+            deadline = int(os.environ.get("UPSTREAM_RETRY_DEADLINE_MS", "20000")) / 1000
+        self.deadline = deadline
+        self.budget = budget
+        self.on_error = on_error
+        self.stream: Any = None
+        self.opened = False
+        self.iterator: Optional[Iterator[Any]] = None
+        self.first: Any = None
+
+    def close(self) -> None:
+        close = getattr(self.stream, "close", None)
+        if close is not None:
+            close()
+
+    def open(self) -> None:
+        """Open the provider stream and wait for its first chunk, retrying
+        retryable failures. Blocks, so call it from a worker thread."""
+        if self.opened:
+            return
+        labels = {"endpoint": self.endpoint}
+        deadline_at = time.monotonic() + self.deadline
+        self.budget.deposit()
+        attempt = 0
+
+        while True:
+            attempt += 1
+            try:
+                with child_span("upstream.connect", **{"upstream.attempt": attempt}):
+                    self.stream = self.open_stream()
+                with child_span("upstream.first_token"):
+                    iterator = iter(self.stream)
+                    first = next(iterator)
+                break
+            except StopIteration:
+                metrics.inc("upstream_requests_total", {**labels, "outcome": "empty"})
+                self.opened = True
+                self.open_stream = None
+                return
+            except Exception as error:
+                if self.on_error is not None:
+                    self.on_error(error)
+                delay = random.uniform(
+                    0, min(self.max_delay, self.base_delay * 2 ** (attempt - 1))
+                )
+                if (
+                    not is_retryable_error(error)
+                    or attempt >= self.max_attempts
+                    or time.monotonic() + delay >= deadline_at
+                ):
+                    metrics.inc(
+                        "upstream_requests_total", {**labels, "outcome": "failed"}
+                    )
+                    raise
+                if not self.budget.withdraw():
+                    metrics.inc(
+                        "upstream_requests_total",
+                        {**labels, "outcome": "budget_exhausted"},
+                    )
+                    raise
+                metrics.inc("upstream_retries_total", labels)
+                print(
+                    f"[{self.endpoint}] Upstream attempt {attempt} failed ({error!r}), retrying in {delay * 1000:.0f}ms"
+                )
+                time.sleep(delay)
+
+        metrics.inc(
+            "upstream_requests_total",
+            {**labels, "outcome": "ok" if attempt == 1 else "recovered"},
+        )
+
+        # The provider has the request now and it is never resent, so let go
+        # of everything that was needed to build it (screenshots included).
+        self.open_stream = None
+        self.opened = True
+        self.iterator = iterator
+        self.first = first
+
+    def __iter__(self) -> Iterator[Any]:
+        self.open()
+        iterator = self.iterator
+        if iterator is None:
+            return
+        first, self.first = self.first, None
+        self.iterator = None
+
+        yield first
+        try:
+            yield from iterator
+        except Exception as error:
+            if self.on_error is not None:
+                self.on_error(error)
+            metrics.inc("upstream_interrupted_total", {"endpoint": self.endpoint})
+            raise
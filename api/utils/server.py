@@ -0,0 +1,63 @@
+import os
+import signal
+import threading
+import time
+from typing import Optional
+
+from uvicorn_worker import UvicornWorker as _UvicornWorker
+
+
+class UvicornWorker(_UvicornWorker):
+    """Gunicorn worker running the app on uvloop with the httptools parser."""
+
+    CONFIG_KWARGS = {"loop": "uvloop", "http": "httptools"}
+
+
+def rss_bytes() -> Optional[int]:
+    """Current resident set size, or None where /proc is unavailable."""
+    try:
+        with open("/proc/self/statm") as statm:
+            return int(statm.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError, IndexError):
+        return None
+
+
+class MemoryWatchdog:
+    """Recycles a worker whose RSS grew past `max_growth` bytes since startup.
+
+    The worker sends itself SIGTERM, so uvicorn stops accepting connections,
+    lets in-flight streams finish within gunicorn's graceful timeout, and the
+    arbiter forks a fresh copy.
+    """
+
+    def __init__(self, max_growth: int, interval: float, log=None) -> None:
+        self.max_growth = max_growth
+        self.interval = interval
+        self.log = log
+        self.baseline: Optional[int] = None
+
+    def start(self) -> None:
+        if rss_bytes() is None:
+            return
+        threading.Thread(target=self._run, name="memory-watchdog", daemon=True).start()
+
+    def _run(self) -> None:
+        while True:
+            time.sleep(self.interval)
+            rss = rss_bytes()
+            if rss is None:
+                continue
+            # Measured after the first interval so start-up warm-up is excluded.
+            if self.baseline is None:
+                self.baseline = rss
+            if rss - self.baseline <= self.max_growth:
+                continue
+            if self.log is not None:
+                self.log.warning(
+                    "Worker %s RSS grew from %d MB to %d MB, recycling",
+                    os.getpid(),
+                    self.baseline >> 20,
+                    rss >> 20,
+                )
+            os.kill(os.getpid(), signal.SIGTERM)
+            return
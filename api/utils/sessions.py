@@ -0,0 +1,136 @@
+import threading
+import time
+from typing import Any, Callable, Dict, Generic, Optional, Tuple, TypeVar
+
+from .images import ImageBlob
+
+T = TypeVar("T")
+
+
+class TTLStore(Generic[T]):
+    """Small in-memory map whose entries expire after `ttl` seconds of disuse.
+
+    With `sliding=False` entries expire `ttl` seconds after they were set,
+    regardless of reads. Expired entries are swept lazily on access;
+    `on_expire` is called for each one so owners can release resources tied
+    to it.
+
+    With `sizeof`, the store also keeps `bytes_held` under `max_bytes` by
+    evicting the entries closest to expiry. Sizes are taken on `set`, so call
+    it again after growing a stored value.
+    """
+
+    def __init__(
+        self,
+        ttl: float,
+        max_entries: int = 10000,
+        on_expire: Optional[Callable[[str, T], None]] = None,
+        sliding: bool = True,
+        sizeof: Optional[Callable[[T], int]] = None,
+        max_bytes: Optional[int] = None,
+    ) -> None:
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.on_expire = on_expire
+        self.sliding = sliding
+        self.sizeof = sizeof
+        self.max_bytes = max_bytes
+        self.entries: Dict[str, Tuple[float, T]] = {}
+        self.sizes: Dict[str, int] = {}
+        self.bytes_held = 0
+        self.lock = threading.Lock()
+
+    def get(self, key: str) -> Optional[T]:
+        self.sweep()
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is None:
+                return None
+            value = entry[1]
+            if self.sliding:
+                self.entries[key] = (time.monotonic() + self.ttl, value)
+            return value
+
+    def set(self, key: str, value: T, ttl: Optional[float] = None) -> None:
+        self.sweep()
+        with self.lock:
+            if key not in self.entries and len(self.entries) >= self.max_entries:
+                self._expire(self._oldest(key))
+            expires_at = time.monotonic() + (self.ttl if ttl is None else ttl)
+            self.entries[key] = (expires_at, value)
+            if self.sizeof is not None:
+                size = self.sizeof(value)
+                self.bytes_held += size - self.sizes.get(key, 0)
+                self.sizes[key] = size
+                while (
+                    self.max_bytes is not None
+                    and self.bytes_held > self.max_bytes
+                    and len(self.entries) > 1
+                ):
+                    self._expire(self._oldest(key))
+
+    def pop(self, key: str) -> Optional[T]:
+        with self.lock:
+            entry = self.entries.pop(key, None)
+            self.bytes_held -= self.sizes.pop(key, 0)
+        return entry[1] if entry is not None else None
+
+    def sweep(self) -> None:
+        now = time.monotonic()
+        with self.lock:
+            expired = [
+                key
+                for key, (expires_at, _) in self.entries.items()
+                if expires_at <= now
+            ]
+            for key in expired:
+                self._expire(key)
+
+    def _oldest(self, keep: str) -> str:
+        return min(
+            (k for k in self.entries if k != keep), key=lambda k: self.entries[k][0]
+        )
+
+    def _expire(self, key: str) -> None:
+        _, value = self.entries.pop(key)
+        self.bytes_held -= self.sizes.pop(key, 0)
+        if self.on_expire is not None:
+            self.on_expire(key, value)
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class CheckSession:
+    """Per-socket state for the screen-check loop.
+
+    The before frame is kept decoded, once; after frames are not kept.
+    """
+
+    def __init__(self) -> None:
+        self.system_prompt: Optional[str] = None
+        self.before_frame: Optional[ImageBlob] = None
+
+    def size(self) -> int:
+        """Bytes held by this session, for the store's budget."""
+        frame = len(self.before_frame.data) if self.before_frame is not None else 0
+        return frame + len(self.system_prompt or "")
+
+    def clear(self) -> None:
+        self.system_prompt = None
+        self.before_frame = None
+
+    def messages(self, frame: ImageBlob) -> Any:
+        """Build the /api/check message list for a new "after" frame."""
+        return [
+            {"role": "system", "content": self.system_prompt},
+            {
+                "role": "user",
+                "content": [
+                    {"type": "text", "text": "Before:"},
+                    {"type": "image", "image": self.before_frame},
+                    {"type": "text", "text": "After:"},
+                    {"type": "image", "image": frame},
+                ],
+            },
+        ]
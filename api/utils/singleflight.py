@@ -0,0 +1,182 @@
+import asyncio
+import hashlib
+import json
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Union
+
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from .images import ImageBlob
+from .metrics import metrics
+
+_DONE = object()
+
+Source = Union[AsyncIterator[str], Any]
+
+
+def _key_default(value: Any) -> str:
+    # Binary image parts hash by content.
+    if isinstance(value, ImageBlob):
+        return value.fingerprint()
+    raise TypeError(f"Cannot key {type(value).__name__}")
+
+
+def request_key(endpoint: str, payload: Any) -> str:
+    """Hash an endpoint name and request payload into a single-flight key."""
+    digest = hashlib.sha256(endpoint.encode("utf-8"))
+    digest.update(
+        json.dumps(
+            payload, sort_keys=True, separators=(",", ":"), default=_key_default
+        ).encode("utf-8")
+    )
+    return digest.hexdigest()
+
+
+class _Subscriber:
+    __slots__ = ("queue", "detached")
+
+    def __init__(self, queue_size: int) -> None:
+        self.queue: asyncio.Queue = asyncio.Queue(maxsize=queue_size)
+        self.detached = False
+
+
+class Flight:
+    """One upstream SSE stream fanned out to every subscriber.
+
+    Frames already produced are replayed to late subscribers, after which each
+    subscriber receives new frames through its own bounded queue. The producer
+    never waits on a queue: a subscriber whose queue is full is detached and
+    reads on from the retained frames at its own pace, so one slow client
+    neither holds back the others nor grows memory beyond the stream itself.
+    """
+
+    def __init__(self, queue_size: int) -> None:
+        self.queue_size = queue_size
+        self.ready: asyncio.Future = asyncio.get_running_loop().create_future()
+        self.frames: List[str] = []
+        self.subscribers: List[_Subscriber] = []
+        self.readers = 0
+        self.advanced = asyncio.Event()
+        self.done = False
+        self.error: Optional[BaseException] = None
+        self.task: Optional[asyncio.Task] = None
+
+    def start(self, source: Source, on_done: Callable[[], None]) -> None:
+        self.task = asyncio.create_task(self._produce(source, on_done))
+
+    async def _produce(self, source: Source, on_done: Callable[[], None]) -> None:
+        iterator = (
+            source if hasattr(source, "__aiter__") else iterate_in_threadpool(source)
+        )
+        try:
+            async for frame in iterator:
+                self.frames.append(frame)
+                for subscriber in list(self.subscribers):
+                    self._deliver(subscriber, frame)
+                self._advance()
+        except asyncio.CancelledError:
+            self.error = RuntimeError("Upstream stream was cancelled")
+            raise
+        except Exception as error:
+            self.error = error
+        finally:
+            self.done = True
+            on_done()
+            try:
+                aclose = getattr(source, "aclose", None)
+                if aclose is not None:
+                    await aclose()
+                else:
+                    close = getattr(source, "close", None)
+                    if close is not None:
+                        close()
+            except Exception:
+                pass
+            for subscriber in list(self.subscribers):
+                self._deliver(subscriber, _DONE)
+            self._advance()
+
+    def _deliver(self, subscriber: _Subscriber, frame: Any) -> None:
+        try:
+            subscriber.queue.put_nowait(frame)
+        except asyncio.QueueFull:
+            subscriber.detached = True
+            self.subscribers.remove(subscriber)
+            metrics.inc("single_flight_detached_total")
+
+    def _advance(self) -> None:
+        # Wakes detached subscribers; each wait gets a fresh event.
+        self.advanced.set()
+        self.advanced = asyncio.Event()
+
+    async def subscribe(self) -> AsyncIterator[str]:
+        subscriber = _Subscriber(self.queue_size)
+        position = len(self.frames)
+        finished = self.done
+        if not finished:
+            self.subscribers.append(subscriber)
+        self.readers += 1
+        try:
+            for frame in self.frames[:position]:
+                yield frame
+            if not finished:
+                while not (subscriber.detached and subscriber.queue.empty()):
+                    frame = await subscriber.queue.get()
+                    if frame is _DONE:
+                        break
+                    position += 1
+                    yield frame
+                while subscriber.detached:
+                    while position < len(self.frames):
+                        position += 1
+                        yield self.frames[position - 1]
+                    if self.done:
+                        break
+                    await self.advanced.wait()
+            if self.error is not None:
+                raise self.error
+        finally:
+            self.readers -= 1
+            if subscriber in self.subscribers:
+                self.subscribers.remove(subscriber)
+            if not self.readers and not self.done and self.task is not None:
+                # Everyone went away, so stop paying for the upstream stream.
+                self.task.cancel()
+
+
+class SingleFlight:
+    """Coalesces identical concurrent requests onto a single upstream stream."""
+
+    def __init__(self, queue_size: int = 64) -> None:
+        self.queue_size = queue_size
+        self.flights: Dict[str, Flight] = {}
+
+    async def stream(self, key: str, factory: Callable[[], Any]) -> AsyncIterator[str]:
+        """Return the SSE frames for `key`, calling `factory` only if no identical
+        request is already in flight. `factory` may be sync or async."""
+        flight = self.flights.get(key)
+        if flight is not None:
+            await asyncio.shield(flight.ready)
+            return flight.subscribe()
+
+        flight = Flight(self.queue_size)
+        self.flights[key] = flight
+        try:
+            if asyncio.iscoroutinefunction(factory):
+                source = await factory()
+            else:
+                source = await run_in_threadpool(factory)
+        except BaseException as error:
+            self.flights.pop(key, None)
+            flight.ready.set_exception(error)
+            # Mark the exception as retrieved when there are no followers.
+            flight.ready.exception()
+            raise
+
+        subscription = flight.subscribe()
+        flight.ready.set_result(None)
+        flight.start(source, lambda: self._forget(key, flight))
+        return subscription
+
+    def _forget(self, key: str, flight: Flight) -> None:
+        if self.flights.get(key) is flight:
+            del self.flights[key]
@@ -0,0 +1,107 @@
+import asyncio
+import hashlib
+from typing import AsyncIterator, Awaitable, Callable, Optional, Tuple
+
+from .metrics import metrics
+from .sessions import TTLStore
+from .singleflight import Flight
+
+
+def prompt_hash(system_prompt: str) -> str:
+    return hashlib.sha256(system_prompt.encode("utf-8")).hexdigest()
+
+
+async def _frames(open_frames: Callable[[], Awaitable[AsyncIterator[str]]]):
+    frames = await open_frames()
+    try:
+        async for frame in frames:
+            yield frame
+    finally:
+        await frames.aclose()
+
+
+class SpeculativeSteps:
+    """Next-step generations started before the browser asks for them.
+
+    When a check confirms the current step, the step call for the same
+    session is started right away from the check's after-frame. The matching
+    /api/step call claims it and receives the frames produced so far followed
+    by the live stream. A speculation is only handed out when the step's
+    system prompt is the one it was started with, and is cancelled if nobody
+    claims it within `ttl` seconds.
+
+    Speculations live in the process that started them, so the claiming call
+    must reach the same process. With several server workers it usually does
+    not, and every speculation would be paid for and thrown away; the store is
+    then created with `enabled=False` and neither starts nor claims anything.
+    `speculative_step_hit_rate` (claimed / started) shows how much of the
+    speculative spend is used.
+    """
+
+    def __init__(self, ttl: float, enabled: bool = True) -> None:
+        self.enabled = enabled
+        self.entries: TTLStore[Tuple[str, Flight]] = TTLStore(
+            ttl, max_entries=1000, on_expire=self._expire, sliding=False
+        )
+        self.started = 0
+        self.claimed = 0
+
+    def start(
+        self,
+        session: str,
+        system_prompt: str,
+        open_frames: Callable[[], Awaitable[AsyncIterator[str]]],
+    ) -> None:
+        """Begin a speculation for `session`. Must be called on the event loop."""
+        if not self.enabled:
+            return
+        previous = self.entries.pop(session)
+        if previous is not None:
+            self._cancel(previous[1], "replaced")
+
+        flight = Flight(queue_size=64)
+        flight.start(_frames(open_frames), lambda: None)
+        self.entries.set(session, (prompt_hash(system_prompt), flight))
+        # Expiry is otherwise only noticed on the next access.
+        asyncio.get_running_loop().call_later(
+            self.entries.ttl + 0.1, self.entries.sweep
+        )
+        metrics.inc("speculative_steps_total", {"outcome": "started"})
+        self.started += 1
+        self._record_hit_rate()
+
+    def claim(self, session: str, system_prompt: str) -> Optional[AsyncIterator[str]]:
+        """Return the speculated frames for `session`, or None to generate afresh."""
+        if not self.enabled:
+            return None
+        entry = self.entries.pop(session)
+        if entry is None:
+            metrics.inc("speculative_step_claims_total", {"result": "miss"})
+            return None
+
+        digest, flight = entry
+        if digest != prompt_hash(system_prompt):
+            self._cancel(flight, "mismatched")
+            metrics.inc("speculative_step_claims_total", {"result": "miss"})
+            return None
+        if flight.done and flight.error is not None:
+            metrics.inc("speculative_steps_total", {"outcome": "failed"})
+            metrics.inc("speculative_step_claims_total", {"result": "miss"})
+            return None
+
+        metrics.inc("speculative_steps_total", {"outcome": "claimed"})
+        metrics.inc("speculative_step_claims_total", {"result": "hit"})
+        self.claimed += 1
+        self._record_hit_rate()
+        return flight.subscribe()
+
+    def _record_hit_rate(self) -> None:
+        metrics.gauge("speculative_step_hit_rate", self.claimed / self.started)
+
+    def _expire(self, session: str, entry: Tuple[str, Flight]) -> None:
+        self._cancel(entry[1], "expired")
+
+    def _cancel(self, flight: Flight, outcome: str) -> None:
+        if flight.task is not None and not flight.done:
+            flight.task.cancel()
+        metrics.inc("speculative_steps_total", {"outcome": outcome})
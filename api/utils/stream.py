@@ -2,11 +2,34 @@ import json
 import time
 import traceback
 import uuid
-from typing import Any, Callable, Dict, Mapping, Optional, Sequence
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    Mapping,
+    Optional,
+    Sequence,
+)
 
 from fastapi.responses import StreamingResponse
 from openai import OpenAI
 from openai.types.chat import ChatCompletion
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+from .extract import StreamExtractor
+from .tool_runtime import ToolCallBatch, tool_runtime
+
+# Sent when a stream fails after its first frame; lib/ai.ts readStream throws
+# on it so the caller retries.
+STREAM_ERROR_FRAME = (
+    'data: {"type":"error","errorText":"The model stream was interrupted"}\n\n'
+)
+
+
+def format_sse(payload: dict) -> str:
+    return f"data: {json.dumps(payload, separators=(',', ':'))}\n\n"
 
 
 def stream_text(
@@ -14,16 +37,21 @@ def stream_text(
     available_tools: Mapping[str, Callable[..., Any]],
     endpoint_name: Optional[str] = None,
     start_time: Optional[float] = None,
+    extractor: Optional[StreamExtractor] = None,
 ):
-    """Yield Server-Sent Events for a streaming chat completion."""
+    """Yield Server-Sent Events for a streaming chat completion.
+
+    When an `extractor` is given, every text delta is fed to it and the first
+    structured result is emitted as its own event. The upstream stream is then
+    closed once the extractor's grace period has elapsed. Tool calls are
+    yielded as a `ToolCallBatch`, so consume the frames through
+    `resolve_tool_calls`.
+    """
     try:
         if start_time is None:
             start_time = time.time()
         first_chunk_logged = False
 
-        def format_sse(payload: dict) -> str:
-            return f"data: {json.dumps(payload, separators=(',', ':'))}\n\n"
-
         message_id = f"msg-{uuid.uuid4().hex}"
         text_stream_id = "text-1"
         text_started = False
@@ -31,6 +59,8 @@ def stream_text(
         finish_reason = None
         usage_data = None
         tool_calls_state: Dict[int, Dict[str, Any]] = {}
+        extracted = None
+        cutoff_at = None
 
         yield format_sse({"type": "start", "messageId": message_id})
 
@@ -61,6 +91,14 @@ def stream_text(
                         }
                     )
 
+                    if extractor is not None and extracted is None:
+                        extracted = extractor.feed(delta.content)
+                        if extracted is not None:
+                            yield format_sse(
+                                {"type": extractor.event_type, "data": extracted}
+                            )
+                            cutoff_at = time.time() + extractor.grace_seconds
+
                 if delta.tool_calls:
                     for tool_call_delta in delta.tool_calls:
                         index = tool_call_delta.index
@@ -136,11 +174,24 @@ def stream_text(
             if not chunk.choices and chunk.usage is not None:
                 usage_data = chunk.usage
 
+            if cutoff_at is not None and time.time() >= cutoff_at:
+                finish_reason = "stop"
+                close = getattr(stream, "close", None)
+                if close is not None:
+                    close()
+                break
+
+        if extractor is not None and extracted is None:
+            extracted = extractor.finish()
+            if extracted is not None:
+                yield format_sse({"type": extractor.event_type, "data": extracted})
+
         if finish_reason == "stop" and text_started and not text_finished:
             yield format_sse({"type": "text-end", "id": text_stream_id})
             text_finished = True
 
         if finish_reason == "tool_calls":
+            pending_calls = []
             for index in sorted(tool_calls_state.keys()):
                 state = tool_calls_state[index]
                 tool_call_id = state.get("id")
@@ -196,24 +247,13 @@ def stream_text(
                     )
                     continue
 
-                try:
-                    tool_result = tool_function(**parsed_arguments)
-                except Exception as error:
-                    yield format_sse(
-                        {
-                            "type": "tool-output-error",
-                            "toolCallId": tool_call_id,
-                            "errorText": str(error),
-                        }
-                    )
-                else:
-                    yield format_sse(
-                        {
-                            "type": "tool-output-available",
-                            "toolCallId": tool_call_id,
-                            "output": tool_result,
-                        }
-                    )
+                pending_calls.append(
+                    (tool_call_id, tool_name, tool_function, parsed_arguments)
+                )
+
+            # Run by resolve_tool_calls on the event loop; see ToolCallBatch.
+            if pending_calls:
+                yield ToolCallBatch(pending_calls)
 
         if text_started and not text_finished:
             yield format_sse({"type": "text-end", "id": text_stream_id})
@@ -245,4 +285,45 @@ def stream_text(
         yield "data: [DONE]\n\n"
     except Exception:
         traceback.print_exc()
-        raise
+        # Headers are already sent, so report the failure in-band. Provider
+        # messages stay in the server log.
+        yield STREAM_ERROR_FRAME
+        yield "data: [DONE]\n\n"
+
+
+async def resolve_tool_calls(frames: Iterator[Any]) -> AsyncIterator[str]:
+    """Iterate a sync SSE generator from async code, running its tool calls.
+
+    Frames are pulled on threadpool workers. A `ToolCallBatch` from
+    `stream_text` is run concurrently by the tool runtime and awaited here,
+    and each result is emitted as its call finishes.
+    """
+    try:
+        async for frame in iterate_in_threadpool(frames):
+            if not isinstance(frame, ToolCallBatch):
+                yield frame
+                continue
+            async for tool_call_id, ok, tool_result in tool_runtime.run(frame.calls):
+                if not ok:
+                    yield format_sse(
+                        {
+                            "type": "tool-output-error",
+                            "toolCallId": tool_call_id,
+                            "errorText": str(tool_result),
+                        }
+                    )
+                else:
+                    yield format_sse(
+                        {
+                            "type": "tool-output-available",
+                            "toolCallId": tool_call_id,
+                            "output": tool_result,
+                        }
+                    )
+    finally:
+        close = getattr(frames, "close", None)
+        if close is not None:
+            try:
+                await run_in_threadpool(close)
+            except Exception:
+                pass
@@ -0,0 +1,163 @@
+import asyncio
+import json
+import os
+import threading
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from opentelemetry import context as otel_context
+from opentelemetry.context import Context
+
+from .sessions import TTLStore
+from .tracing import child_span
+
+ToolCall = Tuple[str, str, Callable[..., Any], Dict[str, Any]]
+
+
+class ToolCallBatch:
+    """The tool calls of one model turn, yielded by a sync SSE generator.
+
+    The generator cannot wait for tools without holding its threadpool
+    worker, so it hands them to the async consumer (`resolve_tool_calls` in
+    stream.py) to run.
+    """
+
+    __slots__ = ("calls",)
+
+    def __init__(self, calls: List[ToolCall]) -> None:
+        self.calls = calls
+
+
+def tool(
+    cache_ttl: float = 0.0,
+    normalize: Optional[Callable[[Dict[str, Any]], Dict[str, Any]]] = None,
+):
+    """Mark a tool's caching policy.
+
+    Results are cached for `cache_ttl` seconds, keyed by tool name plus the
+    arguments after `normalize` (e.g. rounding coordinates so nearby calls
+    share an entry).
+    """
+
+    def decorate(function: Callable[..., Any]) -> Callable[..., Any]:
+        function.cache_ttl = cache_ttl
+        function.normalize_arguments = normalize
+        return function
+
+    return decorate
+
+
+class ToolRuntime:
+    """Runs the tool calls of one model turn concurrently.
+
+    Async tools run on a shared background event loop and sync tools in its
+    default executor. Every call is bounded by `timeout`, and results are
+    yielded in completion order so slow tools do not delay fast ones. The
+    caller awaits them on its own event loop, so no server thread waits for
+    a tool.
+    """
+
+    def __init__(self, timeout: float = 10.0) -> None:
+        self.timeout = timeout
+        self.cache: TTLStore[Any] = TTLStore(ttl=0, max_entries=1000, sliding=False)
+        self.loop: Optional[asyncio.AbstractEventLoop] = None
+        self.loop_pid: Optional[int] = None
+        self.lock = threading.Lock()
+
+    def _ensure_loop(self) -> asyncio.AbstractEventLoop:
+        with self.lock:
+            # Started lazily and per process so forked workers get their own loop.
+            if self.loop is None or self.loop_pid != os.getpid():
+                loop = asyncio.new_event_loop()
+                thread = threading.Thread(
+                    target=loop.run_forever, name="tool-runtime", daemon=True
+                )
+                thread.start()
+                self.loop = loop
+                self.loop_pid = os.getpid()
+            return self.loop
+
+    def _cache_key(
+        self, name: str, function: Callable[..., Any], arguments: Dict[str, Any]
+    ) -> Optional[str]:
+        if not getattr(function, "cache_ttl", 0):
+            return None
+        normalize = getattr(function, "normalize_arguments", None)
+        if normalize is not None:
+            arguments = normalize(arguments)
+        return f"{name}:{json.dumps(arguments, sort_keys=True, default=str)}"
+
+    async def _invoke(
+        self,
+        name: str,
+        function: Callable[..., Any],
+        arguments: Dict[str, Any],
+        parent: Context,
+    ) -> Any:
+        # Runs on the runtime's own loop, so the caller's context is passed in.
+        token = otel_context.attach(parent)
+        try:
+            with child_span(f"tool {name}", **{"tool.name": name}) as span:
+                return await self._invoke_cached(name, function, arguments, span)
+        finally:
+            otel_context.detach(token)
+
+    async def _invoke_cached(
+        self, name: str, function: Callable[..., Any], arguments: Dict[str, Any], span
+    ) -> Any:
+        key = self._cache_key(name, function, arguments)
+        if key is not None:
+            cached = self.cache.get(key)
+            span.set_attribute("tool.cache_hit", cached is not None)
+            if cached is not None:
+                return cached
+
+        if asyncio.iscoroutinefunction(function):
+            call = function(**arguments)
+        else:
+            call = asyncio.get_running_loop().run_in_executor(
+                None, lambda: function(**arguments)
+            )
+        try:
+            result = await asyncio.wait_for(call, self.timeout)
+        except asyncio.TimeoutError:
+            raise TimeoutError(f"Tool '{name}' timed out after {self.timeout:g}s")
+
+        if key is not None and result is not None:
+            self.cache.set(key, result, ttl=function.cache_ttl)
+        return result
+
+    async def run(self, calls: List[ToolCall]) -> AsyncIterator[Tuple[str, bool, Any]]:
+        """Yield `(tool_call_id, ok, result_or_error)` as each call finishes."""
+        if not calls:
+            return
+        loop = self._ensure_loop()
+        parent = otel_context.get_current()
+        futures = {
+            asyncio.wrap_future(
+                asyncio.run_coroutine_threadsafe(
+                    self._invoke(name, function, arguments, parent), loop
+                )
+            ): tool_call_id
+            for tool_call_id, name, function, arguments in calls
+        }
+        pending = set(futures)
+        try:
+            while pending:
+                done, pending = await asyncio.wait(
+                    pending, return_when=asyncio.FIRST_COMPLETED
+                )
+                for future in [future for future in futures if future in done]:
+                    tool_call_id = futures[future]
+                    try:
+                        yield tool_call_id, True, future.result()
+                    except Exception as error:
+                        yield tool_call_id, False, error
+        finally:
+            # The consumer went away; stop the calls nobody will read.
+            for future in pending:
+                future.cancel()
+
+
+tool_runtime = ToolRuntime(
+    timeout=int(os.environ.get("TOOL_TIMEOUT_MS", "10000")) / 1000
+)
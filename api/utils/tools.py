@@ -1,13 +1,29 @@
-import requests
+import os
 
+import httpx
 
-def get_current_weather(latitude, longitude):
+from .tool_runtime import tool
+
+OPEN_METEO_URL = os.environ.get("OPEN_METEO_URL", "https://api.open-meteo.com")
+
+
+def _round_coordinates(arguments):
+    # ~1km precision is plenty for a forecast and lets nearby lookups share a cache entry.
+    return {
+        "latitude": round(float(arguments["latitude"]), 2),
+        "longitude": round(float(arguments["longitude"]), 2),
+    }
+
+
+@tool(cache_ttl=600, normalize=_round_coordinates)
+async def get_current_weather(latitude, longitude):
     # Format the URL with proper parameter substitution
-    url = f"https://api.open-meteo.com/v1/forecast?latitude={latitude}&longitude={longitude}&current=temperature_2m&hourly=temperature_2m&daily=sunrise,sunset&timezone=auto"
+    url = f"{OPEN_METEO_URL}/v1/forecast?latitude={latitude}&longitude={longitude}&current=temperature_2m&hourly=temperature_2m&daily=sunrise,sunset&timezone=auto"
 
     try:
         # Make the API call
-        response = requests.get(url)
+        async with httpx.AsyncClient(timeout=5.0) as client:
+            response = await client.get(url)
 
         # Raise an exception for bad status codes
         response.raise_for_status()
@@ -15,7 +31,7 @@ def get_current_weather(latitude, longitude):
         # Return the JSON response
         return response.json()
 
-    except requests.RequestException as e:
+    except httpx.HTTPError as e:
         # Handle any errors that occur during the request
         print(f"Error fetching weather data: {e}")
         return None
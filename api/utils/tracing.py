@@ -0,0 +1,188 @@
+import contextlib
+import functools
+import os
+from typing import Any, Callable, Iterator, Optional, TypeVar
+
+from opentelemetry import context as otel_context
+from opentelemetry import trace
+from opentelemetry.propagate import extract
+from opentelemetry.trace import SpanKind, Status, StatusCode
+
+T = TypeVar("T")
+
+
+def _provider_from_env() -> Optional[Any]:
+    """Build the SDK tracer provider, or None when tracing is off.
+
+    Spans are batched to an OTLP/HTTP collector at TRACE_EXPORT_URL (its
+    /v1/traces endpoint) and/or appended to TRACE_EXPORT_FILE, one JSON span
+    per line. Requests are sampled at TRACE_SAMPLE_RATE, decided from the
+    trace id. An incoming `traceparent` only supplies the trace and parent
+    ids; its sampled flag is honoured only with TRACE_TRUST_PARENT=1 (for
+    callers behind our own proxy), so browsers cannot opt themselves in.
+    """
+    url = os.environ.get("TRACE_EXPORT_URL")
+    path = os.environ.get("TRACE_EXPORT_FILE")
+    if not url and not path:
+        return None
+
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor
+    from opentelemetry.sdk.trace.sampling import ParentBased, TraceIdRatioBased
+
+    ratio = TraceIdRatioBased(float(os.environ.get("TRACE_SAMPLE_RATE", "1")))
+    if os.environ.get("TRACE_TRUST_PARENT") == "1":
+        sampler = ParentBased(root=ratio)
+    else:
+        sampler = ParentBased(
+            root=ratio, remote_parent_sampled=ratio, remote_parent_not_sampled=ratio
+        )
+    provider = TracerProvider(
+        resource=Resource.create({"service.name": "screen-vision-api"}),
+        sampler=sampler,
+    )
+    # BatchSpanProcessor restarts its export thread in forked workers.
+    if url:
+        from opentelemetry.exporter.otlp.proto.http.trace_exporter import (
+            OTLPSpanExporter,
+        )
+
+        provider.add_span_processor(BatchSpanProcessor(OTLPSpanExporter(url)))
+    if path:
+        from opentelemetry.sdk.trace.export import ConsoleSpanExporter
+
+        provider.add_span_processor(
+            BatchSpanProcessor(
+                ConsoleSpanExporter(
+                    out=open(path, "a"),
+                    formatter=lambda span: span.to_json(indent=None) + "\n",
+                )
+            )
+        )
+    return provider
+
+
+_provider = _provider_from_env()
+tracer = (
+    _provider.get_tracer("screen.vision")
+    if _provider is not None
+    else trace.NoOpTracer()
+)
+
+
+@contextlib.contextmanager
+def child_span(name: str, **attributes: Any) -> Iterator[Any]:
+    """Run the block in a child span of the current one.
+
+    Outside a recorded request no span is started, so work done off the
+    request path never opens a trace of its own.
+    """
+    if not trace.get_current_span().is_recording():
+        yield trace.INVALID_SPAN
+        return
+    with tracer.start_as_current_span(name, attributes=attributes) as span:
+        yield span
+
+
+def traced(name: str) -> Callable[[Callable[..., T]], Callable[..., T]]:
+    """Decorator running a function in a child span named `name`."""
+
+    def decorate(function: Callable[..., T]) -> Callable[..., T]:
+        @functools.wraps(function)
+        def wrapper(*args: Any, **kwargs: Any) -> T:
+            with child_span(name):
+                return function(*args, **kwargs)
+
+        return wrapper
+
+    return decorate
+
+
+def traced_frames(frames: Iterator[Any], name: str = "sse.stream") -> Iterator[Any]:
+    """Yield SSE frames inside a span that ends when the stream is closed."""
+    if not trace.get_current_span().is_recording():
+        yield from frames
+        return
+
+    span = tracer.start_span(name)
+    count = size = 0
+    try:
+        for frame in frames:
+            if count == 0:
+                span.add_event("first_frame")
+            count += 1
+            # Tool call batches pass through on their way to resolve_tool_calls.
+            size += len(frame) if isinstance(frame, str) else 0
+            yield frame
+    except GeneratorExit:
+        span.set_attribute("sse.closed_early", True)
+        raise
+    except BaseException as error:
+        span.record_exception(error)
+        span.set_status(Status(StatusCode.ERROR, str(error)))
+        raise
+    finally:
+        span.set_attribute("sse.frames", count)
+        span.set_attribute("sse.bytes", size)
+        span.end()
+
+
+class TracingMiddleware:
+    """ASGI middleware opening the server span of every HTTP request.
+
+    The span continues the caller's `traceparent`, stays open until the
+    response body has been fully sent, so it covers the whole SSE stream,
+    and its trace id is returned in `X-Trace-Id` when sampled.
+    """
+
+    def __init__(self, app) -> None:
+        self.app = app
+
+    async def __call__(self, scope, receive, send) -> None:
+        if scope["type"] != "http" or _provider is None:
+            return await self.app(scope, receive, send)
+
+        carrier = {
+            name.decode("latin-1"): value.decode("latin-1")
+            for name, value in scope["headers"]
+            if name == b"traceparent"
+        }
+        span = tracer.start_span(
+            f"{scope['method']} {scope['path']}",
+            context=extract(carrier),
+            kind=SpanKind.SERVER,
+            attributes={
+                "http.request.method": scope["method"],
+                "url.path": scope["path"],
+            },
+        )
+        if not span.is_recording():
+            return await self.app(scope, receive, send)
+
+        async def send_traced(message) -> None:
+            if message["type"] == "http.response.start":
+                status = message["status"]
+                span.set_attribute("http.response.status_code", status)
+                if status >= 500:
+                    span.set_status(Status(StatusCode.ERROR))
+                trace_id = f"{span.get_span_context().trace_id:032x}"
+                headers = list(message.get("headers", []))
+                headers.append((b"x-trace-id", trace_id.encode("ascii")))
+                message = {**message, "headers": headers}
+            await send(message)
+
+        token = otel_context.attach(trace.set_span_in_context(span))
+        try:
+            await self.app(scope, receive, send_traced)
+        except BaseException as error:
+            span.record_exception(error)
+            span.set_status(Status(StatusCode.ERROR, str(error)))
+            raise
+        finally:
+            otel_context.detach(token)
+            route = getattr(scope.get("route"), "path", None)
+            if route is not None:
+                span.update_name(f"{scope['method']} {route}")
+                span.set_attribute("http.route", route)
+            span.end()
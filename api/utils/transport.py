@@ -0,0 +1,179 @@
+from typing import Any, Dict, List, Optional, Type, TypeVar, Union
+
+import msgspec
+from fastapi import Request
+from fastapi.exceptions import RequestValidationError
+from pydantic import BaseModel, ValidationError
+from starlette.datastructures import UploadFile
+
+from .images import Base64Image, ImageBlob
+from .tracing import child_span, traced
+
+ModelT = TypeVar("ModelT", bound=BaseModel)
+
+# The JSON payload part may be large when it still carries data URLs.
+MAX_PAYLOAD_PART_BYTES = 32 * 1024 * 1024
+
+
+# The shape the browser sends. Anything else (another part type, an extra
+# field, tool calls) fails this schema and the messages are decoded
+# generically instead, so nothing is rejected or dropped.
+class _ImageUrl(msgspec.Struct, forbid_unknown_fields=True):
+    url: msgspec.Raw
+
+
+class _TextPart(
+    msgspec.Struct, tag="text", tag_field="type", forbid_unknown_fields=True
+):
+    text: str = ""
+
+
+class _ImageUrlPart(
+    msgspec.Struct, tag="image_url", tag_field="type", forbid_unknown_fields=True
+):
+    image_url: _ImageUrl
+
+
+class _ImageRefPart(
+    msgspec.Struct, tag="image", tag_field="type", forbid_unknown_fields=True
+):
+    id: str
+
+
+class _Message(msgspec.Struct, forbid_unknown_fields=True):
+    role: str
+    content: Union[str, None, List[Union[_TextPart, _ImageUrlPart, _ImageRefPart]]] = ""
+
+
+_top_level_decoder = msgspec.json.Decoder(Dict[str, msgspec.Raw])
+_messages_decoder = msgspec.json.Decoder(List[_Message])
+
+
+def _validation_error(loc: tuple, msg: str, error_type: str = "value_error"):
+    return RequestValidationError(
+        [{"type": error_type, "loc": loc, "msg": msg, "input": None}]
+    )
+
+
+def _image_url_part(raw: msgspec.Raw) -> Any:
+    """Keep base64 data URLs as views into the request buffer."""
+    view = memoryview(raw)
+    head = bytes(view[:128])
+    comma = head.find(b",")
+    if head.startswith(b'"data:image/') and comma != -1 and view[-1:] == b'"':
+        mime_type = head[6:comma].split(b";")[0].decode("ascii")
+        return {"type": "image", "image": Base64Image(view[comma + 1 : -1], mime_type)}
+    return {"type": "image_url", "image_url": {"url": msgspec.json.decode(raw)}}
+
+
+def _image(images: Optional[Dict[str, ImageBlob]], image_id: Any) -> ImageBlob:
+    image = (images or {}).get(image_id)
+    if image is None:
+        raise _validation_error(
+            ("body", "messages"), f"No image part named '{image_id}'", "missing"
+        )
+    return image
+
+
+def _resolve_image_parts(messages: Any, images: Optional[Dict[str, ImageBlob]]) -> Any:
+    """Swap upload references in generically decoded messages for the uploads."""
+    for message in messages if isinstance(messages, list) else ():
+        content = message.get("content") if isinstance(message, dict) else None
+        for index, part in enumerate(content if isinstance(content, list) else ()):
+            if isinstance(part, dict) and part.get("type") == "image" and "id" in part:
+                content[index] = {"type": "image", "image": _image(images, part["id"])}
+    return messages
+
+
+def _convert_messages(
+    messages: List[_Message], images: Optional[Dict[str, ImageBlob]]
+) -> List[Any]:
+    converted = []
+    for message in messages:
+        content = message.content
+        if content is not None and not isinstance(content, str):
+            parts = []
+            for part in content:
+                if isinstance(part, _TextPart):
+                    parts.append({"type": "text", "text": part.text})
+                elif isinstance(part, _ImageUrlPart):
+                    parts.append(_image_url_part(part.image_url.url))
+                else:
+                    parts.append({"type": "image", "image": _image(images, part.id)})
+            content = parts
+        converted.append({"role": message.role, "content": content})
+    return converted
+
+
+@traced("decode_body")
+def decode_body(
+    data: bytes, model: Type[ModelT], images: Optional[Dict[str, ImageBlob]] = None
+) -> ModelT:
+    """Decode a JSON chat body without a generic parse of the message payload.
+
+    `messages` is decoded with a typed msgspec schema and screenshots stay as
+    zero-copy views into `data`. Messages outside that schema are decoded
+    generically, as FastAPI would have. The remaining small top-level fields
+    are validated by `model` as usual.
+    """
+    try:
+        fields = _top_level_decoder.decode(data)
+        raw_messages = fields.pop("messages", None)
+        if raw_messages is None:
+            raise _validation_error(("body", "messages"), "Field required", "missing")
+        try:
+            messages = _convert_messages(_messages_decoder.decode(raw_messages), images)
+        except msgspec.ValidationError:
+            messages = _resolve_image_parts(msgspec.json.decode(raw_messages), images)
+        payload = {key: msgspec.json.decode(value) for key, value in fields.items()}
+    except msgspec.ValidationError as error:
+        raise _validation_error(("body", "messages"), str(error))
+    except msgspec.DecodeError as error:
+        raise _validation_error(("body",), f"Invalid JSON: {error}", "json_invalid")
+
+    payload["messages"] = messages
+    try:
+        return model.model_validate(payload)
+    except ValidationError as error:
+        raise RequestValidationError(error.errors(include_url=False))
+
+
+async def read_body(request: Request, model: Type[ModelT]) -> ModelT:
+    """Parse a chat request body sent either as JSON or as multipart.
+
+    The multipart form carries the usual JSON body in a `payload` field and
+    every screenshot as a raw file part. Message content references an upload
+    with `{"type": "image", "id": "<field name>"}`.
+    """
+    content_type = request.headers.get("content-type", "")
+    with child_span("read_body", **{"http.request.content_type": content_type}):
+        return await _read_body(request, model, content_type)
+
+
+async def _read_body(
+    request: Request, model: Type[ModelT], content_type: str
+) -> ModelT:
+    if not content_type.startswith("multipart/form-data"):
+        # Read the stream directly: `request.body()` would cache the raw bytes
+        # on the request until the whole streamed response has been sent.
+        return decode_body(b"".join([chunk async for chunk in request.stream()]), model)
+
+    images: Dict[str, ImageBlob] = {}
+    payload: Optional[bytes] = None
+    # Leaving the block closes the spooled upload buffers.
+    async with request.form(max_part_size=MAX_PAYLOAD_PART_BYTES) as form:
+        for name, value in form.multi_items():
+            if isinstance(value, UploadFile):
+                data = await value.read()
+                if name == "payload":
+                    payload = data
+                else:
+                    images[name] = ImageBlob(
+                        data, value.content_type or "application/octet-stream"
+                    )
+            elif name == "payload":
+                payload = value.encode("utf-8")
+
+    if payload is None:
+        raise _validation_error(("body", "payload"), "Field required", "missing")
+    return decode_body(payload, model, images)
@@ -0,0 +1,303 @@
+import datetime
+import posixpath
+import re
+import zipfile
+from io import BytesIO
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+from xml.etree.ElementTree import iterparse
+
+_MAIN = "{http://schemas.openxmlformats.org/spreadsheetml/2006/main}"
+_REL = "{http://schemas.openxmlformats.org/officeDocument/2006/relationships}"
+_PKG_REL = "{http://schemas.openxmlformats.org/package/2006/relationships}"
+
+_WORKSHEET_TYPE = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships/worksheet"
+)
+_SHARED_STRINGS_TYPE = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships/sharedStrings"
+)
+_STYLES_TYPE = (
+    "http://schemas.openxmlformats.org/officeDocument/2006/relationships/styles"
+)
+
+# Built-in number formats that display dates or times (ECMA-376 18.8.30).
+_BUILTIN_DATE_FORMATS = set(range(14, 23)) | {45, 46, 47}
+_BUILTIN_TIMEDELTA_FORMATS = {46}
+
+_FORMAT_LITERALS = re.compile(r"\[(?!(hh?|mm?|ss?)\])[^\]]*\]|\"[^\"]*\"|\\.|_.|\*.")
+_DATE_TOKENS = re.compile(r"(?<![_\\])[dmhysDMHYS]")
+_TIMEDELTA_TOKENS = re.compile(r"\[(hh?|mm?|ss?)\]")
+_CELL_REFERENCE = re.compile(r"([A-Z]+)(\d+)")
+
+_WINDOWS_EPOCH = datetime.datetime(1899, 12, 30)
+_MAC_EPOCH = datetime.datetime(1904, 1, 1)
+
+Cell = Tuple[Optional[str], Optional[str], int]  # type, raw value, style index
+
+
+class UnsupportedWorkbook(Exception):
+    """The workbook needs the full openpyxl reader."""
+
+
+def _column_index(letters: str) -> int:
+    index = 0
+    for letter in letters:
+        index = index * 26 + ord(letter) - 64
+    return index
+
+
+def _is_date_format(code: str) -> bool:
+    return _DATE_TOKENS.search(_FORMAT_LITERALS.sub("", code.split(";")[0])) is not None
+
+
+def _from_excel(value: float, epoch: datetime.datetime, timedelta: bool):
+    # Mirrors openpyxl.utils.datetime.from_excel so both readers agree.
+    if timedelta:
+        return datetime.timedelta(microseconds=round(value * 86400 * 1000000))
+    day, fraction = divmod(value, 1)
+    diff = datetime.timedelta(milliseconds=round(fraction * 86400 * 1000))
+    if 0 <= value < 1 and diff.days == 0:
+        minutes, seconds = divmod(diff.seconds, 60)
+        hours, minutes = divmod(minutes, 60)
+        return datetime.time(hours, minutes, seconds, diff.microseconds)
+    if 0 < value < 60 and epoch == _WINDOWS_EPOCH:
+        day += 1
+    return epoch + datetime.timedelta(days=day) + diff
+
+
+def _number(raw: str):
+    if "." in raw or "E" in raw or "e" in raw:
+        return float(raw)
+    return int(raw)
+
+
+def _relationships(archive: zipfile.ZipFile, part: str) -> Dict[str, Tuple[str, str]]:
+    """Map relationship ids of `part` to (type, archive path)."""
+    folder, name = posixpath.split(part)
+    rels_path = posixpath.join(folder, "_rels", f"{name}.rels")
+    relationships = {}
+    with archive.open(rels_path) as file:
+        for _, element in iterparse(file):
+            if element.tag != f"{_PKG_REL}Relationship":
+                continue
+            target = element.get("Target", "")
+            if element.get("TargetMode") == "External":
+                continue
+            path = (
+                target.lstrip("/")
+                if target.startswith("/")
+                else posixpath.normpath(posixpath.join(folder, target))
+            )
+            relationships[element.get("Id")] = (element.get("Type"), path)
+    return relationships
+
+
+class _Workbook:
+    def __init__(self, archive: zipfile.ZipFile) -> None:
+        self.archive = archive
+        self.relationships = _relationships(archive, "xl/workbook.xml")
+        self.sheets: List[Tuple[str, str]] = []
+        self.epoch = _WINDOWS_EPOCH
+
+        with archive.open("xl/workbook.xml") as file:
+            for _, element in iterparse(file):
+                if element.tag == f"{_MAIN}workbookPr":
+                    if element.get("date1904") in ("1", "true"):
+                        self.epoch = _MAC_EPOCH
+                elif element.tag == f"{_MAIN}sheet":
+                    kind, path = self.relationships.get(
+                        element.get(f"{_REL}id"), (None, None)
+                    )
+                    if kind == _WORKSHEET_TYPE:
+                        self.sheets.append((element.get("name"), path))
+                elif element.tag.endswith("}workbook") and not element.tag.startswith(
+                    _MAIN
+                ):
+                    raise UnsupportedWorkbook(element.tag)
+
+        self.date_styles, self.timedelta_styles = self._date_styles()
+
+    def _part(self, relationship_type: str) -> Optional[str]:
+        for kind, path in self.relationships.values():
+            if kind == relationship_type and path in self.archive.NameToInfo:
+                return path
+        return None
+
+    def _date_styles(self) -> Tuple[Set[int], Set[int]]:
+        """Indexes of cell styles whose number format shows a date or duration."""
+        path = self._part(_STYLES_TYPE)
+        if path is None:
+            return set(), set()
+
+        custom: Dict[int, str] = {}
+        format_ids: List[int] = []
+        in_cell_xfs = False
+        with self.archive.open(path) as file:
+            for event, element in iterparse(file, events=("start", "end")):
+                if element.tag == f"{_MAIN}cellXfs":
+                    in_cell_xfs = event == "start"
+                    if not in_cell_xfs:
+                        break
+                elif event != "end":
+                    continue
+                elif element.tag == f"{_MAIN}numFmt":
+                    custom[int(element.get("numFmtId"))] = element.get("formatCode", "")
+                elif element.tag == f"{_MAIN}xf" and in_cell_xfs:
+                    format_ids.append(int(element.get("numFmtId", 0)))
+
+        dates, timedeltas = set(), set()
+        for index, format_id in enumerate(format_ids):
+            code = custom.get(format_id)
+            if code is not None:
+                if _TIMEDELTA_TOKENS.search(code):
+                    timedeltas.add(index)
+                elif _is_date_format(code):
+                    dates.add(index)
+            elif format_id in _BUILTIN_TIMEDELTA_FORMATS:
+                timedeltas.add(index)
+            elif format_id in _BUILTIN_DATE_FORMATS:
+                dates.add(index)
+        return dates, timedeltas
+
+    def shared_strings(self, needed: Set[int]) -> Dict[int, str]:
+        """Read only the shared strings at `needed` indexes."""
+        path = self._part(_SHARED_STRINGS_TYPE)
+        if path is None or not needed:
+            return {}
+
+        last = max(needed)
+        strings: Dict[int, str] = {}
+        index = 0
+        with self.archive.open(path) as file:
+            for _, element in iterparse(file):
+                if element.tag != f"{_MAIN}si":
+                    continue
+                if index in needed:
+                    strings[index] = _text(element)
+                element.clear()
+                if index >= last:
+                    break
+                index += 1
+        return strings
+
+    def rows(self, path: str, max_rows: int) -> Tuple[Optional[int], List[List[Cell]]]:
+        """Return the sheet's column count (if declared) and its first rows.
+
+        Missing rows are filled in as empty rows, the way openpyxl yields them.
+        """
+        max_column: Optional[int] = None
+        rows: List[List[Cell]] = []
+        with self.archive.open(path) as file:
+            row_number = 0
+            for _, element in iterparse(file):
+                tag = element.tag
+                if tag == f"{_MAIN}dimension":
+                    max_column = _dimension_columns(element.get("ref", ""))
+                elif tag == f"{_MAIN}row":
+                    number = int(element.get("r") or row_number + 1)
+                    while row_number + 1 < number and len(rows) < max_rows:
+                        rows.append([])
+                        row_number += 1
+                    if len(rows) >= max_rows:
+                        break
+                    rows.append(_row_cells(element))
+                    row_number = number
+                    element.clear()
+                    if len(rows) >= max_rows:
+                        break
+                elif tag == f"{_MAIN}sheetData":
+                    break
+        return max_column, rows
+
+    def value(self, cell: Cell, strings: Dict[int, str]):
+        kind, raw, style = cell
+        if raw is None:
+            return None
+        if kind == "s":
+            return strings.get(int(raw), "")
+        if kind in ("str", "inlineStr", "e"):
+            return raw
+        if kind == "b":
+            return bool(int(raw))
+        if kind == "d":
+            return datetime.datetime.fromisoformat(raw.rstrip("Z"))
+        value = _number(raw)
+        if style in self.timedelta_styles:
+            return _from_excel(value, self.epoch, timedelta=True)
+        if style in self.date_styles:
+            return _from_excel(value, self.epoch, timedelta=False)
+        return value
+
+
+def _text(element) -> str:
+    """Concatenated text of a shared or inline string, skipping phonetic runs."""
+    parts = []
+    for child in element:
+        if child.tag == f"{_MAIN}t":
+            parts.append(child.text or "")
+        elif child.tag == f"{_MAIN}r":
+            parts.extend(t.text or "" for t in child.iter(f"{_MAIN}t"))
+    return "".join(parts)
+
+
+def _dimension_columns(ref: str) -> Optional[int]:
+    end = ref.split(":")[-1]
+    match = _CELL_REFERENCE.fullmatch(end.replace("$", ""))
+    return _column_index(match.group(1)) if match else None
+
+
+def _row_cells(row) -> List[Cell]:
+    cells: List[Cell] = []
+    for cell in row.iter(f"{_MAIN}c"):
+        reference = cell.get("r")
+        column = len(cells) + 1
+        if reference:
+            match = _CELL_REFERENCE.match(reference)
+            if match:
+                column = _column_index(match.group(1))
+        while len(cells) < column - 1:
+            cells.append((None, None, 0))
+
+        kind = cell.get("t")
+        if kind == "inlineStr":
+            inline = cell.find(f"{_MAIN}is")
+            raw = _text(inline) if inline is not None else None
+        else:
+            value = cell.find(f"{_MAIN}v")
+            raw = value.text if value is not None else None
+        cells.append((kind, raw, int(cell.get("s", 0))))
+    return cells
+
+
+def preview_xlsx(
+    contents: bytes, max_sheets: int = 5, max_rows: int = 120
+) -> Iterator[Tuple[str, List[List[object]], bool]]:
+    """Yield (sheet title, first rows of values, truncated) per worksheet.
+
+    Reads the package directly: each sheet's XML is parsed incrementally and
+    abandoned at the row limit, and only the shared strings those rows use
+    are decoded. Raises UnsupportedWorkbook (or zip/XML errors) for files
+    that need openpyxl.
+    """
+    with zipfile.ZipFile(BytesIO(contents)) as archive:
+        if "xl/workbook.xml" not in archive.NameToInfo:
+            raise UnsupportedWorkbook("no xl/workbook.xml part")
+        workbook = _Workbook(archive)
+
+        sheets = []
+        needed: Set[int] = set()
+        for title, path in workbook.sheets[:max_sheets]:
+            max_column, rows = workbook.rows(path, max_rows + 1)
+            sheets.append((title, max_column, rows))
+            for row in rows[:max_rows]:
+                needed.update(int(raw) for kind, raw, _ in row if kind == "s" and raw)
+
+        strings = workbook.shared_strings(needed)
+        for title, max_column, rows in sheets:
+            values = []
+            for row in rows[:max_rows]:
+                row_values = [workbook.value(cell, strings) for cell in row]
+                if max_column is not None:
+                    row_values += [None] * (max_column - len(row_values))
+                values.append(row_values)
+            yield title, values, len(rows) > max_rows
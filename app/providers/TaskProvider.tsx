@@ -8,8 +8,12 @@ import {
   parseCoordinates,
   createCoordinateSnapshot,
   FollowUpContext,
+  StepSpeculation,
   checkStepCompletion,
+  chatId,
+  isStepSpeculationAvailable,
 } from "@/lib/ai";
+import { buildActionPrompt } from "@/lib/prompts";
 import {
   createContext,
   ReactNode,
@@ -95,6 +99,7 @@ export function TaskProvider({ children }: { children: ReactNode }) {
   const isCheckingStepRef = useRef(false);
   const pendingCheckImageRef = useRef<string | null>(null);
   const cancelPendingChecksRef = useRef(false);
+  const speculationSessionRef = useRef<string | undefined>(undefined);
   const checkVersionRef = useRef(0);
 
   const cancelPendingChecks = () => {
@@ -144,12 +149,16 @@ export function TaskProvider({ children }: { children: ReactNode }) {
           followUpMessage: pendingFollowUpRef.current,
         };
         pendingFollowUpRef.current = "";
+        speculationSessionRef.current = undefined;
 
         tasksRef.current = tasksRef.current.slice(0, -1);
         setTasks(tasksRef.current);
         setTotalTaskCount((prev) => Math.max(0, prev - 1));
       }
 
+      const speculationSession = speculationSessionRef.current;
+      speculationSessionRef.current = undefined;
+
       const action = await generateAction(
         goal,
         imageDataUrl,
@@ -157,7 +166,8 @@ export function TaskProvider({ children }: { children: ReactNode }) {
         tasksRef.current.map((item) => item.text),
         osName,
         followUpContext,
-        chatContext
+        chatContext,
+        speculationSession
       );
 
       lastScreenshotRef.current = imageDataUrl;
@@ -282,11 +292,28 @@ export function TaskProvider({ children }: { children: ReactNode }) {
         return;
       }
 
+      // Ask the server to start the next step from this frame if the check
+      // passes; the prompt must match what generateAction will build then.
+      // Skipped once the server has said it does not speculate.
+      const speculation: StepSpeculation | undefined =
+        isUsingLocalProvider || !isStepSpeculationAvailable()
+          ? undefined
+          : {
+              session: chatId,
+              system: buildActionPrompt(
+                goal,
+                getSystemInfo().os.osName,
+                tasksRef.current.map((item) => item.text),
+                chatContext
+              ),
+            };
+
       const isCompleted = await checkStepCompletion(
         taskDescription,
         lastScreenshotRef.current,
         scaledImage,
-        settings
+        settings,
+        speculation
       );
 
       if (currentVersion !== checkVersionRef.current) {
@@ -305,6 +332,7 @@ export function TaskProvider({ children }: { children: ReactNode }) {
           if (completedTask) {
             trackTaskCompleted(completedTask.text, tasksRef.current.length);
           }
+          speculationSessionRef.current = speculation?.session;
           setAutoCompleteTriggered((prev) => prev + 1);
         }
       } else if (pendingImage) {
@@ -0,0 +1,83 @@
+"""Decode time and peak allocation of a chat request body.
+
+Compares the msgspec fast path (`decode_body`) with a generic json.loads
+followed by Pydantic validation, which is what FastAPI did for
+`messages: List[Any]` bodies.
+
+    python bench/decode_body.py [--image-mb 1.5] [--iterations 50]
+"""
+
+import argparse
+import base64
+import json
+import os
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+
+from api.index import CheckRequest
+from api.utils.transport import decode_body
+
+
+def check_body(image_bytes: int) -> bytes:
+    image = "data:image/jpeg;base64," + base64.b64encode(
+        os.urandom(image_bytes)
+    ).decode("ascii")
+    return json.dumps(
+        {
+            "messages": [
+                {"role": "system", "content": "judge " * 200},
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": "Before:"},
+                        {"type": "image_url", "image_url": {"url": image}},
+                        {"type": "text", "text": "After:"},
+                        {"type": "image_url", "image_url": {"url": image}},
+                    ],
+                },
+            ],
+            "verdict": True,
+        }
+    ).encode("utf-8")
+
+
+def measure(decode, iterations: int):
+    decode()
+    started = time.perf_counter()
+    for _ in range(iterations):
+        decode()
+    elapsed = (time.perf_counter() - started) / iterations
+
+    tracemalloc.start()
+    decode()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return elapsed, peak
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--image-mb", type=float, default=1.5)
+    parser.add_argument("--iterations", type=int, default=50)
+    args = parser.parse_args()
+
+    body = check_body(int(args.image_mb * 1e6))
+    print(f"body: {len(body) / 1e6:.2f} MB, two screenshots")
+    paths = [
+        (
+            "json.loads + Pydantic",
+            lambda: CheckRequest.model_validate(json.loads(body)),
+        ),
+        ("msgspec fast path", lambda: decode_body(body, CheckRequest)),
+    ]
+    for name, decode in paths:
+        elapsed, peak = measure(decode, args.iterations)
+        print(f"{name:24} {elapsed * 1000:7.2f} ms   peak {peak / 1e6:7.2f} MB")
+
+
+if __name__ == "__main__":
+    main()
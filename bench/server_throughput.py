@@ -0,0 +1,151 @@
+"""Requests per second one node serves: a single process vs. preforked workers.
+
+Starts each server in turn on a local port and drives it with --clients load
+processes for --duration seconds:
+
+- single: `uvicorn api.index:app`, the previous Procfile entry
+- gunicorn: `gunicorn -c gunicorn.conf.py api.index:app`, with
+  WEB_CONCURRENCY workers (default: one per CPU)
+
+Two request kinds are measured. `metrics` is a cheap admin GET, showing
+framework overhead. `file-context` uploads a CSV to /api/file-context, whose
+parsing is CPU-bound and serialized by the GIL in a single process. Each
+request carries a random X-Forwarded-For address (trusted from 127.0.0.1) so
+the per-client rate limits do not cap the load. No provider is called.
+
+    python bench/server_throughput.py [--duration 10] [--concurrency 64]
+"""
+
+import argparse
+import asyncio
+import multiprocessing
+import os
+import random
+import signal
+import subprocess
+import sys
+import time
+from pathlib import Path
+
+import httpx
+
+ROOT = Path(__file__).resolve().parent.parent
+ADMIN_TOKEN = "bench"
+CSV = "\n".join(f"{row},customer-{row},{row * 0.37:.2f}" for row in range(4000))
+
+
+def _request(client: httpx.AsyncClient, base: str, kind: str):
+    headers = {
+        "x-forwarded-for": f"10.{random.randrange(256)}.{random.randrange(256)}."
+        f"{random.randrange(1, 255)}"
+    }
+    if kind == "metrics":
+        headers["authorization"] = f"Bearer {ADMIN_TOKEN}"
+        return client.get(f"{base}/api/metrics", headers=headers)
+    return client.post(
+        f"{base}/api/file-context",
+        headers=headers,
+        files={"files": ("rows.csv", CSV, "text/csv")},
+    )
+
+
+async def _drive(base: str, kind: str, concurrency: int, duration: float) -> int:
+    completed = 0
+    deadline = time.monotonic() + duration
+    limits = httpx.Limits(max_connections=concurrency)
+    async with httpx.AsyncClient(limits=limits, timeout=30) as client:
+
+        async def loop() -> None:
+            nonlocal completed
+            while time.monotonic() < deadline:
+                response = await _request(client, base, kind)
+                response.raise_for_status()
+                completed += 1
+
+        await asyncio.gather(*(loop() for _ in range(concurrency)))
+    return completed
+
+
+def _client(args) -> int:
+    return asyncio.run(_drive(*args))
+
+
+def _start(command, port: int, workers: int) -> subprocess.Popen:
+    env = {
+        **os.environ,
+        "PORT": str(port),
+        "WEB_CONCURRENCY": str(workers),
+        "ADMIN_TOKEN": ADMIN_TOKEN,
+    }
+    server = subprocess.Popen(
+        command,
+        cwd=ROOT,
+        env=env,
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL,
+        start_new_session=True,
+    )
+    deadline = time.monotonic() + 60
+    while time.monotonic() < deadline:
+        try:
+            httpx.get(f"http://127.0.0.1:{port}/api/metrics", timeout=1)
+            return server
+        except httpx.HTTPError:
+            time.sleep(0.2)
+    _stop(server)
+    raise RuntimeError(f"{command[0]} did not start")
+
+
+def _stop(server: subprocess.Popen) -> None:
+    os.killpg(server.pid, signal.SIGTERM)
+    try:
+        server.wait(30)
+    except subprocess.TimeoutExpired:
+        os.killpg(server.pid, signal.SIGKILL)
+        server.wait()
+
+
+def main() -> None:
+    cpus = len(os.sched_getaffinity(0)) if hasattr(os, "sched_getaffinity") else 1
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--duration", type=float, default=10)
+    parser.add_argument("--concurrency", type=int, default=64)
+    parser.add_argument("--clients", type=int, default=max(1, cpus // 2))
+    parser.add_argument("--workers", type=int, default=cpus)
+    parser.add_argument("--port", type=int, default=8765)
+    args = parser.parse_args()
+
+    bin_dir = Path(sys.executable).parent
+    servers = [
+        (
+            "single",
+            [str(bin_dir / "uvicorn"), "api.index:app", "--port", str(args.port)],
+            1,
+        ),
+        (
+            "gunicorn",
+            [str(bin_dir / "gunicorn"), "-c", "gunicorn.conf.py", "api.index:app"],
+            args.workers,
+        ),
+    ]
+    base = f"http://127.0.0.1:{args.port}"
+    per_client = max(1, args.concurrency // args.clients)
+    print(f"{cpus} CPUs, {args.clients} load processes x {per_client} connections")
+    for name, command, workers in servers:
+        server = _start(command, args.port, workers)
+        try:
+            for kind in ("metrics", "file-context"):
+                with multiprocessing.Pool(args.clients) as pool:
+                    counts = pool.map(
+                        _client,
+                        [(base, kind, per_client, args.duration)] * args.clients,
+                    )
+                label = f"{name} ({workers} proc)"
+                rate = sum(counts) / args.duration
+                print(f"{label:20} {kind:13} {rate:8.0f} req/s")
+        finally:
+            _stop(server)
+
+
+if __name__ == "__main__":
+    main()
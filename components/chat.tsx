@@ -114,8 +114,10 @@ export function Chat() {
   const handleFilesSelected = async (files: File[]) => {
     setIsAnalyzingFiles(true);
     try {
-      const analyzed = await analyzeContextFiles(files);
-      setUploadedFiles((prev) => [...prev, ...analyzed]);
+      // Each file joins the context as soon as its analysis is ready.
+      const analyzed = await analyzeContextFiles(files, {
+        onFile: (file) => setUploadedFiles((prev) => [...prev, file]),
+      });
       toast.success(
         `${analyzed.length} file${analyzed.length > 1 ? "s" : ""} analyzed and added to context.`
       );
@@ -0,0 +1,71 @@
+# Production server: gunicorn -c gunicorn.conf.py api.index:app
+import os
+
+from api.utils.pdf import start_pdf_pool
+from api.utils.server import MemoryWatchdog
+
+
+def _cpu_count() -> int:
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count() or 1
+
+
+def _default_workers() -> int:
+    # The in-memory rate limit store is per process, so several workers would
+    # each grant the full limits. Scale out only once the store is shared.
+    if os.environ.get("RATELIMIT_STORAGE_URI", "memory://").startswith("memory://"):
+        return 1
+    return _cpu_count()
+
+
+bind = f"0.0.0.0:{os.environ.get('PORT', '8000')}"
+workers = int(os.environ.get("WEB_CONCURRENCY") or _default_workers())
+worker_class = "api.utils.server.UvicornWorker"
+
+# Import the app once in the arbiter and fork it into every worker.
+preload_app = True
+
+# Streams run for tens of seconds; give them time to finish on recycle.
+timeout = int(os.environ.get("WORKER_TIMEOUT_SECONDS", "120"))
+graceful_timeout = int(os.environ.get("WORKER_GRACEFUL_TIMEOUT_SECONDS", "60"))
+keepalive = 5
+
+max_requests = int(os.environ.get("WORKER_MAX_REQUESTS", "0"))
+max_requests_jitter = max_requests // 10
+
+accesslog = "-"
+
+# Per-process limits (provider concurrency) read this to take their share of
+# the node-wide budget. Set before the preloaded app is imported.
+os.environ["SERVER_WORKERS"] = str(workers)
+
+
+def post_worker_init(worker):
+    # One PDF extraction pool per worker, for the worker's lifetime.
+    start_pdf_pool()
+    max_growth_mb = int(os.environ.get("WORKER_MAX_RSS_GROWTH_MB", "512"))
+    if max_growth_mb > 0:
+        MemoryWatchdog(
+            max_growth=max_growth_mb << 20,
+            interval=int(os.environ.get("WORKER_RSS_CHECK_SECONDS", "15")),
+            log=worker.log,
+        ).start()
+
+
+def when_ready(server):
+    if workers > 1:
+        server.log.info(
+            "Step speculation is off with %d workers: a speculated step is only "
+            "claimable in the worker that started it",
+            workers,
+        )
+    storage = os.environ.get("RATELIMIT_STORAGE_URI", "memory://")
+    if workers > 1 and storage.startswith("memory://"):
+        server.log.warning(
+            "WEB_CONCURRENCY=%d with in-memory rate limits: clients may get up "
+            "to %dx the configured limits; set RATELIMIT_STORAGE_URI to share them",
+            workers,
+            workers,
+        )
@@ -11,9 +11,32 @@ export const aiApiUrl =
 
 export const chatId = crypto.randomUUID();
 
+function randomHex(bytes: number): string {
+  return Array.from(crypto.getRandomValues(new Uint8Array(bytes)), (byte) =>
+    byte.toString(16).padStart(2, "0")
+  ).join("");
+}
+
+// W3C trace context for one backend call, so server traces start in the
+// browser. The sampled flag is left unset: the server applies its own rate.
+// Sent same-origin only, since on a cross-origin API the custom header would
+// force a CORS preflight on every multipart POST.
+export function traceHeaders(): Record<string, string> {
+  if (new URL(aiApiUrl, window.location.href).origin !== window.location.origin) {
+    return {};
+  }
+  return { traceparent: `00-${randomHex(16)}-${randomHex(8)}-00` };
+}
+
+export interface StreamEvent {
+  type: string;
+  data?: unknown;
+}
+
 export async function readStream(
   reader: ReadableStreamDefaultReader<Uint8Array>,
-  onStream?: (message: string) => void
+  onStream?: (message: string) => void,
+  onEvent?: (event: StreamEvent) => void
 ): Promise<string> {
   const decoder = new TextDecoder();
   let result = "";
@@ -34,14 +57,20 @@ export async function readStream(
 
         if (trimmedLine.startsWith("data: ")) {
           const dataContent = trimmedLine.slice(6);
+          let parsed;
           try {
-            const parsed = JSON.parse(dataContent);
-            if (parsed.type === "text-delta") {
-              result += parsed.delta;
-              onStream?.(result);
-            }
+            parsed = JSON.parse(dataContent);
           } catch (e) {
             console.error("Error parsing JSON:", e);
+            continue;
+          }
+          if (parsed.type === "text-delta") {
+            result += parsed.delta;
+            onStream?.(result);
+          } else if (parsed.type === "error") {
+            throw new Error(parsed.errorText || "Stream failed");
+          } else if (parsed.type?.startsWith("data-")) {
+            onEvent?.(parsed);
           }
         }
       }
@@ -51,14 +80,19 @@ export async function readStream(
       const trimmedLine = buffer.trim();
       if (trimmedLine.startsWith("data: ") && trimmedLine !== "data: [DONE]") {
         const dataContent = trimmedLine.slice(6);
+        let parsed;
         try {
-          const parsed = JSON.parse(dataContent);
-          if (parsed.type === "text-delta") {
-            result += parsed.delta;
-          }
+          parsed = JSON.parse(dataContent);
         } catch (e) {
           console.error("Error parsing JSON from buffer:", e);
         }
+        if (parsed?.type === "text-delta") {
+          result += parsed.delta;
+        } else if (parsed?.type === "error") {
+          throw new Error(parsed.errorText || "Stream failed");
+        } else if (parsed?.type?.startsWith("data-")) {
+          onEvent?.(parsed);
+        }
       }
     }
   } finally {
@@ -127,6 +161,25 @@ async function readOpenAIStream(
   return result;
 }
 
+// Lets /api/check start the next /api/step call as soon as it passes. `system`
+// must be the prompt generateAction will send for that step.
+export interface StepSpeculation {
+  session: string;
+  system: string;
+}
+
+// Whether the backend speculates steps (it does not with several server
+// workers). Assumed until a check response says otherwise.
+let stepSpeculation = true;
+
+export function isStepSpeculationAvailable(): boolean {
+  return stepSpeculation;
+}
+
+function noteStepSpeculation(state: string | null | undefined) {
+  if (state) stepSpeculation = state === "on";
+}
+
 export interface FollowUpContext {
   previousImage: string;
   previousInstruction: string;
@@ -138,25 +191,71 @@ type MessageContent =
   | Array<{ type: string; text?: string; image_url?: { url: string } }>;
 type Message = { role: string; content: MessageContent };
 
+// Endpoints that accept screenshots as raw multipart parts instead of base64.
+const MULTIPART_ENDPOINTS = new Set(["step", "check", "coordinates"]);
+
+async function buildMultipartBody(
+  messages: Message[],
+  options?: Record<string, unknown>
+): Promise<FormData> {
+  const formData = new FormData();
+  let imageCount = 0;
+
+  const payloadMessages = await Promise.all(
+    messages.map(async (message) => {
+      if (typeof message.content === "string") return message;
+
+      const content = await Promise.all(
+        message.content.map(async (part) => {
+          const url = part.image_url?.url;
+          if (part.type !== "image_url" || !url?.startsWith("data:")) {
+            return part;
+          }
+          const id = `image-${imageCount++}`;
+          const blob = await (await fetch(url)).blob();
+          formData.append(id, blob, id);
+          return { type: "image", id };
+        })
+      );
+      return { ...message, content };
+    })
+  );
+
+  formData.append(
+    "payload",
+    JSON.stringify({ messages: payloadMessages, ...options })
+  );
+  return formData;
+}
+
 async function sendToBackend(
   endpoint: string,
   messages: Message[],
-  onStream?: (message: string) => void
+  onStream?: (message: string) => void,
+  options?: Record<string, unknown>,
+  onEvent?: (event: StreamEvent) => void
 ): Promise<string> {
-  const response = await fetch(`${aiApiUrl}/${endpoint}`, {
-    method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ messages }),
-  });
+  const response = MULTIPART_ENDPOINTS.has(endpoint)
+    ? await fetch(`${aiApiUrl}/${endpoint}`, {
+        method: "POST",
+        headers: traceHeaders(),
+        body: await buildMultipartBody(messages, options),
+      })
+    : await fetch(`${aiApiUrl}/${endpoint}`, {
+        method: "POST",
+        headers: { "Content-Type": "application/json", ...traceHeaders() },
+        body: JSON.stringify({ messages, ...options }),
+      });
 
   if (!response.ok) {
     throw new Error(`Backend request failed: ${response.status}`);
   }
+  noteStepSpeculation(response.headers.get("X-Step-Speculation"));
 
   const reader = response.body?.getReader();
   if (!reader) return "";
 
-  return readStream(reader, onStream);
+  return readStream(reader, onStream, onEvent);
 }
 
 async function sendDirectToApi(
@@ -191,6 +290,147 @@ async function sendDirectToApi(
   return readOpenAIStream(reader, onStream);
 }
 
+// Thrown when the check socket cannot be used at all, so the caller can fall
+// back to POST /api/check. Errors reported by the server are not retried.
+class CheckSocketUnavailable extends Error {}
+
+// How long to stay on HTTP after the socket failed to open (e.g. a host that
+// does not proxy WebSockets).
+const CHECK_SOCKET_RETRY_MS = 60_000;
+
+// The screen-check loop over /api/check/ws: the prompt and the before frame
+// are sent once per step, then only the after frame travels per check.
+class CheckSocket {
+  private socket: WebSocket | null = null;
+  private opening: Promise<WebSocket> | null = null;
+  private session: string | null = null;
+  private step: { system: string; frame: string } | null = null;
+  private queue: Promise<unknown> = Promise.resolve();
+  private retryAt = 0;
+
+  check(
+    system: string,
+    before: string,
+    after: string,
+    speculation?: StepSpeculation,
+    onEvent?: (event: StreamEvent) => void
+  ): Promise<string> {
+    // One check at a time: answers on a socket are not tagged.
+    const result = this.queue.then(async () =>
+      this.send(await this.connect(), system, before, after, speculation, onEvent)
+    );
+    this.queue = result.catch(() => undefined);
+    return result;
+  }
+
+  private url(): string {
+    const url = new URL(`${aiApiUrl}/check/ws`, window.location.href);
+    url.protocol = url.protocol === "https:" ? "wss:" : "ws:";
+    // Reconnecting to the same session keeps the server's copy of the step.
+    if (this.session) url.searchParams.set("session", this.session);
+    return url.toString();
+  }
+
+  private connect(): Promise<WebSocket> {
+    if (this.socket?.readyState === WebSocket.OPEN) {
+      return Promise.resolve(this.socket);
+    }
+    if (Date.now() < this.retryAt || typeof WebSocket === "undefined") {
+      return Promise.reject(new CheckSocketUnavailable("Check socket is off"));
+    }
+    if (!this.opening) {
+      this.opening = new Promise<WebSocket>((resolve, reject) => {
+        const socket = new WebSocket(this.url());
+        const fail = () => {
+          this.opening = null;
+          this.retryAt = Date.now() + CHECK_SOCKET_RETRY_MS;
+          reject(new CheckSocketUnavailable("Check socket failed to open"));
+        };
+        socket.onerror = fail;
+        socket.onclose = fail;
+        socket.onmessage = (event) => {
+          const message = JSON.parse(event.data);
+          if (message.type !== "session") return;
+          this.session = message.id;
+          noteStepSpeculation(message.speculation);
+          this.socket = socket;
+          this.step = null;
+          this.opening = null;
+          socket.onerror = null;
+          socket.onmessage = null;
+          socket.onclose = () => {
+            if (this.socket === socket) this.socket = null;
+          };
+          resolve(socket);
+        };
+      });
+    }
+    return this.opening;
+  }
+
+  private send(
+    socket: WebSocket,
+    system: string,
+    before: string,
+    after: string,
+    speculation?: StepSpeculation,
+    onEvent?: (event: StreamEvent) => void
+  ): Promise<string> {
+    return new Promise((resolve, reject) => {
+      let result = "";
+      const finish = (error?: Error) => {
+        socket.removeEventListener("message", onMessage);
+        socket.removeEventListener("close", onClose);
+        if (!error) {
+          resolve(result);
+          return;
+        }
+        // A failed check may still have frames in flight; start the next one
+        // on a fresh socket rather than read them as its answer.
+        socket.close();
+        reject(error);
+      };
+      const onMessage = (event: MessageEvent) => {
+        let parsed;
+        try {
+          parsed = JSON.parse(event.data);
+        } catch (e) {
+          console.error("Error parsing check socket message:", e);
+          return;
+        }
+        if (parsed.type === "text-delta") {
+          result += parsed.delta;
+        } else if (parsed.type?.startsWith("data-")) {
+          onEvent?.(parsed);
+        } else if (parsed.type === "error") {
+          finish(new Error(parsed.errorText || "Check failed"));
+        } else if (parsed.type === "done") {
+          finish();
+        }
+      };
+      const onClose = () =>
+        finish(new CheckSocketUnavailable("Check socket closed"));
+      socket.addEventListener("message", onMessage);
+      socket.addEventListener("close", onClose);
+
+      if (this.step?.system !== system || this.step.frame !== before) {
+        socket.send(JSON.stringify({ type: "step", system, frame: before }));
+        this.step = { system, frame: before };
+      }
+      socket.send(
+        JSON.stringify({
+          type: "check",
+          frame: after,
+          verdict: true,
+          ...(speculation ? { speculate: speculation } : {}),
+        })
+      );
+    });
+  }
+}
+
+const checkSocket = new CheckSocket();
+
 const shouldUseDirectApi = (settings: ApiSettings): boolean => {
   return Boolean(settings.provider && settings.model);
 };
@@ -202,7 +442,8 @@ export async function generateAction(
   completedSteps?: string[],
   osName?: string,
   followUpContext?: FollowUpContext,
-  chatContext?: string
+  chatContext?: string,
+  speculationSession?: string
 ) {
   const maxRetries = 3;
   let lastError: unknown;
@@ -245,7 +486,15 @@ export async function generateAction(
       if (shouldUseDirectApi(settings)) {
         return await sendDirectToApi(messages, settings);
       } else {
-        return await sendToBackend("step", messages);
+        // Only the first attempt may claim a speculated step.
+        return await sendToBackend(
+          "step",
+          messages,
+          undefined,
+          speculationSession && attempt === 0
+            ? { session: speculationSession }
+            : undefined
+        );
       }
     } catch (e) {
       lastError = e;
@@ -303,7 +552,8 @@ export async function checkStepCompletion(
   currentInstruction: string,
   lastBase64Image: string,
   currentBase64Image: string,
-  settings: ApiSettings
+  settings: ApiSettings,
+  speculation?: StepSpeculation
 ): Promise<boolean> {
   try {
     const systemPrompt = buildCheckPrompt(currentInstruction);
@@ -322,16 +572,47 @@ export async function checkStepCompletion(
     ];
 
     let text: string;
+    // The server's data-verdict is authoritative (it also decides whether
+    // the next step was speculated); text matching is the fallback for
+    // direct API calls and older backends.
+    let verdict: boolean | undefined;
+    const onEvent = (event: StreamEvent) => {
+      const data = event.data as { completed?: unknown } | undefined;
+      if (event.type === "data-verdict" && typeof data?.completed === "boolean") {
+        verdict = data.completed;
+      }
+    };
     if (shouldUseDirectApi(settings)) {
       text = await sendDirectToApi(messages, settings);
     } else {
-      text = await sendToBackend("check", messages);
+      try {
+        text = await checkSocket.check(
+          systemPrompt,
+          lastBase64Image,
+          currentBase64Image,
+          speculation,
+          onEvent
+        );
+      } catch (e) {
+        if (!(e instanceof CheckSocketUnavailable)) throw e;
+        text = await sendToBackend(
+          "check",
+          messages,
+          undefined,
+          {
+            verdict: true,
+            ...(speculation ? { speculate: speculation } : {}),
+          },
+          onEvent
+        );
+      }
     }
 
     const cleanText = text.replace(/```json\n|\n```/g, "").trim();
 
     console.log(cleanText);
 
+    if (verdict !== undefined) return verdict;
     return cleanText.toLowerCase().includes("yes");
   } catch (e) {
     console.error("Error checking step completion:", e);
@@ -1,6 +1,6 @@
 "use client";
 
-import { aiApiUrl } from "./ai";
+import { aiApiUrl, traceHeaders } from "./ai";
 
 export interface AnalyzedContextFile {
   id: string;
@@ -10,19 +10,98 @@ export interface AnalyzedContextFile {
   analysis: string;
 }
 
+interface AnalyzedFilePayload {
+  name: string;
+  size: number;
+  mime_type: string;
+  analysis: string;
+}
+
 interface AnalyzeFilesResponse {
-  files: Array<{
-    name: string;
-    size: number;
-    mime_type: string;
-    analysis: string;
-  }>;
+  files: AnalyzedFilePayload[];
+}
+
+export interface AnalyzeFilesProgress {
+  completed: number;
+  total: number;
+  elapsedMs: number;
+}
+
+export interface AnalyzeFilesOptions {
+  // Called as each file finishes, with its position in the input list.
+  onFile?: (file: AnalyzedContextFile, index: number) => void;
+  onProgress?: (progress: AnalyzeFilesProgress) => void;
 }
 
 export const MAX_CONTEXT_FILE_SIZE_BYTES = 30 * 1024 * 1024;
 
+function toAnalyzedContextFile(file: AnalyzedFilePayload): AnalyzedContextFile {
+  return {
+    id: crypto.randomUUID(),
+    name: file.name,
+    size: file.size,
+    mimeType: file.mime_type,
+    analysis: file.analysis,
+  };
+}
+
+async function readFileContextStream(
+  reader: ReadableStreamDefaultReader<Uint8Array>,
+  total: number,
+  options: AnalyzeFilesOptions
+): Promise<AnalyzedContextFile[]> {
+  const decoder = new TextDecoder();
+  const results: Array<AnalyzedContextFile | undefined> = new Array(total);
+  let buffer = "";
+
+  const handleLine = (line: string) => {
+    const trimmedLine = line.trim();
+    if (!trimmedLine.startsWith("data: ") || trimmedLine === "data: [DONE]") {
+      return;
+    }
+
+    try {
+      const parsed = JSON.parse(trimmedLine.slice(6));
+      if (parsed.type === "file") {
+        const file = toAnalyzedContextFile(parsed.file);
+        results[parsed.index] = file;
+        options.onFile?.(file, parsed.index);
+      } else if (parsed.type === "progress") {
+        options.onProgress?.({
+          completed: parsed.completed,
+          total: parsed.total,
+          elapsedMs: parsed.elapsedMs,
+        });
+      }
+    } catch (e) {
+      console.error("Error parsing file analysis event:", e);
+    }
+  };
+
+  try {
+    while (true) {
+      const { done, value } = await reader.read();
+      if (done) break;
+
+      buffer += decoder.decode(value, { stream: true });
+      const lines = buffer.split("\n");
+      buffer = lines.pop() || "";
+      lines.forEach(handleLine);
+    }
+
+    if (buffer.trim()) {
+      handleLine(buffer);
+    }
+  } finally {
+    reader.releaseLock();
+  }
+
+  return results.filter((file): file is AnalyzedContextFile => !!file);
+}
+
 export async function analyzeContextFiles(
-  files: File[]
+  files: File[],
+  options?: AnalyzeFilesOptions
 ): Promise<AnalyzedContextFile[]> {
   const oversized = files.find((file) => file.size > MAX_CONTEXT_FILE_SIZE_BYTES);
   if (oversized) {
@@ -34,24 +113,30 @@ export async function analyzeContextFiles(
     formData.append("files", file, file.name);
   });
 
-  const response = await fetch(`${aiApiUrl}/file-context`, {
-    method: "POST",
-    body: formData,
-  });
+  // Passing callbacks opts into per-file results as they complete.
+  const streaming = !!(options?.onFile || options?.onProgress);
+  const response = await fetch(
+    `${aiApiUrl}/file-context${streaming ? "?stream=1" : ""}`,
+    {
+      method: "POST",
+      headers: traceHeaders(),
+      body: formData,
+    }
+  );
 
   if (!response.ok) {
     throw new Error(`File analysis failed (${response.status}).`);
   }
 
+  if (streaming) {
+    const reader = response.body?.getReader();
+    if (!reader) return [];
+    return readFileContextStream(reader, files.length, options ?? {});
+  }
+
   const payload = (await response.json()) as AnalyzeFilesResponse;
 
-  return payload.files.map((file) => ({
-    id: crypto.randomUUID(),
-    name: file.name,
-    size: file.size,
-    mimeType: file.mime_type,
-    analysis: file.analysis,
-  }));
+  return payload.files.map(toAnalyzedContextFile);
 }
 
 export function buildContextFromFiles(files: AnalyzedContextFile[]): string {
@@ -0,0 +1,96 @@
+import asyncio
+import json
+from types import SimpleNamespace
+
+import pytest
+
+from api.index import _concurrency_limit_exceeded_handler
+from api.utils.concurrency import (
+    PRIORITY_BACKGROUND,
+    PRIORITY_INTERACTIVE,
+    AdaptiveLimiter,
+    ConcurrencyLimitExceeded,
+)
+
+
+async def settle():
+    # Releases are handed to the loop with call_soon_threadsafe.
+    for _ in range(3):
+        await asyncio.sleep(0)
+
+
+def test_waiters_are_granted_by_priority_then_arrival():
+    async def main():
+        limiter = AdaptiveLimiter("test", initial_limit=1, max_limit=1)
+        held = await limiter.acquire()
+        order = []
+
+        async def wait(name, priority):
+            permit = await limiter.acquire(priority)
+            order.append(name)
+            permit.release()
+
+        tasks = []
+        for name, priority in [
+            ("poll-1", PRIORITY_BACKGROUND),
+            ("step-1", PRIORITY_INTERACTIVE),
+            ("poll-2", PRIORITY_BACKGROUND),
+            ("step-2", PRIORITY_INTERACTIVE),
+        ]:
+            tasks.append(asyncio.create_task(wait(name, priority)))
+            await asyncio.sleep(0)
+
+        held.release()
+        await asyncio.gather(*tasks)
+        return order
+
+    assert asyncio.run(main()) == ["step-1", "step-2", "poll-1", "poll-2"]
+
+
+def test_queue_timeout_is_shed_with_503_and_retry_after():
+    async def main():
+        limiter = AdaptiveLimiter(
+            "openai:gpt-5-mini", initial_limit=1, queue_timeout=0.05
+        )
+        held = await limiter.acquire()
+        with pytest.raises(ConcurrencyLimitExceeded) as caught:
+            await limiter.acquire()
+        assert limiter.waiters == []
+        held.release()
+        await settle()
+        assert limiter.in_flight == 0
+        return await _concurrency_limit_exceeded_handler(None, caught.value)
+
+    response = asyncio.run(main())
+    assert response.status_code == 503
+    assert int(response.headers["Retry-After"]) >= 1
+    assert "retry in" in json.loads(response.body)["error"]
+
+
+def test_overload_backs_off_and_success_grows_only_when_saturated():
+    async def main():
+        limiter = AdaptiveLimiter("test", initial_limit=8, min_limit=1)
+
+        permit = await limiter.acquire()
+        permit.note_error(SimpleNamespace(status_code=429))
+        permit.release()
+        await settle()
+        assert limiter.limit == 4
+
+        # One call at a time never reaches the limit, so it stays put.
+        for _ in range(10):
+            (await limiter.acquire()).release()
+            await settle()
+        assert limiter.limit == 4
+
+        # Calls finishing with every slot taken grow it.
+        permits = [await limiter.acquire() for _ in range(4)]
+        permits[0].release()
+        await settle()
+        assert limiter.limit == pytest.approx(4.25)
+        for permit in permits[1:]:
+            permit.release()
+        await settle()
+        assert limiter.in_flight == 0
+
+    asyncio.run(main())
@@ -0,0 +1,126 @@
+import random
+from collections import deque
+from io import BytesIO
+
+import numpy as np
+from PIL import Image
+
+from api.utils.diff_crop import crop_changed_regions, tile_boxes
+from api.utils.images import ImageBlob
+
+
+def bfs_boxes(tiles):
+    rows, cols = tiles.shape
+    seen = np.zeros_like(tiles)
+    boxes = []
+    for y in range(rows):
+        for x in range(cols):
+            if not tiles[y, x] or seen[y, x]:
+                continue
+            seen[y, x] = True
+            queue = deque([(y, x)])
+            x0, y0, x1, y1 = x, y, x + 1, y + 1
+            while queue:
+                cy, cx = queue.popleft()
+                x0, y0 = min(x0, cx), min(y0, cy)
+                x1, y1 = max(x1, cx + 1), max(y1, cy + 1)
+                for ny in range(cy - 1, cy + 2):
+                    for nx in range(cx - 1, cx + 2):
+                        if (
+                            0 <= ny < rows
+                            and 0 <= nx < cols
+                            and tiles[ny, nx]
+                            and not seen[ny, nx]
+                        ):
+                            seen[ny, nx] = True
+                            queue.append((ny, nx))
+            boxes.append((x0, y0, x1, y1))
+    return boxes
+
+
+def test_tile_boxes_match_bfs_on_random_grids():
+    rng = random.Random(7)
+    for _ in range(300):
+        rows, cols = rng.randint(1, 24), rng.randint(1, 24)
+        density = rng.choice([0.05, 0.2, 0.45, 0.7])
+        tiles = np.array(
+            [[rng.random() < density for _ in range(cols)] for _ in range(rows)]
+        )
+        assert tile_boxes(tiles) == bfs_boxes(tiles), tiles.astype(int)
+
+
+def test_tile_boxes_follow_a_long_snake():
+    # A single group whose labels have to travel the whole grid.
+    tiles = np.zeros((9, 9), dtype=bool)
+    tiles[::2, :] = True
+    tiles[1::4, 8] = True
+    tiles[3::4, 0] = True
+    assert tile_boxes(tiles) == [(0, 0, 9, 9)]
+
+
+def image(size, boxes=(), colour=(255, 0, 0)):
+    picture = Image.new("RGB", size, "white")
+    for box in boxes:
+        picture.paste(colour, box)
+    buffer = BytesIO()
+    picture.save(buffer, format="PNG")
+    return {"type": "image", "image": ImageBlob(buffer.getvalue(), "image/png")}
+
+
+def check_messages(before, after):
+    return [
+        {"role": "system", "content": "Is the step done?"},
+        {
+            "role": "user",
+            "content": [
+                {"type": "text", "text": "Before:"},
+                before,
+                {"type": "text", "text": "After:"},
+                after,
+            ],
+        },
+    ]
+
+
+def test_changed_region_is_cropped_from_both_frames():
+    messages = check_messages(
+        image((320, 240)), image((320, 240), [(200, 40, 240, 60)])
+    )
+    cropped = crop_changed_regions(messages)
+
+    assert cropped[0] is messages[0]
+    content = cropped[1]["content"]
+    texts = [part["text"] for part in content if part["type"] == "text"]
+    assert texts == [
+        "Before (downscaled from 320x240):",
+        "After (downscaled from 320x240):",
+        # Tiles 6-7 x 1 (32px), padded by one tile on every side.
+        "Changed region 1 at x=160, y=0, 128x96px, before:",
+        "Changed region 1, after:",
+    ]
+    crops = [part for part in content if part["type"] == "image"][2:]
+    sizes = [Image.open(BytesIO(part["image"].data)).size for part in crops]
+    assert sizes == [(128, 96), (128, 96)]
+
+
+def test_identical_frames_say_nothing_changed():
+    frame = image((64, 64))
+    cropped = crop_changed_regions(check_messages(frame, frame))
+    assert cropped[1]["content"][-1]["text"] == (
+        "No pixels changed between the two screenshots."
+    )
+
+
+def test_mostly_changed_frames_are_left_alone():
+    messages = check_messages(image((128, 128)), image((128, 128), [(0, 0, 128, 96)]))
+    assert crop_changed_regions(messages) is messages
+
+
+def test_frames_of_different_sizes_are_left_alone():
+    messages = check_messages(image((128, 128)), image((160, 128)))
+    assert crop_changed_regions(messages) is messages
+
+
+def test_messages_without_a_frame_pair_are_left_alone():
+    messages = [{"role": "user", "content": [image((32, 32))]}]
+    assert crop_changed_regions(messages) is messages
@@ -0,0 +1,90 @@
+import pytest
+
+from api.utils.extract import CoordinateExtractor, StreamExtractor, VerdictExtractor
+
+
+def feed_all(extractor, deltas):
+    """Feed deltas in order; return (index of the delta that produced a result, result)."""
+    for index, delta in enumerate(deltas):
+        result = extractor.feed(delta)
+        if result is not None:
+            return index, result
+    return None, extractor.finish()
+
+
+def test_verdict_on_last_line_is_found_when_it_arrives():
+    # Shape asked for by lib/prompts/check.ts: short reasoning, then the
+    # decision alone on the last line.
+    deltas = ["The modal", " closed and the", " list is shown.", "\n", "Yes", "."]
+    seen = []
+    extractor = VerdictExtractor(on_verdict=seen.append)
+
+    index, result = feed_all(extractor, deltas)
+
+    assert index == len(deltas) - 1
+    assert result == {
+        "completed": True,
+        "reasoning": "The modal closed and the list is shown.",
+    }
+    assert seen == [True]
+
+
+def test_verdict_line_wins_over_yes_in_reasoning():
+    index, result = feed_all(VerdictExtractor(), ["Yes, the modal closed\n", "No"])
+
+    assert index is None
+    assert result["completed"] is False
+
+
+def test_bare_token_on_last_line_waits_for_the_line_to_finish():
+    deltas = ["Settings page open.", "\n", "No", " error shown, saved.", "\nYes"]
+
+    index, result = feed_all(VerdictExtractor(), deltas)
+
+    assert index is None
+    assert result == {
+        "completed": True,
+        "reasoning": "Settings page open.\nNo error shown, saved.",
+    }
+
+
+def test_reasoning_without_newline_is_not_a_verdict():
+    extractor = VerdictExtractor()
+
+    assert extractor.feed("No") is None
+    assert extractor.feed("thing changed on screen.") is None
+    assert extractor.feed("\nNo") is None
+    assert extractor.feed("!") == {
+        "completed": False,
+        "reasoning": "Nothing changed on screen.",
+    }
+
+
+def test_json_verdict():
+    index, result = feed_all(VerdictExtractor(), ['{"completed": ', "true}"])
+
+    assert index == 1
+    assert result["completed"] is True
+
+
+def test_point_followed_by_a_period():
+    extractor = CoordinateExtractor()
+
+    assert extractor.feed("Click at 512,384") is None
+    assert extractor.feed(".") is None
+    assert extractor.feed(" Done") == {"normalized": {"x": 512, "y": 384}}
+    assert CoordinateExtractor().feed("512,384.25 then") == {
+        "normalized": {"x": 512, "y": 384}
+    }
+
+    extractor = CoordinateExtractor()
+    assert extractor.feed("512,384.") is None
+    assert extractor.finish() == {"normalized": {"x": 512, "y": 384}}
+
+
+def test_extractor_without_scan_cannot_be_created():
+    class Incomplete(StreamExtractor):
+        pass
+
+    with pytest.raises(TypeError):
+        Incomplete()
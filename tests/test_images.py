@@ -0,0 +1,64 @@
+import base64
+from io import BytesIO
+
+from PIL import Image
+
+from api.utils.images import Base64Image, ImageBlob, last_image_size
+
+
+def encoded(size, format="PNG", **options):
+    buffer = BytesIO()
+    Image.effect_noise(size, 64).convert("RGB").save(buffer, format=format, **options)
+    return buffer.getvalue()
+
+
+def messages(*parts):
+    return [
+        {"role": "system", "content": "Find the button."},
+        {"role": "user", "content": list(parts)},
+    ]
+
+
+def data_url_part(data, mime_type):
+    url = f"data:{mime_type};base64,{base64.b64encode(data).decode('ascii')}"
+    return {"type": "image_url", "image_url": {"url": url}}
+
+
+def test_size_of_the_last_image_in_every_part_form():
+    png = encoded((640, 360))
+    jpeg = encoded((320, 200), "JPEG")
+    payload = memoryview(base64.b64encode(jpeg))
+
+    assert last_image_size(messages(data_url_part(png, "image/png"))) == (640, 360)
+    assert last_image_size(
+        messages(
+            data_url_part(png, "image/png"),
+            {"type": "image", "image": ImageBlob(jpeg, "image/jpeg")},
+        )
+    ) == (320, 200)
+    assert last_image_size(
+        messages({"type": "image", "image": Base64Image(payload, "image/jpeg")})
+    ) == (320, 200)
+
+
+def test_jpeg_frame_header_past_the_decoded_prefix():
+    # Two near-maximal metadata segments push the frame header past every
+    # prefix, so the whole image has to be decoded.
+    jpeg = encoded((300, 150), "JPEG", exif=b"Exif\x00\x00" + b"\x00" * 65000)
+    padding = b"\xff\xe2" + (65000 + 2).to_bytes(2, "big") + b"\x00" * 65000
+    jpeg = jpeg[:2] + padding + jpeg[2:]
+    assert jpeg.find(b"\xff\xc0") > 65536
+    parts = [
+        data_url_part(jpeg, "image/jpeg"),
+        {"type": "image", "image": ImageBlob(jpeg, "image/jpeg")},
+    ]
+    for part in parts:
+        assert last_image_size(messages(part)) == (300, 150)
+
+
+def test_images_that_cannot_be_sized():
+    assert last_image_size(messages({"type": "text", "text": "hi"})) is None
+    assert last_image_size(messages(data_url_part(b"GIF8", "image/gif"))) is None
+    assert (
+        last_image_size(messages(data_url_part(b"\xff\xd8" * 4, "image/jpeg"))) is None
+    )
@@ -0,0 +1,91 @@
+import base64
+import json
+import os
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import api.index as index
+from api.utils.memory import StreamedBodyClient
+from api.utils.server import rss_bytes
+
+CHUNKS = [
+    {"delta": {"role": "assistant", "content": "The dialog closed.\n"}},
+    {"delta": {"content": "Yes"}},
+    {"delta": {}, "finish_reason": "stop"},
+]
+
+
+def completion_stream(request: httpx.Request) -> httpx.Response:
+    # MockTransport has already read the one-shot body into request.content.
+    assert int(request.headers["content-length"]) == len(request.content)
+    lines = [
+        "data: "
+        + json.dumps(
+            {
+                "id": "stub",
+                "object": "chat.completion.chunk",
+                "created": 0,
+                "model": "stub",
+                "choices": [{"index": 0, "finish_reason": None, **chunk}],
+            }
+        )
+        for chunk in CHUNKS
+    ]
+    body = "\n\n".join(lines + ["data: [DONE]"]) + "\n\n"
+    return httpx.Response(
+        200, headers={"content-type": "text/event-stream"}, content=body
+    )
+
+
+@pytest.mark.skipif(rss_bytes() is None, reason="needs /proc")
+def test_rss_stays_flat_over_sequential_checks(monkeypatch):
+    monkeypatch.delenv("GEMINI_API_KEY", raising=False)
+    monkeypatch.setenv("OPENROUTER_API_KEY", "test")
+    monkeypatch.setattr(index.limiter, "enabled", False)
+    monkeypatch.setattr(
+        index,
+        "StreamedBodyClient",
+        lambda: StreamedBodyClient(transport=httpx.MockTransport(completion_stream)),
+    )
+
+    def frame() -> str:
+        return "data:image/jpeg;base64," + base64.b64encode(
+            os.urandom(256 * 1024)
+        ).decode("ascii")
+
+    client = TestClient(index.app)
+
+    def check() -> None:
+        response = client.post(
+            "/api/check",
+            json={
+                "messages": [
+                    {"role": "system", "content": "Did the dialog close?"},
+                    {
+                        "role": "user",
+                        "content": [
+                            {"type": "text", "text": "Before:"},
+                            {"type": "image_url", "image_url": {"url": frame()}},
+                            {"type": "text", "text": "After:"},
+                            {"type": "image_url", "image_url": {"url": frame()}},
+                        ],
+                    },
+                ],
+                "verdict": True,
+            },
+        )
+        assert response.status_code == 200
+        assert '"completed":true' in response.text
+
+    for _ in range(50):
+        check()
+    baseline = rss_bytes()
+
+    for _ in range(1000):
+        check()
+
+    # Each call carries ~700 KB of base64 screenshots; retaining any of it
+    # per call would add hundreds of MB.
+    assert rss_bytes() - baseline < 32 << 20
@@ -0,0 +1,54 @@
+import signal
+import time
+from io import BytesIO
+
+from pypdf import PdfWriter
+
+from api.utils import pdf
+
+
+def blank_pdf(pages):
+    writer = PdfWriter()
+    for _ in range(pages):
+        writer.add_blank_page(width=200, height=200)
+    out = BytesIO()
+    writer.write(out)
+    return out.getvalue()
+
+
+def test_page_limit_is_not_swallowed_by_except_exception():
+    # pypdf wraps much of its parsing in `except Exception`; the alarm must
+    # still get through.
+    def stubborn():
+        while True:
+            try:
+                time.sleep(0.01)
+            except Exception:
+                pass
+
+    previous = signal.signal(signal.SIGALRM, pdf._on_alarm)
+    try:
+        assert pdf._limited(0.05, stubborn) == (None, True)
+    finally:
+        signal.signal(signal.SIGALRM, previous)
+
+
+def test_pages_come_back_in_order_from_the_pool():
+    assert pdf.extract_pdf_pages(blank_pdf(3), max_pages=2) == [("", None)] * 2
+
+
+def test_pool_creation_failure_falls_back_in_thread(monkeypatch):
+    attempts = []
+
+    def broken_pool(*args, **kwargs):
+        attempts.append(args)
+        raise OSError(38, "Function not implemented")
+
+    monkeypatch.setattr(pdf, "Pool", broken_pool)
+    monkeypatch.setattr(pdf, "_pool", None)
+    monkeypatch.setattr(pdf, "_pool_failed", False)
+    monkeypatch.setenv("PDF_EXTRACT_WORKERS", "2")
+
+    assert pdf.extract_pdf_pages(blank_pdf(2)) == [("", None)] * 2
+    assert pdf.extract_pdf_pages(blank_pdf(1)) == [("", None)]
+    assert len(attempts) == 1
@@ -0,0 +1,41 @@
+import pytest
+
+from api.utils.retry import RetryBudget, RetryingStream
+
+
+class UpstreamError(Exception):
+    status_code = 500
+
+
+def test_open_raises_once_attempts_are_exhausted():
+    calls = []
+
+    def open_stream():
+        calls.append(1)
+        raise UpstreamError("provider said no")
+
+    stream = RetryingStream(
+        open_stream, "test", base_delay=0, budget=RetryBudget(max_tokens=10)
+    )
+
+    # Raised before any frame exists, so the endpoint can still answer 5xx.
+    with pytest.raises(UpstreamError):
+        stream.open()
+    assert len(calls) == 3
+
+
+def test_open_recovers_and_keeps_the_first_chunk():
+    attempts = iter([UpstreamError("busy"), ["a", "b"]])
+
+    def open_stream():
+        result = next(attempts)
+        if isinstance(result, Exception):
+            raise result
+        return result
+
+    stream = RetryingStream(
+        open_stream, "test", base_delay=0, budget=RetryBudget(max_tokens=10)
+    )
+    stream.open()
+
+    assert list(stream) == ["a", "b"]
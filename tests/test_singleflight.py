@@ -0,0 +1,49 @@
+import asyncio
+
+from api.utils.singleflight import Flight
+
+
+async def frames(count):
+    for index in range(count):
+        yield f"data: {index}\n\n"
+        await asyncio.sleep(0)
+
+
+def test_stalled_subscriber_does_not_hold_back_the_others():
+    async def run():
+        flight = Flight(queue_size=4)
+        fast = flight.subscribe()
+        stalled = flight.subscribe()
+        flight.start(frames(100), lambda: None)
+
+        # The stalled subscriber reads nothing until the stream has ended.
+        received = [frame async for frame in fast]
+        assert flight.done
+        return received, [frame async for frame in stalled]
+
+    received, caught_up = asyncio.run(run())
+
+    assert received == [f"data: {index}\n\n" for index in range(100)]
+    assert caught_up == received
+
+
+def test_upstream_is_cancelled_when_a_detached_reader_leaves():
+    async def endless():
+        index = 0
+        while True:
+            yield f"data: {index}\n\n"
+            index += 1
+            await asyncio.sleep(0)
+
+    async def run():
+        flight = Flight(queue_size=2)
+        subscription = flight.subscribe()
+        flight.start(endless(), lambda: None)
+        await asyncio.sleep(0.01)
+        assert not flight.subscribers
+        await subscription.__anext__()
+        await subscription.aclose()
+        await asyncio.sleep(0)
+        return flight.task.cancelled()
+
+    assert asyncio.run(run())
@@ -0,0 +1,37 @@
+import asyncio
+
+from api.utils.metrics import metrics
+from api.utils.speculation import SpeculativeSteps
+
+
+async def frames():
+    yield "data: step\n\n"
+    yield "data: [DONE]\n\n"
+
+
+async def open_frames():
+    return frames()
+
+
+def test_claim_replays_the_speculated_frames_and_records_hit_rate():
+    async def run():
+        steps = SpeculativeSteps(ttl=5)
+        steps.start("a", "system", open_frames)
+        steps.start("b", "system", open_frames)
+        frames = steps.claim("a", "system")
+        return [frame async for frame in frames], steps.claim("c", "system")
+
+    frames, missing = asyncio.run(run())
+
+    assert frames == ["data: step\n\n", "data: [DONE]\n\n"]
+    assert missing is None
+    assert metrics.snapshot()["gauges"]["speculative_step_hit_rate"] == 0.5
+
+
+def test_disabled_store_neither_starts_nor_claims():
+    async def run():
+        steps = SpeculativeSteps(ttl=5, enabled=False)
+        steps.start("a", "system", open_frames)
+        return len(steps.entries), steps.claim("a", "system")
+
+    assert asyncio.run(run()) == (0, None)
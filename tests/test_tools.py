@@ -0,0 +1,174 @@
+import asyncio
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from types import SimpleNamespace
+from urllib.parse import parse_qs, urlparse
+
+import anyio.to_thread
+import pytest
+
+from api.utils import tools
+from api.utils.stream import resolve_tool_calls, stream_text
+from api.utils.tool_runtime import ToolRuntime
+
+
+@pytest.fixture
+def open_meteo(monkeypatch):
+    """A local Open-Meteo stand-in.
+
+    Latitude 500 answers with a server error and latitude 9 answers after
+    `slow` seconds; every request's coordinates are recorded in `hits`.
+    """
+    hits = []
+    state = {"slow": 0.5}
+
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            query = parse_qs(urlparse(self.path).query)
+            latitude = float(query["latitude"][0])
+            hits.append((latitude, float(query["longitude"][0])))
+            if latitude == 500:
+                self.send_response(500)
+                self.end_headers()
+                return
+            if latitude == 9:
+                time.sleep(state["slow"])
+            body = json.dumps({"current": {"temperature_2m": latitude}}).encode()
+            self.send_response(200)
+            self.send_header("content-type", "application/json")
+            self.send_header("content-length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(
+        tools, "OPEN_METEO_URL", f"http://127.0.0.1:{server.server_port}"
+    )
+    yield hits, state
+    server.shutdown()
+    server.server_close()
+
+
+def weather(tool_call_id, latitude, longitude):
+    return (
+        tool_call_id,
+        "get_current_weather",
+        tools.get_current_weather,
+        {"latitude": latitude, "longitude": longitude},
+    )
+
+
+def run(runtime, calls):
+    async def collect():
+        return [result async for result in runtime.run(calls)]
+
+    return asyncio.run(collect())
+
+
+def test_calls_run_together_and_finish_in_completion_order(open_meteo):
+    hits, _ = open_meteo
+    runtime = ToolRuntime(timeout=5)
+
+    started = time.monotonic()
+    finished = [
+        (tool_call_id, ok)
+        for tool_call_id, ok, _ in run(
+            runtime,
+            [weather("slow", 9, 1), weather("a", 10, 1), weather("b", 11, 1)],
+        )
+    ]
+
+    assert finished[-1] == ("slow", True)
+    assert sorted(finished[:2]) == [("a", True), ("b", True)]
+    assert time.monotonic() - started < 1.0
+    assert len(hits) == 3
+
+
+def test_nearby_coordinates_share_a_cached_result(open_meteo):
+    hits, _ = open_meteo
+    runtime = ToolRuntime(timeout=5)
+
+    first = run(runtime, [weather("a", 51.5071, -0.1278)])
+    second = run(runtime, [weather("b", 51.5074, -0.1279)])
+
+    assert first[0][2] == second[0][2] == {"current": {"temperature_2m": 51.5071}}
+    assert hits == [(51.5071, -0.1278)]
+
+
+def test_failed_lookup_returns_none_and_is_not_cached(open_meteo):
+    hits, _ = open_meteo
+    runtime = ToolRuntime(timeout=5)
+
+    assert run(runtime, [weather("a", 500, 1)]) == [("a", True, None)]
+    assert run(runtime, [weather("b", 500, 1)]) == [("b", True, None)]
+    assert len(hits) == 2
+
+
+def test_slow_lookup_times_out_without_holding_back_the_others(open_meteo):
+    _, state = open_meteo
+    state["slow"] = 2
+    runtime = ToolRuntime(timeout=0.5)
+
+    results = run(runtime, [weather("slow", 9, 1), weather("a", 10, 1)])
+
+    assert [(tool_call_id, ok) for tool_call_id, ok, _ in results] == [
+        ("a", True),
+        ("slow", False),
+    ]
+    assert isinstance(results[1][2], TimeoutError)
+
+
+def tool_call_chunks(tool_call_id):
+    delta = SimpleNamespace(
+        content=None,
+        tool_calls=[
+            SimpleNamespace(
+                index=0,
+                id=tool_call_id,
+                function=SimpleNamespace(name="slow_tool", arguments="{}"),
+            )
+        ],
+    )
+    return [
+        SimpleNamespace(
+            choices=[SimpleNamespace(finish_reason="tool_calls", delta=delta)],
+            usage=None,
+        )
+    ]
+
+
+def test_slow_tool_holds_no_threadpool_worker():
+    borrowed = []
+
+    async def slow_tool():
+        await asyncio.sleep(0.3)
+        borrowed.append(
+            anyio.to_thread.current_default_thread_limiter().borrowed_tokens
+        )
+        return "done"
+
+    async def serve(tool_call_id):
+        frames = stream_text(tool_call_chunks(tool_call_id), {"slow_tool": slow_tool})
+        return [frame async for frame in resolve_tool_calls(frames)]
+
+    async def main():
+        # With a single worker thread, two streams waiting on tools at once
+        # would run one after the other.
+        anyio.to_thread.current_default_thread_limiter().total_tokens = 1
+        started = time.monotonic()
+        results = await asyncio.gather(serve("a"), serve("b"))
+        return results, time.monotonic() - started
+
+    results, elapsed = asyncio.run(main())
+
+    assert elapsed < 0.55
+    assert borrowed == [0, 0]
+    for frames in results:
+        assert any('"type":"tool-output-available"' in frame for frame in frames)
+        assert frames[-1] == "data: [DONE]\n\n"
@@ -0,0 +1,101 @@
+import base64
+import json
+
+import pytest
+from fastapi.exceptions import RequestValidationError
+
+from api.index import CheckRequest, MessagesRequest
+from api.utils.images import Base64Image, ImageBlob
+from api.utils.transport import decode_body
+
+PNG = base64.b64encode(b"\x89PNG\r\n\x1a\n" + bytes(range(256))).decode("ascii")
+
+
+def test_data_url_stays_a_view_into_the_body():
+    url = f"data:image/png;base64,{PNG}"
+    body = json.dumps(
+        {
+            "messages": [
+                {
+                    "role": "user",
+                    "content": [
+                        {"type": "text", "text": 'Line one\nsaid "hi" é'},
+                        {"type": "image_url", "image_url": {"url": url}},
+                    ],
+                }
+            ],
+            "verdict": True,
+        },
+        ensure_ascii=True,
+    ).encode()
+
+    request = decode_body(body, CheckRequest)
+
+    text, image = request.messages[0]["content"]
+    assert text == {"type": "text", "text": 'Line one\nsaid "hi" é'}
+    assert isinstance(image["image"], Base64Image)
+    assert image["image"].to_data_url() == url
+    assert request.verdict is True
+
+
+def test_escaped_data_url_is_unescaped():
+    url = f"data:image/png;base64,{PNG}"
+    # Escapes JSON encoders are allowed to emit inside the base64 text.
+    header, payload = json.dumps(url).split(",")
+    escaped = header + "," + payload.replace("/", "\\/").replace("+", "\\u002b")
+    body = f'{{"messages": [{{"role": "user", "content": [{{"type": "image_url", "image_url": {{"url": {escaped}}}}}]}}]}}'
+
+    image = decode_body(body.encode(), MessagesRequest).messages[0]["content"][0]
+
+    assert image["image"].to_data_url() == url
+    assert image["image"].to_bytes() == base64.b64decode(PNG)
+
+
+def test_unknown_fields_and_parts_pass_through():
+    messages = [
+        {
+            "role": "assistant",
+            "content": None,
+            "tool_calls": [{"id": "call-1", "type": "function"}],
+        },
+        {"role": "tool", "tool_call_id": "call-1", "content": "42"},
+        {
+            "role": "user",
+            "content": [
+                {"type": "input_audio", "input_audio": {"data": "", "format": "wav"}},
+                {"type": "text", "text": "hi", "cache_control": {"type": "ephemeral"}},
+                {
+                    "type": "image_url",
+                    "image_url": {"url": "https://example.com/a.png", "detail": "low"},
+                },
+            ],
+        },
+    ]
+
+    request = decode_body(json.dumps({"messages": messages}).encode(), MessagesRequest)
+
+    assert request.messages == messages
+
+
+def test_null_content_without_other_fields_passes_through():
+    messages = [
+        {"role": "user", "content": "hi"},
+        {"role": "assistant", "content": None},
+    ]
+
+    request = decode_body(json.dumps({"messages": messages}).encode(), MessagesRequest)
+
+    assert request.messages == messages
+
+
+def test_image_reference_needs_an_upload():
+    body = json.dumps(
+        {"messages": [{"role": "user", "content": [{"type": "image", "id": "a"}]}]}
+    ).encode()
+    image = ImageBlob(b"png", "image/png")
+
+    part = decode_body(body, MessagesRequest, {"a": image}).messages[0]["content"][0]
+
+    assert part == {"type": "image", "image": image}
+    with pytest.raises(RequestValidationError):
+        decode_body(body, MessagesRequest, {})
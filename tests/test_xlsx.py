@@ -0,0 +1,112 @@
+import datetime
+import re
+import zipfile
+from io import BytesIO
+
+from openpyxl import Workbook
+
+from api.index import _openpyxl_spreadsheet_lines, _spreadsheet_lines
+from api.utils.xlsx import preview_xlsx
+
+
+def with_shared_strings(contents):
+    """Move openpyxl's inline strings into a shared string table, as Excel does."""
+    strings = []
+
+    def share(match):
+        if match.group(2) not in strings:
+            strings.append(match.group(2))
+        return f'{match.group(1)} t="s"><v>{strings.index(match.group(2))}</v></c>'
+
+    inline = re.compile(
+        r'(<c r="[A-Z]+\d+"(?: s="\d+")?) t="inlineStr"><is><t>(.*?)</t></is></c>'
+    )
+    source = zipfile.ZipFile(BytesIO(contents))
+    parts = {name: source.read(name) for name in source.namelist()}
+    for name in parts:
+        if name.startswith("xl/worksheets/sheet"):
+            parts[name] = inline.sub(share, parts[name].decode()).encode()
+
+    main = "http://schemas.openxmlformats.org/spreadsheetml/2006/main"
+    items = "".join(f"<si><t>{text}</t></si>" for text in strings)
+    parts["xl/sharedStrings.xml"] = (
+        f'<sst xmlns="{main}" uniqueCount="{len(strings)}">{items}</sst>'
+    ).encode()
+    parts["[Content_Types].xml"] = parts["[Content_Types].xml"].replace(
+        b"</Types>",
+        b'<Override PartName="/xl/sharedStrings.xml" ContentType="application/'
+        b'vnd.openxmlformats-officedocument.spreadsheetml.sharedStrings+xml"/></Types>',
+    )
+    parts["xl/_rels/workbook.xml.rels"] = parts["xl/_rels/workbook.xml.rels"].replace(
+        b"</Relationships>",
+        b'<Relationship Id="rIdShared" Target="sharedStrings.xml" Type="http://'
+        b"schemas.openxmlformats.org/officeDocument/2006/relationships/"
+        b'sharedStrings"/></Relationships>',
+    )
+
+    buffer = BytesIO()
+    with zipfile.ZipFile(buffer, "w") as target:
+        for name, data in parts.items():
+            target.writestr(name, data)
+    return buffer.getvalue()
+
+
+def workbook_bytes():
+    workbook = Workbook()
+    sheet = workbook.active
+    sheet.title = "Orders"
+    sheet.append(["Order", "Placed", "Pickup", "Took", "Paid", "Total", "Note"])
+    for number in range(1, 151):
+        sheet.append(
+            [
+                number,
+                datetime.datetime(2024, 1, 1, 9, 30) + datetime.timedelta(days=number),
+                datetime.time(number % 24, number % 60, 15),
+                datetime.timedelta(hours=number % 30, minutes=number % 7),
+                number % 3 == 0,
+                number * 2.5,
+                f"order {number}" if number % 4 else None,
+            ]
+        )
+        if number % 10 == 0:
+            sheet.cell(row=number + 1, column=8, value=f"=A{number + 1}*2")
+    # Rows and columns left out entirely.
+    sheet.cell(row=12, column=2).value = None
+    sheet.delete_rows(20, 3)
+    sheet["J5"] = "far right"
+    sheet["C8"].number_format = "[h]:mm:ss"
+    sheet["D9"] = 1.75
+    sheet["D9"].number_format = "[mm]:ss"
+    sheet["B10"] = datetime.date(1900, 2, 28)
+
+    sparse = workbook.create_sheet("Sparse")
+    sparse["B3"] = "only"
+    sparse["E7"] = True
+    sparse["A9"] = 0.5
+    sparse["A9"].number_format = "hh:mm"
+    sparse["C9"] = "shared"
+    sparse["C10"] = "shared"
+
+    workbook.create_sheet("Empty")
+
+    buffer = BytesIO()
+    workbook.save(buffer)
+    return buffer.getvalue()
+
+
+def test_fast_path_matches_openpyxl():
+    contents = workbook_bytes()
+    fast = _spreadsheet_lines(preview_xlsx(contents))
+
+    assert fast == _openpyxl_spreadsheet_lines(contents)
+    assert "...[truncated]" in fast
+    assert "Sheet: Sparse" in fast
+
+
+def test_fast_path_matches_openpyxl_with_shared_strings():
+    contents = with_shared_strings(workbook_bytes())
+    assert b"sharedStrings" in contents
+    fast = _spreadsheet_lines(preview_xlsx(contents))
+
+    assert fast == _openpyxl_spreadsheet_lines(contents)
+    assert " |  | shared |  | " in fast